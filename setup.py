@@ -54,6 +54,6 @@ setup(
     ],
 
     long_description=read('README.rst'),
-    install_requires=['mmh3'],
+    install_requires=['mmh3', 'numpy'],
 #    cmdclass = {'test': PyTest},
 )
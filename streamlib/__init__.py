@@ -3,8 +3,8 @@ __version__ = "1.0.1"
 
 
 from streamlib.hashes import MurmurHash
-from streamlib.summary import CountMin, CountMedian, CountSketch, F2, MG, DistinctElement, BJKST
+from streamlib.summary import CountMin, CountMedian, CountSketch, F2, MG, DistinctElement, BJKST, HyperLogLog, KMV, ThetaSketch, PCSA, GroupedDistinct, SlidingHyperLogLog, Quantile, DDSketch, KLL, TDigest, GK, Reservoir, WeightedReservoir, PrioritySample, BloomFilter, CountingBloomFilter, CuckooFilter, ScalableBloomFilter, SharedCountMin, SharedCountSketch, SharedHyperLogLog
 
 
 
-__all__ = ('MurmurHash', 'CountMin', 'CountMedian', 'CountSketch', 'F2', 'MG', "DistinctElement","BJKST")
+__all__ = ('MurmurHash', 'CountMin', 'CountMedian', 'CountSketch', 'F2', 'MG', "DistinctElement","BJKST", "HyperLogLog", "KMV", "ThetaSketch", "PCSA", "GroupedDistinct", "SlidingHyperLogLog", "Quantile", "DDSketch", "KLL", "TDigest", "GK", "Reservoir", "WeightedReservoir", "PrioritySample", "BloomFilter", "CountingBloomFilter", "CuckooFilter", "ScalableBloomFilter", "SharedCountMin", "SharedCountSketch", "SharedHyperLogLog")
@@ -0,0 +1,189 @@
+"""
+Random data streams, for benchmarking and testing the summaries.
+Streams are generated as numpy arrays, chunk by chunk, e.g.
+
+    for chunk in zipfStream(10 ** 6, s=1.1, count=10 ** 8):
+        sketch.processBatch(chunk)
+"""
+
+import numpy as np
+
+
+class AliasSampler(object):
+    """
+    Weighted sampler with the alias method.
+    draw keys with probability proportional to their weights in O(1)
+    time each, after an O(n) setup.
+    """
+    def __init__(self, weights, keys=None, seed=None):
+        """
+        Create a new instance.
+
+        :param weights: non-negative weights, not all zero
+        :param keys: keys to be drawn, parallel to weights. the
+                     indexes of the weights are drawn by default
+        :param seed: seed of the random number generator
+        :type seed: int
+        """
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.ndim != 1 or len(weights) == 0:
+            raise ValueError('weights should be a non-empty sequence')
+        if (weights < 0).any() or weights.sum() <= 0:
+            raise ValueError('weights should be >= 0 and not all zero')
+        if keys is not None and len(keys) != len(weights):
+            raise ValueError('keys and weights should have the same length')
+
+        n = len(weights)
+        self._keys = None if keys is None else np.asarray(keys)
+        self._random = np.random.RandomState(seed)
+
+        # Vose's construction: each column is split between its own
+        # index, with probability prob, and the index alias
+        prob = (weights * (n / weights.sum())).tolist()
+        alias = range(n)
+        small = [i for i in xrange(n) if prob[i] < 1]
+        large = [i for i in xrange(n) if prob[i] >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            alias[less] = more
+            prob[more] += prob[less] - 1
+            if prob[more] < 1:
+                small.append(more)
+            else:
+                large.append(more)
+        # what is left is 1 up to rounding errors
+        for i in small + large:
+            prob[i] = 1.
+        self._prob = np.array(prob)
+        self._alias = np.array(alias, dtype=np.intp)
+
+
+    def sample(self, size=None):
+        """
+        Draw keys independently.
+
+        :param size: number of keys to be drawn
+        :type size: int
+
+        :return: one key if size is None, otherwise a numpy array
+                 of keys
+        """
+        if size is None:
+            return self.sample(1)[0]
+        # one uniform number gives both the column, its integer part,
+        # and the choice within the column, its fractional part
+        u = self._random.random_sample(size)
+        u *= len(self._prob)
+        indexes = u.astype(np.intp)
+        u -= indexes
+        indexes = np.where(u < self._prob[indexes], indexes,
+                           self._alias[indexes])
+        return indexes if self._keys is None else self._keys[indexes]
+
+
+    def stream(self, count=None, chunkSize=1 << 16):
+        """
+        Generate a stream of keys drawn independently.
+
+        :param count: number of keys, endless by default
+        :type count: int
+
+        :param chunkSize: number of keys in each chunk
+        :type chunkSize: int
+
+        :return: iterator over numpy arrays of keys
+        """
+        for size in _sizes(count, chunkSize):
+            yield self.sample(size)
+
+
+def zipfStream(n, s=1., count=None, chunkSize=1 << 16, seed=None):
+    """
+    Generate a stream of keys 0, 1, ..., n - 1, where key i is drawn
+    with probability proportional to 1 / (i + 1)^s.
+
+    :param n: number of distinct keys
+    :type n: int
+
+    :param s: skew, the larger the more frequent the first keys
+    :type s: float
+
+    :param count: number of keys, endless by default
+    :type count: int
+
+    :param chunkSize: number of keys in each chunk
+    :type chunkSize: int
+
+    :param seed: seed of the random number generator
+    :type seed: int
+
+    :return: iterator over numpy arrays of keys
+    """
+    weights = np.arange(1, n + 1, dtype=np.float64) ** -s
+    return AliasSampler(weights, seed=seed).stream(count, chunkSize)
+
+
+def uniformStream(n, count=None, chunkSize=1 << 16, seed=None):
+    """
+    Generate a stream of keys drawn uniformly from 0, 1, ..., n - 1.
+
+    :param n: number of distinct keys
+    :type n: int
+
+    :param count: number of keys, endless by default
+    :type count: int
+
+    :param chunkSize: number of keys in each chunk
+    :type chunkSize: int
+
+    :param seed: seed of the random number generator
+    :type seed: int
+
+    :return: iterator over numpy arrays of keys
+    """
+    random = np.random.RandomState(seed)
+    for size in _sizes(count, chunkSize):
+        yield random.randint(0, n, size)
+
+
+def paretoStream(alpha=1.2, scale=1., count=None, chunkSize=1 << 16,
+                 seed=None):
+    """
+    Generate a heavy-tailed stream of numbers, drawn from the Pareto
+    distribution with P(x > t) = (scale / t)^alpha for t >= scale,
+    e.g. latencies or flow sizes.
+
+    :param alpha: tail index, the variance is infinite for alpha <= 2
+    :type alpha: float
+
+    :param scale: smallest possible number
+    :type scale: float
+
+    :param count: number of numbers, endless by default
+    :type count: int
+
+    :param chunkSize: number of numbers in each chunk
+    :type chunkSize: int
+
+    :param seed: seed of the random number generator
+    :type seed: int
+
+    :return: iterator over numpy arrays of numbers
+    """
+    random = np.random.RandomState(seed)
+    for size in _sizes(count, chunkSize):
+        yield scale * (random.pareto(alpha, size) + 1.)
+
+
+def _sizes(count, chunkSize):
+    """
+    Sizes of the chunks of a stream of count items, endless if
+    count is None.
+    """
+    if chunkSize < 1:
+        raise ValueError('chunkSize should >= 1')
+    while count is None or count > 0:
+        size = chunkSize if count is None else min(chunkSize, count)
+        if count is not None:
+            count -= size
+        yield size
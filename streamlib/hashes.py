@@ -3,8 +3,82 @@ Interface and implementation for hash functions.
 """
 
 from abc import ABCMeta, abstractmethod
+import numbers
 import mmh3
 import random
+import numpy as np
+
+# mask to keep python integers within 64 bits
+_MASK64 = (1 << 64) - 1
+# constants of the 64-bit finalizer of MurmurHash3
+_C1 = 0xff51afd7ed558ccd
+_C2 = 0xc4ceb9fe1a85ec53
+# seeds spread over 64 bits, by seed and half, see MurmurHash._seed64
+_SEEDS64 = {}
+
+
+def _fmix64(k):
+    """
+    64-bit finalizer of MurmurHash3 on a python integer.
+    """
+    k ^= k >> 33
+    k = (k * _C1) & _MASK64
+    k ^= k >> 33
+    k = (k * _C2) & _MASK64
+    k ^= k >> 33
+    return k
+
+
+def _fmix64Batch(k):
+    """
+    Vectorized version of `_fmix64`, works in place on an
+    uint64 numpy array.
+    """
+    s = np.uint64(33)
+    k ^= k >> s
+    k *= np.uint64(_C1)
+    k ^= k >> s
+    k *= np.uint64(_C2)
+    k ^= k >> s
+    return k
+
+
+def _toUint64(key):
+    """
+    Map a hashable key to an integer in [0, 2^64). Integers are
+    used as they are, any other key goes through `__hash__`.
+    """
+    t = type(key)
+    if t is int or t is long:
+        return key & _MASK64
+    if t is not str and isinstance(key, numbers.Integral):
+        return int(key) & _MASK64
+    return key.__hash__() & _MASK64
+
+
+def _toUint64Batch(keys):
+    """
+    Vectorized version of `_toUint64`, returns a new uint64 numpy array.
+    """
+    if not isinstance(keys, np.ndarray):
+        keys = list(keys)
+        arr = np.asarray(keys)
+        if arr.ndim != 1 or arr.dtype.kind not in 'iub':
+            # keep the original objects, numpy may have converted them
+            return np.fromiter((_toUint64(k) for k in keys),
+                               dtype=np.uint64, count=len(keys))
+    else:
+        arr = keys
+    if arr.ndim == 2:
+        # each row is a key
+        items = [tuple(r) for r in arr.tolist()]
+    elif arr.dtype.kind in 'iub':
+        return arr.astype(np.uint64).ravel()
+    else:
+        items = arr.ravel().tolist()
+    return np.fromiter((_toUint64(k) for k in items),
+                       dtype=np.uint64, count=len(items))
+
 
 class _Hash(object):
     """ 
@@ -41,3 +115,118 @@ class MurmurHash(_Hash):
         v = mmh3.hash(str(key.__hash__()), self._seed)
         return -(v + 1) if v < 0 else v
 
+    def hash64(self, key):
+        """
+        Return a 64-bit hash value of key. Agrees with `hash64Batch`
+        on the same key.
+
+        :param key: can be any hashable object
+
+        :return: hash value in [0, 2^64)
+        :rtype: int
+        """
+        seed = _SEEDS64.get(self._seed | 1 << 32)
+        if seed is None:
+            seed = self._seed64()
+        return _fmix64(_toUint64(key) ^ seed)
+
+    def hash64Batch(self, keys):
+        """
+        Return the 64-bit hash values of many keys at once.
+
+        :param keys: a numpy array or any sequence of hashable objects.
+                     Integer arrays are hashed without leaving numpy.
+
+        :return: hash values, one per key
+        :rtype: numpy.ndarray of uint64
+        """
+        k = _toUint64Batch(keys)
+        k ^= np.uint64(self._seed64())
+        return _fmix64Batch(k)
+
+    def hash128(self, key):
+        """
+        Return a 128-bit hash value of key, as two 64-bit halves.
+        Agrees with `hash128Batch` on the same key, and the first
+        half is `hash64` of the key.
+
+        :param key: can be any hashable object
+
+        :return: two hash values in [0, 2^64)
+        :rtype: (int, int)
+        """
+        k = _toUint64(key)
+        return _fmix64(k ^ self._seed64()), _fmix64(k ^ self._seed64(2))
+
+    def hash128Batch(self, keys):
+        """
+        Return the 128-bit hash values of many keys at once, as two
+        arrays of 64-bit halves.
+
+        :param keys: a numpy array or any sequence of hashable objects.
+
+        :return: first and second halves of the hash values
+        :rtype: (numpy.ndarray of uint64, numpy.ndarray of uint64)
+        """
+        k = _toUint64Batch(keys)
+        return _fmix64Batch(k ^ np.uint64(self._seed64())), \
+            _fmix64Batch(k ^ np.uint64(self._seed64(2)))
+
+    def _seed64(self, half=1):
+        """
+        Spread the 32-bit seed over 64 bits, differently for each
+        half of a 128-bit hash value.
+        """
+        key = self._seed | (half << 32)
+        try:
+            return _SEEDS64[key]
+        except KeyError:
+            _SEEDS64[key] = _fmix64(key)
+            return _SEEDS64[key]
+
+
+def hash64Each(hashes, key):
+    """
+    Return the 64-bit hash values of one key by each of the given
+    MurmurHash objects, the same as their `hash64`, converting the
+    key only once.
+
+    :param hashes: a list of MurmurHash objects
+    :param key: can be any hashable object
+
+    :return: hash values in [0, 2^64), one per hash object
+    :rtype: list of int
+    """
+    k = _toUint64(key)
+    seeds, mask, c1, c2 = _SEEDS64, _MASK64, _C1, _C2
+    res = []
+    for h in hashes:
+        x = seeds.get(h._seed | 1 << 32)
+        if x is None:
+            x = h._seed64()
+        # _fmix64 inlined, this runs for every row of a sketch
+        x ^= k
+        x ^= x >> 33
+        x = (x * c1) & mask
+        x ^= x >> 33
+        x = (x * c2) & mask
+        res.append(x ^ x >> 33)
+    return res
+
+
+def hash64EachBatch(hashes, keys):
+    """
+    Return the 64-bit hash values of many keys by each of the given
+    MurmurHash objects, the same as their `hash64Batch`, converting
+    the keys only once.
+
+    :param hashes: a list of MurmurHash objects
+    :param keys: a numpy array or any sequence of hashable objects.
+
+    :return: hash values, one row per hash object and one column
+             per key
+    :rtype: numpy.ndarray of uint64
+    """
+    k = _toUint64Batch(keys)
+    seeds = np.array([h._seed64() for h in hashes], dtype=np.uint64)
+    return _fmix64Batch(k[None, :] ^ seeds[:, None])
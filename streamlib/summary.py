@@ -2,13 +2,19 @@
 
 """
 from streamlib import MurmurHash
+from streamlib.hashes import hash64Each, hash64EachBatch
 import copy
-from array import array
 from abc import ABCMeta, abstractmethod
 from random import randint
 from streamlib.utils import doc_inherit
 import streamlib.utils as utils
 import math
+import mmap
+import struct
+from bisect import bisect_right
+import heapq
+import json
+import numpy as np
 
 
 
@@ -17,6 +23,22 @@ class Sketch(object):
     """
     Interface for Sketch.
     """
+    # attributes written by toBytes: numpy arrays or lists of them,
+    # MurmurHash objects or lists of them, and plain python values
+    _BUFFERS = ()
+    _HASHES = ()
+    _STATE = ()
+
+    # magic, version of the format and length of the metadata
+    _PREFIX = struct.Struct('<4sBxxxI')
+    _MAGIC = b'SLIB'
+    _FORMAT = 1
+
+    # whether the sketch can be updated in a mapped file, see open
+    _MAPPABLE = False
+    _ACCESS = {'r': mmap.ACCESS_READ, 'r+': mmap.ACCESS_WRITE,
+               'c': mmap.ACCESS_COPY}
+
     @abstractmethod
     def processBatch(self, *args, **kwargs):
         """
@@ -49,6 +71,261 @@ class Sketch(object):
     def __add__(self, other):
         return self.merge(other)
 
+    def toBytes(self):
+        """
+        Serialize the sketch into a compact binary form: a small
+        header with the type, parameters and hash seeds, followed by
+        the raw counter buffers, each aligned on 8 bytes.
+
+        :return: the serialized sketch
+        :rtype: bytes
+        """
+        return b''.join(part.tobytes() if isinstance(part, np.ndarray)
+                        else part for part in self._parts())
+
+    def save(self, path):
+        """
+        Write the serialized sketch to a file, buffer by buffer, so
+        large counters are never copied in memory. The file can be
+        attached back with open.
+
+        :param path: path of the file, overwritten if it exists
+        :type path: str
+        """
+        with open(path, 'wb') as f:
+            for part in self._parts():
+                f.write(part.data if isinstance(part, np.ndarray) else part)
+
+    def _parts(self):
+        """
+        Pieces of the serialized sketch: the header as bytes, then
+        each buffer as a contiguous numpy array, and the padding.
+        """
+        if not self._BUFFERS:
+            raise NotImplementedError('%s cannot be serialized, use pickle'
+                                      % type(self).__name__)
+        buffers = [getattr(self, name) for name in self._BUFFERS]
+        for name, buf in zip(self._BUFFERS, buffers):
+            if any(arr.dtype == object for arr in _arraysOf(buf)):
+                raise ValueError('%s holds python objects' % name)
+        meta = json.dumps({
+            'type': type(self).__name__,
+            'state': dict((name, _plain(getattr(self, name)))
+                          for name in self._STATE),
+            'seeds': dict((name, _seedsOf(getattr(self, name)))
+                          for name in self._HASHES),
+            'buffers': [_describe(buf) for buf in buffers]},
+            separators=(',', ':'))
+        header = (self._PREFIX.pack(self._MAGIC, self._FORMAT, len(meta)) +
+                  meta.encode('utf-8'))
+        yield header + b'\0' * (-len(header) % 8)
+        for buf in buffers:
+            for arr in _arraysOf(buf):
+                yield np.ascontiguousarray(arr)
+                yield b'\0' * (-arr.nbytes % 8)
+
+    @classmethod
+    def fromBytes(cls, data):
+        """
+        Create a sketch from its serialized form. The counters are
+        read in place, without copy: the sketch shares its memory with
+        data, and is read-only when data is, e.g. bytes. Pass a
+        bytearray or a writable memoryview to update it.
+
+        :param data: bytes-like object returned by toBytes
+
+        :return: the deserialized sketch
+        """
+        magic, version, size = cls._PREFIX.unpack_from(data)
+        if magic != cls._MAGIC:
+            raise ValueError('not a serialized sketch')
+        if version != cls._FORMAT:
+            raise ValueError('unsupported version %d' % version)
+        start = cls._PREFIX.size
+        meta = json.loads(bytes(data[start:start + size]).decode('utf-8'))
+        if meta['type'] != cls.__name__:
+            raise ValueError('data holds a %s, not a %s'
+                             % (meta['type'], cls.__name__))
+
+        res = cls.__new__(cls)
+        for name, value in meta['state'].items():
+            setattr(res, str(name), value)
+        for name, seeds in meta['seeds'].items():
+            setattr(res, str(name), _hashesOf(seeds))
+        offset = [start + size + (-(start + size) % 8)]
+
+        def read(desc):
+            dtype, shape = np.dtype(str(desc[0])), tuple(desc[1])
+            count = int(np.prod(shape))
+            if count == 0:
+                buf = np.zeros(shape, dtype=dtype)
+            else:
+                buf = np.frombuffer(data, dtype=dtype, count=count,
+                                    offset=offset[0]).reshape(shape)
+            offset[0] += buf.nbytes + (-buf.nbytes % 8)
+            return buf
+
+        for name, desc in zip(cls._BUFFERS, meta['buffers']):
+            if desc is None:
+                setattr(res, name, None)
+            elif not desc or isinstance(desc[0], list):
+                setattr(res, name, [read(d) for d in desc])
+            else:
+                setattr(res, name, read(desc))
+        return res
+
+
+    @classmethod
+    def open(cls, path, mode='r+'):
+        """
+        Attach a sketch to a file written by save, in place: the
+        counters are mapped in memory rather than read, so opening
+        is instant whatever the size of the sketch, and processes
+        opening the same file share one copy in the page cache.
+
+        :param path: path of the file
+        :type path: str
+
+        :param mode: 'r+' to update the file in place, 'r' to map it
+                     read-only, or 'c' for copy-on-write, where
+                     updates stay private to the process
+        :type mode: str
+
+        :return: the sketch backed by the file
+        """
+        if mode not in cls._ACCESS:
+            raise ValueError("mode should be 'r', 'r+' or 'c'")
+        with open(path, 'r+b' if mode == 'r+' else 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=cls._ACCESS[mode])
+        res = cls.fromBytes(data)
+        if mode == 'r+' and not res._mappable():
+            raise NotImplementedError('%s cannot be updated in place, '
+                                      "open it with mode 'c'"
+                                      % type(res).__name__)
+        return res
+
+    def _mappable(self):
+        """
+        Whether all of the mutable state lives in the buffers and is
+        updated in place, so the sketch can be updated in a file.
+        """
+        return self._MAPPABLE
+
+def _plain(value):
+    """
+    Convert numpy scalars to python values, recursively in lists
+    and tuples, so they can be written as json.
+    """
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _arraysOf(buf):
+    """
+    Arrays of a buffer, which is None, an array or a list of them.
+    """
+    if buf is None:
+        return []
+    return buf if isinstance(buf, list) else [buf]
+
+
+def _describe(buf):
+    """
+    Dtype and shape of a buffer, a list of them for a list of
+    arrays, or None.
+    """
+    if buf is None or isinstance(buf, list):
+        return buf and [_describe(arr) for arr in buf]
+    return [buf.dtype.str, buf.shape]
+
+
+def _seedsOf(hashes):
+    """
+    Seeds of a MurmurHash object, or of nested lists of them.
+    """
+    if isinstance(hashes, MurmurHash):
+        return hashes._seed
+    return [_seedsOf(h) for h in hashes]
+
+
+def _hashesOf(seeds):
+    """
+    MurmurHash objects with the given seeds, the reverse of _seedsOf.
+    """
+    if isinstance(seeds, list):
+        return [_hashesOf(seed) for seed in seeds]
+    h = MurmurHash()
+    h._seed = seeds
+    return h
+
+
+# smallest and largest values of integer counters, by dtype
+_LIMITS = {}
+
+def _limits(dtype):
+    """
+    Smallest and largest values of an integer dtype, as python
+    integers, None for the other types.
+    """
+    if dtype not in _LIMITS:
+        _LIMITS[dtype] = None if dtype.kind not in 'iu' else \
+            (int(np.iinfo(dtype).min), int(np.iinfo(dtype).max))
+    return _LIMITS[dtype]
+
+
+def _addEach(counters, cells, values):
+    """
+    Add values to the counters at cells, index tuples which do not
+    repeat, one by one. Raise TypeError on values which are not
+    integers, or OverflowError, leaving the counters unchanged,
+    where integer counters would wrap around.
+    """
+    limits = _limits(counters.dtype)
+    if limits is not None:
+        others = [v for v in values if not isinstance(v, (int, long))]
+        if others:
+            _checkIntegers(others)
+    new = [counters.item(cell) + value for cell, value in zip(cells, values)]
+    if limits is not None and (min(new) < limits[0] or max(new) > limits[1]):
+        raise OverflowError('counters would overflow')
+    for cell, value in zip(cells, new):
+        counters.itemset(cell, value)
+
+
+def _addAt(counters, index, values=None):
+    """
+    Add values, or ones, to the flat counters at index, which may
+    repeat. Raise TypeError on values which are not integers, or
+    OverflowError, leaving the counters unchanged, where integer
+    counters would wrap around.
+    """
+    limits = _limits(counters.dtype)
+    if limits is not None and values is not None:
+        _checkIntegers(values)
+    index, inverse = np.unique(index, return_inverse=True)
+    sums = np.bincount(inverse, weights=values)
+    if limits is not None and len(index):
+        # checked in floating point, exact below 2^53
+        new = counters[index] + sums.astype(np.float64)
+        if new.min() < limits[0] or new.max() > limits[1]:
+            raise OverflowError('counters would overflow')
+    counters[index] += sums.astype(counters.dtype)
+
+
+def _sumOf(a, b):
+    """
+    Sum of two arrays of counters, raising OverflowError where
+    integer counters would wrap around.
+    """
+    res = a + b
+    if _limits(res.dtype) is not None and \
+       ((b > 0) & (res < a) | (b < 0) & (res > a)).any():
+        raise OverflowError('counters would overflow')
+    return res
+
 
 class F2(Sketch):
     """
@@ -56,6 +333,11 @@ class F2(Sketch):
     estimate the second moment of the 
     data stream
     """
+    _BUFFERS = ('_sketch',)
+    _HASHES = ('_hashes',)
+    _STATE = ('_w', '_mu', '_hash')
+    _MAPPABLE = True
+
     def __init__(self, w=20, mu=5, typecode='i'):
         """
         Create a new instance.
@@ -68,27 +350,40 @@ class F2(Sketch):
         :type mu: int
 
         :param typecode: type to represent the frequencies, check
-                         docs.python.org for module `array`
+                         docs.python.org for module `array`. updates
+                         and merges which would overflow it raise
+                         OverflowError and change nothing
     
         """
         
         self._w = w
         self._mu = mu
-        self._sketch = [array(typecode, [0] * w) for i in xrange(mu)]
+        # one contiguous row of counters per copy
+        self._sketch = np.zeros((mu, w), dtype=np.dtype(typecode))
         self._hashes = [[MurmurHash() for j in xrange(w)] for i in xrange(mu)]
         self._hash = hash(self) 
 
 
     def processBatch(self, dataStream, weighted=False):
         """
-        Summarize the given data stream.
+        Summarize the given data stream, chunk by chunk with numpy.
 
         :param dataStream: any iterable object with hashable elements. 
                            e.g. a list of integers.
+        :param weighted: if weighted, each item in dataStream should
+                         be (key, weight) pair
         """
-
-        for item in dataStream:
-            self.processItem(item, weighted)
+        for chunk in utils.chunks(dataStream):
+            keys, weights = zip(*chunk) if weighted else (chunk, None)
+            delta = np.empty((self._mu, self._w), dtype=np.int64 if
+                             weights is None else np.float64)
+            for i in xrange(self._mu):
+                signs = (hash64EachBatch(self._hashes[i], keys) &
+                         np.uint64(1)).astype(np.int64) * 2 - 1
+                delta[i] = signs.sum(axis=1) if weights is None \
+                    else signs.dot(np.asarray(weights, dtype=np.float64))
+            _addAt(self._sketch.reshape(-1), np.arange(delta.size),
+                   delta.ravel())
 
             
     def processItem(self, item, weighted=False):
@@ -98,16 +393,16 @@ class F2(Sketch):
 
         :param item: hashable object to be processed
                            e.g. an integer
+        :param weighted: if weighted, item should be a (key, weight)
+                         pair
         """
-        if not weighted:
-            for i in xrange(self._mu):
-                for j in xrange(self._w):
-                    self._sketch[i][j] += self._hashes[i][j].hash(item) % 2 * 2 - 1
-        else:
-            itm, wt = item
-            for i in xrange(self._mu):
-                for j in xrange(self._w):
-                    self._sketch[i][j] += (self._hashes[i][j].hash(itm) % 2 * 2 - 1) * wt                                    
+        key, weight = item if weighted else (item, 1)
+        cells, values = [], []
+        for i in xrange(self._mu):
+            for j, h in enumerate(hash64Each(self._hashes[i], key)):
+                cells.append((i, j))
+                values.append(weight if h & 1 else -weight)
+        _addEach(self._sketch, cells, values)
 
     def estimate(self):
         """
@@ -117,8 +412,8 @@ class F2(Sketch):
         :rtype: int/real
         """
 
-        return utils.median([utils.mean( map(lambda x: x**2, self._sketch[i]) )
-                             for i in xrange(self._mu)])
+        squares = self._sketch.astype(np.float64) ** 2
+        return utils.median(squares.mean(axis=1).tolist())
 
 
 
@@ -154,24 +449,25 @@ class F2(Sketch):
             raise ValueError('two instances are not compatible')
 
         res = F2(w=1, mu=1)
-        res._sketch = copy.deepcopy(self._sketch)
+        res._sketch = _sumOf(self._sketch, other._sketch)
         res._hashes = copy.deepcopy(self._hashes)
         res._w = self._w
         res._mu = self._mu
         res._hash = self._hash
 
-        for i in xrange(self._mu):
-            for j in xrange(self._w):
-                res._sketch[i][j] += other._sketch[i][j]
-
         return res
 
 
 
-class CountSketch(object):
+class CountSketch(Sketch):
     """
     Count Sketch.
     """
+    _BUFFERS = ('_sketch',)
+    _HASHES = ('_sign', '_hashes')
+    _STATE = ('_w', '_mu', '_hash')
+    _MAPPABLE = True
+
     def __init__(self, w=20, mu=5, typecode='i'):
         """
         Create a new instance.
@@ -184,12 +480,15 @@ class CountSketch(object):
         :type mu: int
 
         :param typecode: type to represent the frequencies, check
-                         docs.python.org for module `array`
+                         docs.python.org for module `array`. updates
+                         and merges which would overflow it raise
+                         OverflowError and change nothing
 
         """
         self._w = w
         self._mu = mu
-        self._sketch = [array(typecode, [0] * w) for i in xrange(mu)]
+        # one contiguous row of counters per copy
+        self._sketch = np.zeros((mu, w), dtype=np.dtype(typecode))
         self._sign = [MurmurHash() for i in xrange(mu)]
         self._hashes = [MurmurHash() for i in xrange(mu)]
         self._hash = hash(self) 
@@ -197,16 +496,24 @@ class CountSketch(object):
 
     def processBatch(self, dataStream, weighted=False):
         """
-        Summarize the given data stream.
+        Summarize the given data stream, chunk by chunk with numpy.
 
         :param dataStream: any iterable object with hashable elements. 
                            e.g. a list of integers.
         :param weighted: if weighted, each item in dataStream should
                          be (key, weight) pair
         """
-
-        for item in dataStream:
-            self.processItem(item, weighted)
+        for chunk in utils.chunks(dataStream):
+            keys, weights = zip(*chunk) if weighted else (chunk, None)
+            # where the items are mapped by each hash, in the flat rows
+            pos = hash64EachBatch(self._hashes, keys) % np.uint64(self._w)
+            index = pos.astype(np.intp) + \
+                np.arange(0, self._mu * self._w, self._w)[:, None]
+            values = (hash64EachBatch(self._sign, keys) &
+                      np.uint64(1)).astype(np.float64) * 2 - 1
+            if weights is not None:
+                values *= np.asarray(weights, dtype=np.float64)
+            _addAt(self._sketch.reshape(-1), index.ravel(), values.ravel())
 
     def processItem(self, item, weighted=False):
         """
@@ -218,21 +525,13 @@ class CountSketch(object):
         :param weighted: if weighted, item  should
                          be a (key, weight) pair
         """
-        if weighted:
-            key, weight = item
-            for i in xrange(self._mu):
-                # where the item is mapped by the i_th hash
-                pos = self._hashes[i].hash(key) % self._w
-                # increment the bucket
-                sg = (self._sign[i].hash(key) % 2) * 2 - 1
-                self._sketch[i][pos] += weight * sg
-        else:
-            for i in xrange(self._mu):
-                # where the item is mapped by the i_th hash
-                pos = self._hashes[i].hash(item) % self._w
-                # increment the bucket
-                sg = (self._sign[i].hash(item) % 2) * 2 - 1
-                self._sketch[i][pos] += sg
+        key, weight = item if weighted else (item, 1)
+        # where the item is mapped by each hash, and its sign
+        cells = [(i, h % self._w)
+                 for i, h in enumerate(hash64Each(self._hashes, key))]
+        values = [weight if h & 1 else -weight
+                  for h in hash64Each(self._sign, key)]
+        _addEach(self._sketch, cells, values)
                 
 
     def estimate(self, key):
@@ -244,9 +543,10 @@ class CountSketch(object):
         :return: estimated frequency of the given key.
         :rtype: int/real
         """
-        all_estimators = [(self._sign[i].hash(key) % 2 * 2 - 1) * 
-                          self._sketch[i][self._hashes[i].hash(key) % self._w]
-                          for i in xrange(self._mu)]
+        signs = hash64Each(self._sign, key)
+        all_estimators = [
+            ((signs[i] & 1) * 2 - 1) * self._sketch.item(i, h % self._w)
+            for i, h in enumerate(hash64Each(self._hashes, key))]
         return utils.median(all_estimators)
 
 
@@ -283,17 +583,13 @@ class CountSketch(object):
             raise ValueError('two instances are not compatible')
 
         res = CountSketch(w=1, mu=1)
-        res._sketch = copy.deepcopy(self._sketch)
+        res._sketch = _sumOf(self._sketch, other._sketch)
         res._hashes = copy.deepcopy(self._hashes)
         res._sign = copy.deepcopy(self._sign)
         res._w = self._w
         res._mu = self._mu
         res._hash = self._hash
 
-        for i in xrange(self._mu):
-            for j in xrange(self._w):
-                res._sketch[i][j] += other._sketch[i][j]
-
         return res
 
 
@@ -308,6 +604,11 @@ class CountMin(Sketch):
     Count-Min sketch.
     support non-negative weighted data stream.
     """
+    _BUFFERS = ('_sketch',)
+    _HASHES = ('_hashes',)
+    _STATE = ('_w', '_mu', '_hash')
+    _MAPPABLE = True
+
     def __init__(self, w=20, mu=5, typecode='i'):
         """
         Create a new instance.
@@ -320,26 +621,36 @@ class CountMin(Sketch):
         :type mu: int
 
         :param typecode: type to represent the frequencies, check
-                         docs.python.org for module `array`
+                         docs.python.org for module `array`. updates
+                         and merges which would overflow it raise
+                         OverflowError and change nothing
         """
         self._w = w
         self._mu = mu
-        self._sketch = [array(typecode, [0] * w) for i in xrange(mu)]
+        # one contiguous row of counters per copy
+        self._sketch = np.zeros((mu, w), dtype=np.dtype(typecode))
         self._hashes = [MurmurHash() for i in xrange(mu)]
         self._hash = hash(self) 
 
     def processBatch(self, dataStream, weighted=False):
         """
-        Summarize the given data stream.
+        Summarize the given data stream, chunk by chunk with numpy.
 
         :param dataStream: any iterable object with hashable elements. 
                            e.g. a list of integers.
         :param weighted: if weighted, each item in dataStream should
                          be (key, weight) pair, where weight > 0
         """
-
-        for item in dataStream:
-            self.processItem(item, weighted)
+        for chunk in utils.chunks(dataStream):
+            keys, weights = zip(*chunk) if weighted else (chunk, None)
+            # where the items are mapped by each hash, in the flat rows
+            pos = hash64EachBatch(self._hashes, keys) % np.uint64(self._w)
+            index = pos.astype(np.intp) + \
+                np.arange(0, self._mu * self._w, self._w)[:, None]
+            if weights is not None:
+                weights = np.tile(np.asarray(weights, dtype=np.float64),
+                                  self._mu)
+            _addAt(self._sketch.reshape(-1), index.ravel(), weights)
 
     def processItem(self, item, weighted=False):
         """
@@ -351,19 +662,11 @@ class CountMin(Sketch):
         :param weighted: if weighted, item  should
                          be a (key, weight) pair, where weight > 0
         """
-        if weighted:
-            key, weight = item
-            for i in xrange(self._mu):
-                # where the item is mapped by the i_th hash
-                pos = self._hashes[i].hash(key) % self._w
-                # increment the bucket
-                self._sketch[i][pos] += weight            
-        else:
-            for i in xrange(self._mu):
-                # where the item is mapped by the i_th hash
-                pos = self._hashes[i].hash(item) % self._w
-                # increment the bucket
-                self._sketch[i][pos] += 1
+        key, weight = item if weighted else (item, 1)
+        # where the item is mapped by each hash
+        cells = [(i, h % self._w)
+                 for i, h in enumerate(hash64Each(self._hashes, key))]
+        _addEach(self._sketch, cells, [weight] * self._mu)
 
 
     def estimate(self, key):
@@ -375,8 +678,8 @@ class CountMin(Sketch):
         :return: estimated frequency of the given key.
         :rtype: int/real
         """
-        all_estimators = [self._sketch[i][self._hashes[i].hash(key) % self._w]
-                          for i in xrange(self._mu)]
+        all_estimators = [self._sketch.item(i, h % self._w)
+                          for i, h in enumerate(hash64Each(self._hashes, key))]
         return min(all_estimators)
 
 
@@ -415,13 +718,10 @@ class CountMin(Sketch):
             raise ValueError('two instances are not compatible')
 
         res = CountMin(w=1, mu=1)
-        res._sketch = copy.deepcopy(self._sketch)
+        res._sketch = _sumOf(self._sketch, other._sketch)
         res._hashes = copy.deepcopy(self._hashes)
         res._w = self._w
         res._mu = self._mu
-        for i in xrange(self._mu):
-            for j in xrange(self._w):
-                res._sketch[i][j] += other._sketch[i][j]
 
         return res
 
@@ -456,9 +756,7 @@ class CountMedian(CountMin):
                          be (key, weight) pair, weight can be positive
                          or negtive
         """
-
-        for item in dataStream:
-            self.processItem(item, weighted)
+        super(CountMedian, self).processBatch(dataStream, weighted)
 
 
     def processItem(self, item, weighted=False):
@@ -484,8 +782,8 @@ class CountMedian(CountMin):
         :return: estimated frequency of the given key.
         :rtype: int/real
         """
-        all_estimators = [self._sketch[i][self._hashes[i].hash(key) % self._w]
-                          for i in xrange(self._mu)]
+        all_estimators = [self._sketch.item(i, h % self._w)
+                          for i, h in enumerate(hash64Each(self._hashes, key))]
         return utils.median(all_estimators)
 
 class MG(Sketch):
@@ -539,65 +837,4811 @@ class MG(Sketch):
             return 0
 
 class DistinctElement(Sketch):
+    _BUFFERS = ('bitmap',)
+    _HASHES = ('hashes', 'bitmapHash')
+    _STATE = ('w', 'n', 'mu', 'sketch', 'bits', 'hash')
+
+    # the bitmap is dropped once this fraction of its bits is set
+    _LOAD = 0.7
+
+    def __init__(self,n=20, mu=5, typecode = 'i', bitmap=1024):
+        """
+        Create a new instance.
+
+        :param n: co-domain of the hash functions
+        :type n: int
+
+        :param mu: The number of repeated copies.
+        :type mu: int
 
-    def __init__(self,n=20, mu=5, typecode = 'i'):
+        :param bitmap: number of bits for linear counting, which gives
+                       nearly exact estimations for small number of
+                       distinct elements. 0 to disable it.
+        :type bitmap: int
+        """
         self.w = int(math.log(n)+1) # w is number buckets of zeroes-hashed values, the co-domain of the hash function is 2**w
         self.n = n # co-domain of hash functions
         self.mu = mu
         self.sketch = [0 for i in xrange(mu)]
-        # [array(typecode, [0] * w) for i in xrange(mu)] for generalizing to be linear sketch with buckets
         self.hashes = [MurmurHash() for i in xrange(mu)]
+        self.bits = (bitmap + 7) // 8 * 8
+        self.bitmap = np.zeros(self.bits // 8, dtype=np.uint8) if bitmap else None
+        self.bitmapHash = MurmurHash()
         self.hash = hash(self)
 
     def processBatch(self, dataStream):
-        for item in dataStream:
-            self.processItem(item)
+        n = np.uint64(self.n)
+        for chunk in utils.chunks(dataStream):
+            for i in xrange(self.mu):
+                hs = utils.zerosBatch(self.hashes[i].hash64Batch(chunk) % n)
+                self.sketch[i] = max(self.sketch[i], int(hs.max()))
+            if self.bitmap is not None:
+                pos = self.bitmapHash.hash64Batch(chunk) % np.uint64(self.bits)
+                utils.setbits(self.bitmap, pos)
+                self._checkLoad()
 
     def processItem(self,item):
         for i in xrange(self.mu):
-            hs = utils.zeros(self.hashes[i].hash(item) % self.n)
-            if hs > self.sketch[i]: # self.sketch[i][hs]+=1 for buckets version
+            hs = utils.zeros(self.hashes[i].hash64(item) % self.n)
+            if hs > self.sketch[i]:
                 self.sketch[i] = hs
+        if self.bitmap is not None:
+            pos = self.bitmapHash.hash64(item) % self.bits
+            if not self.bitmap[pos >> 3] >> (pos & 7) & 1:
+                self.bitmap[pos >> 3] |= 1 << (pos & 7)
+                self._checkLoad()
 
     def estimate(self):
+        if self.bitmap is not None:
+            # linear counting
+            return self.bits * math.log(float(self.bits) /
+                                        (self.bits - utils.popcount(self.bitmap)))
         return utils.median([2**(self.sketch[i]+0.5) for i in xrange(self.mu)])
-#     return utils.median([utils.mean(map(lambda z: 2**(z+0.5), self.sketch[i])) for i in xrange(self.mu)])
 
-class BJKST(Sketch):
+    def reproduce(self, num=1):
+        """
+        Reproduce DistinctElement instance(s) to have the same
+        internal status.
 
-    def __init__(self, n=20, mu=5, c=1, eps=.1, b=1, typecode ='i'):
-        self.w = int(math.log(n)+1)
-        self.n = n
-        self.b = b
-        self.c = c
-        self.eps = eps 
-        self.mu = mu
-        self.B = {}
-        self.g_seed = int(self.b*math.log(self.n,2)**2 * self.eps**(-4) + 1)
-        self.sketch = [0 for i in xrange(mu)]
-        self.h_hashes = [MurmurHash() for i in xrange(mu)]
-        self.g_hashes = [MurmurHash() for i in xrange (mu)]
-        self.hash = hash(self)
+        :param num: number of instances to be reproduced
+        :type num: int
+
+        :return: reproduced instance. if num > 1, a list 
+                 of instances will be returned
+        """
+        if type(num) is not int:
+            raise TypeError('num should be int')
+        if num < 1:
+            raise ValueError('num should >= 1')
+
+        if num == 1:
+            return copy.deepcopy(self)
+        else:
+            return [copy.deepcopy(self) for i in xrange(num)]
+
+    def merge(self, other):
+        """
+        Merge two DistinctElement instances if they are compatible.
+
+        :param other: an instance of DistinctElement
+        """
+        if other.hash != self.hash:
+            raise ValueError('two instances are not compatible')
+
+        res = copy.deepcopy(self)
+        res.sketch = [max(a, b) for a, b in zip(self.sketch, other.sketch)]
+        if self.bitmap is None or other.bitmap is None:
+            res.bitmap = None
+        else:
+            np.bitwise_or(res.bitmap, other.bitmap, out=res.bitmap)
+            res._checkLoad()
+        return res
+
+    def __add__(self, other):
+        """
+        Overload + for self.merge
+        """
+        return self.merge(other)
+
+    def _checkLoad(self):
+        """
+        Switch to the registers once the bitmap is too full for
+        linear counting.
+        """
+        if utils.popcount(self.bitmap) > self._LOAD * self.bits:
+            self.bitmap = None
+
+
+class PCSA(Sketch):
+    """
+    Probabilistic Counting with Stochastic Averaging (Flajolet-Martin).
+    estimate the number of distinct elements in the data stream.
+    """
+    _BUFFERS = ('_sketch',)
+    _HASHES = ('_hashes',)
+    _STATE = ('_m', '_hash')
+    _MAPPABLE = True
+
+    # correction factor of the estimator
+    _PHI = 0.77351
+    # small cardinality correction of Scheuermann and Mauve
+    _KAPPA = 1.75
+
+    def __init__(self, m=64):
+        """
+        Create a new instance.
+
+        :param m: The number of buckets, each one a 64-bit bitmap. The
+                  relative standard error is about 0.78 / sqrt(m)
+        :type m: int
+        """
+        if type(m) is not int:
+            raise TypeError('m should be int')
+        if m < 1:
+            raise ValueError('m should >= 1')
+
+        self._m = m
+        self._sketch = np.zeros(m, dtype=np.uint64)
+        self._hashes = MurmurHash()
+        self._hash = hash(self)
+
+
+    def processBatch(self, dataStream):
+        """
+        Summarize the given data stream, chunk by chunk with numpy.
+
+        :param dataStream: any iterable object with hashable elements. 
+                           e.g. a list of integers, or a numpy array.
+        """
+        m = np.uint64(self._m)
+        for chunk in utils.chunks(dataStream):
+            x = self._hashes.hash64Batch(chunk)
+            rest = x // m
+            r = np.where(rest == 0, 63, np.minimum(utils.zerosBatch(rest), 63))
+            np.bitwise_or.at(self._sketch, (x % m).astype(np.intp),
+                             np.uint64(1) << r.astype(np.uint64))
 
-    def processBatch(self,dataStream):
-        for item in dataStream:
-            self.processItem(item)
 
     def processItem(self, item):
-        for i in xrange (self.mu):
-            hs = utils.zeros(self.h_hashes[i].hash(item) % self.n)
-            if hs >= self.sketch[i]:
-                self.B[((self.g_hashes[i].hash(item) % self.g_seed), utils.zeros(self.h_hashes[i].hash(item)))] #% (int(math.log(self.n,2)**2 * self.eps**(-4))+1)
-                while (len(self.B) >= self.c / self.eps**2): 
-                    self.sketch[i] += 1
-                    self.B = {k:v for k, v in self.B.items() if v >= self.sketch[i]}
+        """
+        Summarize the given data stream, but only process one
+        item.
+
+        :param item: hashable object to be processed
+                           e.g. an integer
+        """
+        x = self._hashes.hash64(item)
+        rest = x // self._m
+        r = min(utils.zeros(rest), 63) if rest else 63
+        self._sketch[x % self._m] |= np.uint64(1 << r)
+
 
     def estimate(self):
-        return utils.median([len(self.B)*2**(self.sketch[i]) for i in xrange(self.mu)])
+        """
+        Estimate the number of distinct elements in the stream.
 
-        
-        
+        :return: estimated number of distinct elements
+        :rtype: real
+        """
+        # position of the lowest zero bit of each bitmap
+        free = ~self._sketch
+        R = np.where(free == 0, 64, utils.zerosBatch(free))
+        z = R.mean()
+        res = self._m / self._PHI * (2**z - 2**(-self._KAPPA * z))
+        empty = np.count_nonzero(self._sketch == 0)
+        if empty and res <= 2.5 * self._m:
+            # linear counting over the buckets for small cardinalities
+            return self._m * math.log(float(self._m) / empty)
+        return res
+
+
+    def reproduce(self, num=1):
+        """
+        Reproduce PCSA instance(s) to have the same
+        internal status.
+
+        :param num: number of instances to be reproduced
+        :type num: int
 
+        :return: reproduced instance. if num > 1, a list 
+                 of instances will be returned
+        """
+        if type(num) is not int:
+            raise TypeError('num should be int')
+        if num < 1:
+            raise ValueError('num should >= 1')
+
+        if num == 1:
+            return copy.deepcopy(self)
+        else:
+            return [copy.deepcopy(self) for i in xrange(num)]
+
+
+    def merge(self, other):
+        """
+        Merge two PCSA instances if they are compatible.
+
+        :param other: an instance of PCSA
+        """
+        if other._hash != self._hash:
+            raise ValueError('two instances are not compatible')
+
+        res = copy.deepcopy(self)
+        np.bitwise_or(res._sketch, other._sketch, out=res._sketch)
+        return res
+
+
+    def __add__(self, other):
+        """
+        Overload + for self.merge
+        """
+        return self.merge(other)
+
+
+def _sigma(x):
+    """
+    sigma function of Ertl's improved HyperLogLog estimator.
+    """
+    if x == 1.:
+        return float('inf')
+    y = 1.
+    z = x
+    while True:
+        x *= x
+        z_old = z
+        z += x * y
+        y += y
+        if z == z_old:
+            return z
 
 
+def _tau(x):
+    """
+    tau function of Ertl's improved HyperLogLog estimator.
+    """
+    if x == 0. or x == 1.:
+        return 0.
+    y = 1.
+    z = 1. - x
+    while True:
+        x = math.sqrt(x)
+        z_old = z
+        y *= 0.5
+        z -= (1. - x)**2 * y
+        if z == z_old:
+            return z / 3.
+
+
+def _eachOf(f, x):
+    """
+    Apply the scalar function f to each number of the array x, once
+    per distinct number.
+    """
+    values, inverse = np.unique(x, return_inverse=True)
+    return np.array([f(v) for v in values.tolist()])[inverse]
+
+
+def _ertlEstimate(registers, p):
+    """
+    Ertl's improved estimator of the number of distinct elements from
+    HyperLogLog registers with precision p, or from each row of a
+    2-d array of registers.
+    """
+    q = 64 - p
+    rows = np.atleast_2d(registers)
+    n, m = rows.shape[0], float(rows.shape[1])
+    # one histogram of the register values per row
+    offsets = np.arange(n, dtype=np.int64)[:, None] * (q + 2)
+    C = np.bincount((rows + offsets).ravel(),
+                    minlength=n * (q + 2)).reshape(n, q + 2)
+    # z = (...((m tau + C[q]) / 2 + C[q - 1]) / 2 ... + C[1]) / 2
+    z = np.ldexp(m * _eachOf(_tau, 1. - C[:, q + 1] / m), -q)
+    z += C[:, 1:q + 1].dot(np.ldexp(1., -np.arange(1, q + 1)))
+    z += m * _eachOf(_sigma, C[:, 0] / m)
+    est = m * m / (2. * math.log(2.) * z)
+    return float(est[0]) if np.ndim(registers) == 1 else est
+
+
+def _hllPositions(x, p):
+    """
+    Register index and rank of each 64-bit hash value in an
+    uint64 array, for HyperLogLog with precision p.
+    """
+    q = 64 - p
+    rank = q + 1 - utils.bitlength(x & np.uint64((1 << q) - 1))
+    return (x >> np.uint64(q)).astype(np.intp), rank.astype(np.uint8)
+
+
+class HyperLogLog(Sketch):
+    """
+    HyperLogLog sketch, with the sparse representation of HLL++
+    for small cardinalities.
+    estimate the number of distinct elements in the data stream
+    """
+    _BUFFERS = ('_registers', '_sparse')
+    _HASHES = ('_hashes',)
+    _STATE = ('_p', '_m', '_buffer', '_hash')
+
+    # precision of the sparse representation
+    _SP = 25
+
+    def __init__(self, p=14, sparse=True):
+        """
+        Create a new instance.
+
+        :param p: precision, the sketch keeps 2^p one-byte registers and
+                  the relative standard error is about 1.04 / 2^(p/2)
+        :type p: int
+
+        :param sparse: start with the sparse representation, which is
+                       converted to the registers once it grows
+                       as large as them
+        :type sparse: bool
+        """
+        if type(p) is not int:
+            raise TypeError('p should be int')
+        if p < 4 or p > 18:
+            raise ValueError('p should be in [4, 18]')
+
+        self._p = p
+        self._m = 1 << p
+        self._hashes = MurmurHash()
+        self._hash = hash(self)
+        if sparse:
+            # sorted, encoded as (index << 6 | rank) w.r.t precision _SP
+            self._sparse = np.zeros(0, dtype=np.uint32)
+            self._buffer = []
+            self._registers = None
+        else:
+            self._sparse = None
+            self._buffer = None
+            self._registers = np.zeros(self._m, dtype=np.uint8)
+
+
+    def processBatch(self, dataStream):
+        """
+        Summarize the given data stream. The stream is hashed and
+        summarized chunk by chunk with numpy.
+
+        :param dataStream: any iterable object with hashable elements. 
+                           e.g. a list of integers, or a numpy array.
+        """
+        for chunk in utils.chunks(dataStream):
+            x = self._hashes.hash64Batch(chunk)
+            if self._registers is None:
+                r = 64 - self._SP
+                rank = r + 1 - utils.bitlength(x & np.uint64((1 << r) - 1))
+                enc = (x >> np.uint64(r)) << np.uint64(6) | rank.astype(np.uint64)
+                self._flush(enc.astype(np.uint32))
+            else:
+                pos, rank = _hllPositions(x, self._p)
+                np.maximum.at(self._registers, pos, rank)
+
+
+    def processItem(self, item):
+        """
+        Summarize the given data stream, but only process one
+        item.
+
+        :param item: hashable object to be processed
+                           e.g. an integer
+        """
+        x = self._hashes.hash64(item)
+        if self._registers is None:
+            r = 64 - self._SP
+            rank = r - (x & ((1 << r) - 1)).bit_length() + 1
+            self._buffer.append((x >> r) << 6 | rank)
+            if len(self._buffer) >= self._m >> 4:
+                self._flush()
+        else:
+            q = 64 - self._p
+            rank = q - (x & ((1 << q) - 1)).bit_length() + 1
+            pos = x >> q
+            if rank > self._registers[pos]:
+                self._registers[pos] = rank
+
+
+    def estimate(self):
+        """
+        Estimate the number of distinct elements in the stream.
+
+        :return: estimated number of distinct elements
+        :rtype: real
+        """
+        if self._registers is None:
+            self._flush()
+            if self._registers is None:
+                # linear counting over the 2^_SP sparse buckets
+                mp = float(1 << self._SP)
+                return mp * math.log(mp / (mp - len(self._sparse)))
+
+        return _ertlEstimate(self._registers, self._p)
+
+
+    def _parts(self):
+        self._flush()
+        return super(HyperLogLog, self)._parts()
+
+
+    def _mappable(self):
+        # the sparse list is replaced on updates, the registers are not
+        return self._registers is not None
+
+
+    def reproduce(self, num=1):
+        """
+        Reproduce HyperLogLog instance(s) to have the same
+        internal status.
+
+        :param num: number of instances to be reproduced
+        :type num: int
+
+        :return: reproduced instance. if num > 1, a list 
+                 of instances will be returned
+        """
+        if type(num) is not int:
+            raise TypeError('num should be int')
+        if num < 1:
+            raise ValueError('num should >= 1')
+
+        if num == 1:
+            return copy.deepcopy(self)
+        else:
+            return [copy.deepcopy(self) for i in xrange(num)]
+
+
+    def merge(self, other):
+        """
+        Merge two HyperLogLog instances if they are compatible.
+
+        :param other: an instance of HyperLogLog
+        """
+        if other._hash != self._hash:
+            raise ValueError('two instances are not compatible')
+
+        return HyperLogLog.unionAll([self, other])
+
+
+    def __add__(self, other):
+        """
+        Overload + for self.merge
+        """
+        return self.merge(other)
+
+
+    @staticmethod
+    def unionAll(sketches):
+        """
+        Merge many compatible HyperLogLog instances at once, each
+        register array is visited only once.
+
+        :param sketches: a non-empty list of HyperLogLog instances
+
+        :return: the union of all the sketches
+        :rtype: HyperLogLog
+        """
+        if len(sketches) == 0:
+            raise ValueError('sketches should not be empty')
+        first = sketches[0]
+        for s in sketches:
+            if s._hash != first._hash:
+                raise ValueError('two instances are not compatible')
+
+        res = copy.deepcopy(first)
+        if all(s._registers is None for s in sketches):
+            extra = [s._encodedSparse() for s in sketches[1:]]
+            res._flush(np.concatenate(extra) if extra else None)
+        else:
+            res._toDense()
+            for s in sketches[1:]:
+                np.maximum(res._registers, s._denseRegisters(),
+                           out=res._registers)
+        return res
+
+
+    def _encodedSparse(self):
+        """
+        Return all the sparse entries, buffered ones included.
+        """
+        return np.concatenate((self._sparse,
+                               np.array(self._buffer, dtype=np.uint32)))
+
+
+    def _flush(self, extra=None):
+        """
+        Move the buffered sparse entries, and the encoded entries in
+        extra, into the sorted sparse list. Switch to the registers if
+        the list becomes too large.
+        """
+        if not self._buffer and extra is None:
+            return
+        enc = self._encodedSparse()
+        if extra is not None:
+            enc = np.concatenate((enc, extra))
+        enc.sort()
+        idx = enc >> np.uint32(6)
+        # keep the largest rank of each index, which sorts last
+        keep = np.ones(len(enc), dtype=bool)
+        keep[:-1] = idx[1:] != idx[:-1]
+        self._sparse = enc[keep]
+        self._buffer = []
+        if len(self._sparse) > self._m >> 2:
+            self._toDense()
+
+
+    def _denseRegisters(self):
+        """
+        Return the registers, computed from the sparse list
+        if necessary.
+        """
+        if self._registers is not None:
+            return self._registers
+        enc = self._encodedSparse()
+        sidx = (enc >> np.uint32(6)).astype(np.uint64)
+        srank = (enc & np.uint32(63)).astype(np.uint8)
+        d = self._SP - self._p
+        pos = (sidx >> np.uint64(d)).astype(np.intp)
+        rest = sidx & np.uint64((1 << d) - 1)
+        rank = np.where(rest > 0, d - utils.bitlength(rest) + 1,
+                        d + srank).astype(np.uint8)
+        registers = np.zeros(self._m, dtype=np.uint8)
+        np.maximum.at(registers, pos, rank)
+        return registers
+
+
+    def _toDense(self):
+        """
+        Convert the sparse representation to registers.
+        """
+        if self._registers is None:
+            self._registers = self._denseRegisters()
+            self._sparse = None
+            self._buffer = None
+
+
+class SlidingHyperLogLog(Sketch):
+    """
+    Sliding HyperLogLog sketch.
+    estimate the number of distinct elements seen in any recent time
+    window of a data stream of (timestamp, element) pairs.
+    """
+    _BUFFERS = ('_times',)
+    _HASHES = ('_hashes',)
+    _STATE = ('_p', '_m', '_window', '_now', '_hash')
+
+    def __init__(self, p=12, window=900):
+        """
+        Create a new instance.
+
+        :param p: precision, the sketch keeps 2^p registers and
+                  the relative standard error is about 1.04 / 2^(p/2)
+        :type p: int
+
+        :param window: default length of the window to estimate on,
+                       in the unit of the timestamps
+        :type window: real
+        """
+        if type(p) is not int:
+            raise TypeError('p should be int')
+        if p < 4 or p > 18:
+            raise ValueError('p should be in [4, 18]')
+
+        self._p = p
+        self._m = 1 << p
+        self._window = window
+        # latest timestamp at which each register saw each rank
+        self._times = np.full((self._m, 64 - p + 2), -np.inf)
+        self._now = -np.inf
+        self._hashes = MurmurHash()
+        self._hash = hash(self)
+
+
+    def processBatch(self, timestamps, items=None):
+        """
+        Summarize the given data stream, chunk by chunk with numpy.
+
+        :param timestamps: numpy array of timestamps, or any iterable
+                           object with (timestamp, element) pairs
+        :param items: numpy array of elements, parallel to timestamps
+        """
+        if items is None:
+            for chunk in utils.chunks(timestamps):
+                t, e = zip(*chunk)
+                self._update(np.asarray(t, dtype=np.float64), e)
+        else:
+            for t, e in zip(utils.chunks(timestamps), utils.chunks(items)):
+                self._update(np.asarray(t, dtype=np.float64), e)
+
+
+    def processItem(self, item):
+        """
+        Summarize the given data stream, but only process one
+        item.
+
+        :param item: a (timestamp, element) pair
+        """
+        t, element = item
+        x = self._hashes.hash64(element)
+        q = 64 - self._p
+        rank = q - (x & ((1 << q) - 1)).bit_length() + 1
+        pos = x >> q
+        if t > self._times[pos, rank]:
+            self._times[pos, rank] = t
+        self._now = max(self._now, t)
+
+
+    def estimate(self, window=None, now=None):
+        """
+        Estimate the number of distinct elements in a time window.
+
+        :param window: length of the window, defaults to the one given
+                       at creation
+        :type window: real
+
+        :param now: current time, defaults to the latest timestamp
+                    seen. Windows ending earlier cannot be estimated.
+        :type now: real
+
+        :return: estimated number of distinct elements with
+                 timestamp in (now - window, now]
+        :rtype: real
+        """
+        window = self._window if window is None else window
+        now = self._now if now is None else now
+        if now < self._now:
+            raise ValueError('now should >= the latest timestamp')
+        inside = self._times > now - window
+        # largest rank seen inside the window, by register
+        last = inside.shape[1] - 1 - np.argmax(inside[:, ::-1], axis=1)
+        registers = np.where(inside.any(axis=1), last, 0).astype(np.uint8)
+        return _ertlEstimate(registers, self._p)
+
+
+    def reproduce(self, num=1):
+        """
+        Reproduce SlidingHyperLogLog instance(s) to have the same
+        internal status.
+
+        :param num: number of instances to be reproduced
+        :type num: int
+
+        :return: reproduced instance. if num > 1, a list 
+                 of instances will be returned
+        """
+        if type(num) is not int:
+            raise TypeError('num should be int')
+        if num < 1:
+            raise ValueError('num should >= 1')
+
+        if num == 1:
+            return copy.deepcopy(self)
+        else:
+            return [copy.deepcopy(self) for i in xrange(num)]
+
+
+    def merge(self, other):
+        """
+        Merge two SlidingHyperLogLog instances if they are compatible.
+
+        :param other: an instance of SlidingHyperLogLog
+        """
+        if other._hash != self._hash:
+            raise ValueError('two instances are not compatible')
+
+        res = copy.deepcopy(self)
+        np.maximum(res._times, other._times, out=res._times)
+        res._now = max(self._now, other._now)
+        return res
+
+
+    def __add__(self, other):
+        """
+        Overload + for self.merge
+        """
+        return self.merge(other)
+
+
+    def _update(self, timestamps, items):
+        """
+        Summarize parallel arrays of timestamps and elements.
+        """
+        pos, rank = _hllPositions(self._hashes.hash64Batch(items), self._p)
+        np.maximum.at(self._times.reshape(-1),
+                      pos * self._times.shape[1] + rank, timestamps)
+        if len(timestamps):
+            self._now = max(self._now, float(timestamps.max()))
+
+
+class KMV(Sketch):
+    """
+    K-Minimum-Values sketch.
+    estimate the number of distinct elements in the data stream, as
+    well as the size of unions and intersections of data streams.
+    """
+    _BUFFERS = ('_values',)
+    _HASHES = ('_hashes',)
+    _STATE = ('_k', '_hash')
+
+    def __init__(self, k=1024):
+        """
+        Create a new instance.
+
+        :param k: the number of smallest hash values to keep, the
+                  relative standard error is about 1 / sqrt(k - 2)
+        :type k: int
+        """
+        if type(k) is not int:
+            raise TypeError('k should be int')
+        if k < 3:
+            raise ValueError('k should >= 3')
+
+        self._k = k
+        # the k smallest hash values seen, sorted and distinct
+        self._values = np.zeros(0, dtype=np.uint64)
+        self._hashes = MurmurHash()
+        self._hash = hash(self)
+
+
+    def processBatch(self, dataStream):
+        """
+        Summarize the given data stream, chunk by chunk with numpy.
+
+        :param dataStream: any iterable object with hashable elements. 
+                           e.g. a list of integers, or a numpy array.
+        """
+        for chunk in utils.chunks(dataStream):
+            h = self._hashes.hash64Batch(chunk)
+            if len(self._values) == self._k:
+                h = h[h < self._values[-1]]
+            self._values = _mergeSorted(self._values, _smallest(h, self._k),
+                                        self._k)
+
+
+    def processItem(self, item):
+        """
+        Summarize the given data stream, but only process one
+        item.
+
+        :param item: hashable object to be processed
+                           e.g. an integer
+        """
+        h = self._hashes.hash64(item)
+        if len(self._values) == self._k and h >= self._values[-1]:
+            return
+        pos = np.searchsorted(self._values, np.uint64(h))
+        if pos < len(self._values) and self._values[pos] == h:
+            return
+        self._values = np.insert(self._values, pos, np.uint64(h))[:self._k]
+
+
+    def estimate(self):
+        """
+        Estimate the number of distinct elements in the stream.
+
+        :return: estimated number of distinct elements
+        :rtype: real
+        """
+        return _kmvEstimate(self._values, self._k)
+
+
+    def union(self, other):
+        """
+        Estimate the number of distinct elements in the union
+        of two streams.
+
+        :param other: a compatible instance of KMV
+
+        :return: estimated number of distinct elements
+        :rtype: real
+        """
+        return self.merge(other).estimate()
+
+
+    def intersection(self, other):
+        """
+        Estimate the number of distinct elements appearing in
+        both streams.
+
+        :param other: a compatible instance of KMV
+
+        :return: estimated number of distinct elements
+        :rtype: real
+        """
+        return self.jaccard(other) * self.union(other)
+
+
+    def jaccard(self, other):
+        """
+        Estimate the jaccard similarity of the two sets of distinct
+        elements.
+
+        :param other: a compatible instance of KMV
+
+        :return: estimated jaccard similarity
+        :rtype: real
+        """
+        union = self.merge(other)._values
+        if len(union) == 0:
+            return 0.
+        both = np.intersect1d(self._values, other._values, assume_unique=True)
+        both = np.count_nonzero(both <= union[-1])
+        return float(both) / len(union)
+
+
+    def reproduce(self, num=1):
+        """
+        Reproduce KMV instance(s) to have the same
+        internal status.
+
+        :param num: number of instances to be reproduced
+        :type num: int
+
+        :return: reproduced instance. if num > 1, a list 
+                 of instances will be returned
+        """
+        if type(num) is not int:
+            raise TypeError('num should be int')
+        if num < 1:
+            raise ValueError('num should >= 1')
+
+        if num == 1:
+            return copy.deepcopy(self)
+        else:
+            return [copy.deepcopy(self) for i in xrange(num)]
+
+
+    def merge(self, other):
+        """
+        Merge two KMV instances if they are compatible, the result
+        summarizes the union of the two streams.
+
+        :param other: an instance of KMV
+        """
+        return KMV.unionAll([self, other])
+
+
+    def __add__(self, other):
+        """
+        Overload + for self.merge
+        """
+        return self.merge(other)
+
+
+    @staticmethod
+    def unionAll(sketches):
+        """
+        Merge many compatible KMV instances at once.
+
+        :param sketches: a non-empty list of KMV instances
+
+        :return: the union of all the sketches, which keeps as
+                 many values as the smallest of them
+        :rtype: KMV
+        """
+        if len(sketches) == 0:
+            raise ValueError('sketches should not be empty')
+        first = sketches[0]
+        for s in sketches:
+            if s._hash != first._hash:
+                raise ValueError('two instances are not compatible')
+
+        res = copy.deepcopy(first)
+        res._k = min(s._k for s in sketches)
+        res._values = res._values[:res._k]
+        for s in sketches[1:]:
+            res._values = _mergeSorted(res._values, s._values, res._k)
+        return res
+
+
+def _kmvEstimate(values, k):
+    """
+    Estimate the number of distinct elements from the (at most) k
+    smallest distinct hash values.
+    """
+    if len(values) < k:
+        return float(len(values))
+    return (k - 1) / (float(values[k - 1]) / 2**64)
+
+
+def _smallest(values, k):
+    """
+    Return the k smallest distinct values, sorted, without sorting
+    all the values.
+    """
+    m = k
+    while m < len(values):
+        part = np.partition(values, m - 1)[:m]
+        res = np.unique(part)
+        if len(res) >= k:
+            return res[:k]
+        m *= 2
+    return np.unique(values)[:k]
+
+
+def _mergeSorted(a, b, k):
+    """
+    Merge two sorted arrays of distinct values and keep the k
+    smallest distinct ones.
+    """
+    a, b = a[:k], b[:k]
+    res = np.empty(len(a) + len(b), dtype=a.dtype)
+    pos = np.searchsorted(a, b) + np.arange(len(b))
+    fromA = np.ones(len(res), dtype=bool)
+    fromA[pos] = False
+    res[pos] = b
+    res[fromA] = a
+    keep = np.ones(len(res), dtype=bool)
+    keep[1:] = res[1:] != res[:-1]
+    return res[keep][:k]
+
+
+class ThetaSketch(Sketch):
+    """
+    Theta sketch.
+    estimate the number of distinct elements in the data stream, and
+    combine sketches with union, intersection and difference.
+    """
+    _BUFFERS = ('_values',)
+    _HASHES = ('_hashes',)
+    _STATE = ('_k', '_theta', '_hash')
+
+    def __init__(self, k=4096):
+        """
+        Create a new instance.
+
+        :param k: nominal number of hash values to keep, the relative
+                  standard error is about 1 / sqrt(k)
+        :type k: int
+        """
+        if type(k) is not int:
+            raise TypeError('k should be int')
+        if k < 2:
+            raise ValueError('k should >= 2')
+
+        self._k = k
+        # all hash values seen below theta, sorted and distinct
+        self._theta = 1 << 64
+        self._values = np.zeros(0, dtype=np.uint64)
+        self._hashes = MurmurHash()
+        self._hash = hash(self)
+
+
+    def processBatch(self, dataStream):
+        """
+        Summarize the given data stream, chunk by chunk with numpy.
+
+        :param dataStream: any iterable object with hashable elements. 
+                           e.g. a list of integers, or a numpy array.
+        """
+        for chunk in utils.chunks(dataStream):
+            h = self._below(self._hashes.hash64Batch(chunk))
+            self._values = _mergeSorted(self._values,
+                                        _smallest(h, self._k + 1),
+                                        self._k + 1)
+            self._trim()
+
+
+    def processItem(self, item):
+        """
+        Summarize the given data stream, but only process one
+        item.
+
+        :param item: hashable object to be processed
+                           e.g. an integer
+        """
+        h = self._hashes.hash64(item)
+        if h >= self._theta:
+            return
+        pos = np.searchsorted(self._values, np.uint64(h))
+        if pos < len(self._values) and self._values[pos] == h:
+            return
+        self._values = np.insert(self._values, pos, np.uint64(h))
+        self._trim()
+
+
+    def estimate(self):
+        """
+        Estimate the number of distinct elements in the stream.
+
+        :return: estimated number of distinct elements
+        :rtype: real
+        """
+        return len(self._values) / self._fraction()
+
+
+    def bounds(self, numStdDev=2):
+        """
+        Approximate confidence interval of the estimation.
+
+        :param numStdDev: width of the interval in standard deviations
+        :type numStdDev: real
+
+        :return: lower and upper bound of the number of
+                 distinct elements
+        :rtype: tuple
+        """
+        p = self._fraction()
+        n = len(self._values)
+        dev = numStdDev * math.sqrt(n * (1. - p)) / p
+        return max(float(n), n / p - dev), n / p + dev
+
+
+    def union(self, other):
+        """
+        Union of two compatible Theta sketches.
+
+        :param other: an instance of ThetaSketch
+
+        :return: a sketch of the distinct elements in either stream
+        :rtype: ThetaSketch
+        """
+        res = self._combine(other)
+        res._values = _mergeSorted(res._below(self._values),
+                                   res._below(other._values), res._k + 1)
+        res._trim()
+        return res
+
+
+    def intersection(self, other):
+        """
+        Intersection of two compatible Theta sketches.
+
+        :param other: an instance of ThetaSketch
+
+        :return: a sketch of the distinct elements in both streams
+        :rtype: ThetaSketch
+        """
+        res = self._combine(other)
+        res._values = np.intersect1d(res._below(self._values),
+                                     res._below(other._values),
+                                     assume_unique=True)
+        res._trim()
+        return res
+
+
+    def difference(self, other):
+        """
+        Difference (A-not-B) of two compatible Theta sketches.
+
+        :param other: an instance of ThetaSketch
+
+        :return: a sketch of the distinct elements in this stream
+                 but not in the other one
+        :rtype: ThetaSketch
+        """
+        res = self._combine(other)
+        res._values = np.setdiff1d(res._below(self._values),
+                                   res._below(other._values),
+                                   assume_unique=True)
+        res._trim()
+        return res
+
+
+    def reproduce(self, num=1):
+        """
+        Reproduce ThetaSketch instance(s) to have the same
+        internal status.
+
+        :param num: number of instances to be reproduced
+        :type num: int
+
+        :return: reproduced instance. if num > 1, a list 
+                 of instances will be returned
+        """
+        if type(num) is not int:
+            raise TypeError('num should be int')
+        if num < 1:
+            raise ValueError('num should >= 1')
+
+        if num == 1:
+            return copy.deepcopy(self)
+        else:
+            return [copy.deepcopy(self) for i in xrange(num)]
+
+
+    def merge(self, other):
+        """
+        Merge two ThetaSketch instances if they are compatible,
+        same as self.union
+
+        :param other: an instance of ThetaSketch
+        """
+        return self.union(other)
+
+
+    def __add__(self, other):
+        """
+        Overload + for self.merge
+        """
+        return self.merge(other)
+
+
+    def __and__(self, other):
+        """
+        Overload & for self.intersection
+        """
+        return self.intersection(other)
+
+
+    def __sub__(self, other):
+        """
+        Overload - for self.difference
+        """
+        return self.difference(other)
+
+
+    def _fraction(self):
+        """
+        theta as a fraction of the hash range.
+        """
+        return self._theta / 2.**64
+
+
+    def _below(self, values):
+        """
+        Return the values smaller than theta.
+        """
+        if self._theta >> 64:
+            return values
+        return values[values < np.uint64(self._theta)]
+
+
+    def _trim(self):
+        """
+        Keep no more than k values, lowering theta to the
+        first dropped one.
+        """
+        if len(self._values) > self._k:
+            self._theta = int(self._values[self._k])
+            self._values = self._values[:self._k]
+
+
+    def _combine(self, other):
+        """
+        Check compatibility and return an empty sketch with the
+        smaller theta of the two.
+        """
+        if other._hash != self._hash:
+            raise ValueError('two instances are not compatible')
+        res = copy.copy(self)
+        res._k = min(self._k, other._k)
+        res._theta = min(self._theta, other._theta)
+        return res
+
+
+class GroupedDistinct(Sketch):
+    """
+    HyperLogLog registers for many groups in one array.
+    estimate the number of distinct elements of each group in a data
+    stream of (group, element) pairs.
+    """
+    _BUFFERS = ('_keys', '_slots', '_groups', '_registers')
+    _HASHES = ('_groupHash', '_itemHash')
+    _STATE = ('_p', '_m', '_hash')
+
+    def __init__(self, p=6, capacity=1024):
+        """
+        Create a new instance.
+
+        :param p: precision, each group keeps 2^p one-byte registers and
+                  the relative standard error is about 1.04 / 2^(p/2)
+        :type p: int
+
+        :param capacity: number of groups to allocate registers for,
+                         doubled whenever more groups show up
+        :type capacity: int
+        """
+        if type(p) is not int:
+            raise TypeError('p should be int')
+        if p < 4 or p > 16:
+            raise ValueError('p should be in [4, 16]')
+
+        self._p = p
+        self._m = 1 << p
+        # sorted hashes of the groups, and the slot of each of them
+        self._keys = np.zeros(0, dtype=np.uint64)
+        self._slots = np.zeros(0, dtype=np.intp)
+        # group of each slot
+        self._groups = None
+        self._registers = np.zeros((max(1, capacity), self._m), dtype=np.uint8)
+        self._groupHash = MurmurHash()
+        self._itemHash = MurmurHash()
+        self._hash = hash(self)
+
+
+    def processBatch(self, groups, items=None):
+        """
+        Summarize the given data stream, chunk by chunk with numpy.
+
+        :param groups: numpy array of group keys, or any iterable
+                       object with (group, element) pairs
+        :param items: numpy array of elements, parallel to groups
+        """
+        if items is None:
+            for chunk in utils.chunks(groups):
+                g, e = zip(*chunk)
+                self._update(g, e)
+        else:
+            for g, e in zip(utils.chunks(groups), utils.chunks(items)):
+                self._update(g, e)
+
+
+    def processItem(self, item):
+        """
+        Summarize the given data stream, but only process one
+        item.
+
+        :param item: a (group, element) pair
+        """
+        group, element = item
+        slot = self._lookup([group], insert=True)[0]
+        x = self._itemHash.hash64(element)
+        q = 64 - self._p
+        rank = q - (x & ((1 << q) - 1)).bit_length() + 1
+        if rank > self._registers[slot, x >> q]:
+            self._registers[slot, x >> q] = rank
+
+
+    def estimate(self, group):
+        """
+        Estimate the number of distinct elements of the given group.
+
+        :param group: key of the group
+
+        :return: estimated number of distinct elements, 0 if
+                 the group never appeared
+        :rtype: real
+        """
+        slot = self._lookup([group])[0]
+        if slot < 0:
+            return 0.
+        return _ertlEstimate(self._registers[slot], self._p)
+
+
+    def top(self, k=10):
+        """
+        Groups with the most distinct elements.
+
+        :param k: number of groups to report
+        :type k: int
+
+        :return: list of (group, estimation) pairs, sorted by
+                 decreasing estimation
+        """
+        n = len(self)
+        if n == 0:
+            return []
+        est = _ertlEstimate(self._registers[:n], self._p)
+        k = min(k, n)
+        best = np.argpartition(-est, k - 1)[:k]
+        best = best[np.argsort(-est[best], kind='mergesort')]
+        return [(self._groups[i], float(est[i])) for i in best]
+
+
+    def __len__(self):
+        """
+        Number of groups seen.
+        """
+        return len(self._keys)
+
+
+    def reproduce(self, num=1):
+        """
+        Reproduce GroupedDistinct instance(s) to have the same
+        internal status.
+
+        :param num: number of instances to be reproduced
+        :type num: int
+
+        :return: reproduced instance. if num > 1, a list 
+                 of instances will be returned
+        """
+        if type(num) is not int:
+            raise TypeError('num should be int')
+        if num < 1:
+            raise ValueError('num should >= 1')
+
+        if num == 1:
+            return copy.deepcopy(self)
+        else:
+            return [copy.deepcopy(self) for i in xrange(num)]
+
+
+    def merge(self, other):
+        """
+        Merge two GroupedDistinct instances if they are compatible.
+
+        :param other: an instance of GroupedDistinct
+        """
+        if other._hash != self._hash:
+            raise ValueError('two instances are not compatible')
+
+        res = copy.deepcopy(self)
+        # hash of the group in each slot of other
+        keys = np.empty(len(other), dtype=np.uint64)
+        keys[other._slots] = other._keys
+        slots = res._find(keys)
+        missing = slots < 0
+        if missing.any():
+            slots[missing] = res._insertKeys(keys[missing],
+                                             other._groups[missing])
+        res._registers[slots] = np.maximum(res._registers[slots],
+                                           other._registers[:len(other)])
+        return res
+
+
+    def __add__(self, other):
+        """
+        Overload + for self.merge
+        """
+        return self.merge(other)
+
+
+    def _update(self, groups, items):
+        """
+        Summarize parallel arrays of groups and elements.
+        """
+        slots = self._lookup(groups, insert=True)
+        pos, rank = _hllPositions(self._itemHash.hash64Batch(items), self._p)
+        np.maximum.at(self._registers.reshape(-1), slots * self._m + pos, rank)
+
+
+    def _lookup(self, groups, insert=False):
+        """
+        Return the slot of each group, -1 for unknown groups unless
+        they are inserted.
+        """
+        h = self._groupHash.hash64Batch(groups)
+        slots = self._find(h)
+        missing = slots < 0
+        if insert and missing.any():
+            new, first, inverse = np.unique(h[missing], return_index=True,
+                                            return_inverse=True)
+            labels = _asArray(groups)[missing][first]
+            slots[missing] = self._insertKeys(new, labels)[inverse]
+        return slots
+
+
+    def _find(self, h):
+        """
+        Return the slot of each group hash, -1 for unknown ones.
+        """
+        if len(self._keys) == 0:
+            return np.full(len(h), -1, dtype=np.intp)
+        pos = np.minimum(np.searchsorted(self._keys, h), len(self._keys) - 1)
+        return np.where(self._keys[pos] == h, self._slots[pos], -1)
+
+
+    def _insertKeys(self, h, labels):
+        """
+        Give new slots to distinct, unknown group hashes.
+        """
+        n = len(self._keys)
+        slots = np.arange(n, n + len(h))
+        order = np.argsort(h)
+        pos = np.searchsorted(self._keys, h[order])
+        self._keys = np.insert(self._keys, pos, h[order])
+        self._slots = np.insert(self._slots, pos, slots[order])
+        if self._groups is None:
+            self._groups = labels.copy()
+        elif self._groups.dtype == labels.dtype:
+            self._groups = np.concatenate((self._groups, labels))
+        else:
+            self._groups = np.concatenate((self._groups.astype(object),
+                                           labels.astype(object)))
+        capacity = len(self._registers)
+        if capacity < len(self._keys):
+            while capacity < len(self._keys):
+                capacity *= 2
+            registers = np.zeros((capacity, self._m), dtype=np.uint8)
+            registers[:n] = self._registers[:n]
+            self._registers = registers
+        return slots
+
+
+def _asArray(items):
+    """
+    Return the items as a numpy array, keeping non numerical
+    items as python objects.
+    """
+    if isinstance(items, np.ndarray):
+        return items
+    arr = np.asarray(items)
+    if arr.ndim == 1 and arr.dtype.kind in 'iufb':
+        return arr
+    arr = np.empty(len(items), dtype=object)
+    for i, item in enumerate(items):
+        arr[i] = item
+    return arr
+
+
+class BJKST(Sketch):
+    """
+    BJKST sketch.
+    estimate the number of distinct elements in the data stream.
+    each repetition keeps its own buffer of (fingerprint, level) pairs
+    in an open-addressing table with less than c/eps^2 entries.
+    """
+    _BUFFERS = ('_keys', '_levels')
+    _HASHES = ('h_hashes', 'g_hashes')
+    _STATE = ('n', 'b', 'c', 'eps', 'mu', '_thresh', '_g', '_bits',
+              '_empty', '_count', 'sketch', 'hash')
+
+    # multiplier of the fibonacci hashing used to place fingerprints
+    _GOLDEN = np.uint64(0x9e3779b97f4a7c15)
+
+    def __init__(self, n=20, mu=5, c=1, eps=.1, b=1, typecode='i'):
+        """
+        Create a new instance.
+
+        :param n: The size of the universe.
+        :type n: int
+
+        :param mu: The number of repeated copies. Used to control the
+                   failure probability ~= 2^{-mu}
+        :type mu: int
+
+        :param c: constant of the buffer size c/eps^2
+        :type c: real
+
+        :param eps: control the quality of estimation
+        :type eps: real
+
+        :param b: constant of the fingerprint range b * log(n)^2 / eps^4
+        :type b: real
+
+        :param typecode: not used, kept for compatibility
+        """
+        self.n = n
+        self.b = b
+        self.c = c
+        self.eps = eps
+        self.mu = mu
+        # a buffer is shrunk as soon as it holds thresh entries
+        self._thresh = max(1, int(math.ceil(c / eps**2)))
+        self._g = int(b * math.log(n, 2)**2 * eps**(-4) + 1)
+        self._bits = (2 * self._thresh - 1).bit_length()
+        dtype = np.uint32 if self._g < (1 << 32) - 1 else np.uint64
+        self._empty = np.iinfo(dtype).max
+        self._keys = np.full((mu, 1 << self._bits), self._empty, dtype=dtype)
+        self._levels = np.zeros((mu, 1 << self._bits), dtype=np.uint8)
+        self._count = [0 for i in xrange(mu)]
+        self.sketch = [0 for i in xrange(mu)]
+        self.h_hashes = [MurmurHash() for i in xrange(mu)]
+        self.g_hashes = [MurmurHash() for i in xrange(mu)]
+        self.hash = hash(self)
+
+    def processBatch(self, dataStream):
+        """
+        Summarize the given data stream, chunk by chunk with numpy.
+
+        :param dataStream: any iterable object with hashable elements. 
+                           e.g. a list of integers, or a numpy array.
+        """
+        g = np.uint64(self._g)
+        for chunk in utils.chunks(dataStream):
+            for i in xrange(self.mu):
+                levels = utils.zerosBatch(self.h_hashes[i].hash64Batch(chunk))
+                new = levels >= self.sketch[i]
+                if not new.any():
+                    continue
+                keys = self.g_hashes[i].hash64Batch(chunk)[new] % g
+                keys, levels = _maxPerKey(keys.astype(self._keys.dtype),
+                                          levels[new].astype(np.uint8))
+                if self._count[i] + len(keys) < self._thresh:
+                    self._insert(i, keys, levels)
+                else:
+                    occupied = self._keys[i] != self._empty
+                    self._rebuild(i, *_maxPerKey(
+                        np.concatenate((self._keys[i][occupied], keys)),
+                        np.concatenate((self._levels[i][occupied], levels))))
+
+    def processItem(self, item):
+        """
+        Summarize the given data stream, but only process one
+        item.
+
+        :param item: hashable object to be processed
+                           e.g. an integer
+        """
+        mask = (1 << self._bits) - 1
+        for i in xrange(self.mu):
+            level = utils.zeros(self.h_hashes[i].hash64(item))
+            if level < self.sketch[i]:
+                continue
+            key = self.g_hashes[i].hash64(item) % self._g
+            keys = self._keys[i]
+            pos = self._slot(key)
+            while keys[pos] != self._empty and keys[pos] != key:
+                pos = (pos + 1) & mask
+            if keys[pos] == key:
+                self._levels[i][pos] = max(self._levels[i][pos], level)
+            else:
+                keys[pos] = key
+                self._levels[i][pos] = level
+                self._count[i] += 1
+                if self._count[i] >= self._thresh:
+                    occupied = keys != self._empty
+                    self._rebuild(i, keys[occupied],
+                                  self._levels[i][occupied])
+
+    def estimate(self):
+        """
+        Estimate the number of distinct elements in the stream.
+
+        :return: estimated number of distinct elements
+        :rtype: int
+        """
+        return utils.median([self._count[i] * 2**self.sketch[i]
+                             for i in xrange(self.mu)])
+
+    def reproduce(self, num=1):
+        """
+        Reproduce BJKST instance(s) to have the same
+        internal status.
+
+        :param num: number of instances to be reproduced
+        :type num: int
+
+        :return: reproduced instance. if num > 1, a list 
+                 of instances will be returned
+        """
+        if type(num) is not int:
+            raise TypeError('num should be int')
+        if num < 1:
+            raise ValueError('num should >= 1')
+
+        if num == 1:
+            return copy.deepcopy(self)
+        else:
+            return [copy.deepcopy(self) for i in xrange(num)]
+
+    def merge(self, other):
+        """
+        Merge two BJKST instances if they are compatible.
+
+        :param other: an instance of BJKST
+        """
+        if other.hash != self.hash:
+            raise ValueError('two instances are not compatible')
+
+        res = copy.deepcopy(self)
+        for i in xrange(self.mu):
+            res.sketch[i] = max(self.sketch[i], other.sketch[i])
+            mine = self._keys[i] != self._empty
+            theirs = other._keys[i] != other._empty
+            res._rebuild(i, *_maxPerKey(
+                np.concatenate((self._keys[i][mine], other._keys[i][theirs])),
+                np.concatenate((self._levels[i][mine],
+                                other._levels[i][theirs]))))
+        return res
+
+    def __add__(self, other):
+        """
+        Overload + for self.merge
+        """
+        return self.merge(other)
+
+    def _slot(self, keys):
+        """
+        Home slot(s) of the given fingerprint(s) in a buffer.
+        """
+        if isinstance(keys, np.ndarray):
+            h = keys.astype(np.uint64) * self._GOLDEN
+            return (h >> np.uint64(64 - self._bits)).astype(np.intp)
+        return ((keys * int(self._GOLDEN)) & ((1 << 64) - 1)) >> (64 - self._bits)
+
+    def _insert(self, i, keys, levels):
+        """
+        Insert distinct fingerprints into the i-th buffer, keeping the
+        larger level for the ones already there.
+        """
+        mask = (1 << self._bits) - 1
+        rowKeys, rowLevels = self._keys[i], self._levels[i]
+        pos = self._slot(keys)
+        while len(keys):
+            current = rowKeys[pos]
+            hit = current == keys
+            rowLevels[pos[hit]] = np.maximum(rowLevels[pos[hit]], levels[hit])
+            # several fingerprints may probe the same empty slot,
+            # the first of them takes it
+            free = np.flatnonzero(current == self._empty)
+            free = free[np.unique(pos[free], return_index=True)[1]]
+            rowKeys[pos[free]] = keys[free]
+            rowLevels[pos[free]] = levels[free]
+            self._count[i] += len(free)
+            left = ~hit
+            left[free] = False
+            keys, levels, pos = keys[left], levels[left], (pos[left] + 1) & mask
+
+    def _rebuild(self, i, keys, levels):
+        """
+        Refill the i-th buffer with distinct fingerprints, raising the
+        level until less than c/eps^2 of them remain.
+        """
+        z = self.sketch[i]
+        while np.count_nonzero(levels >= z) >= self._thresh:
+            z += 1
+        keep = levels >= z
+        self.sketch[i] = z
+        self._keys[i].fill(self._empty)
+        self._levels[i].fill(0)
+        self._count[i] = 0
+        self._insert(i, keys[keep], levels[keep])
+
+
+def _maxPerKey(keys, levels):
+    """
+    Deduplicate keys, keeping the largest level of each.
+    """
+    order = np.lexsort((levels, keys))
+    keys, levels = keys[order], levels[order]
+    last = np.ones(len(keys), dtype=bool)
+    last[:-1] = keys[1:] != keys[:-1]
+    return keys[last], levels[last]
+
+
+def _checkIntegers(weights):
+    """
+    Raise TypeError unless the weight(s) are integers, e.g. 3 or
+    3.0, as they are added to integer counters.
+    """
+    if isinstance(weights, (int, long)):
+        return
+    weights = np.asarray(weights)
+    if weights.dtype.kind not in 'biu' and (np.mod(weights, 1) != 0).any():
+        raise TypeError('weights should be integers')
+
+
+class Quantile(Sketch):
+    """
+    Deterministic quantile sketch with geometric buckets.
+    give (1 + eps)-approximations to the k-th smallest item of a data
+    stream with all items in [a, b]. Mergeable.
+    """
+    _BUFFERS = ('_bounds', '_counts', '_cum')
+    _STATE = ('_eps', '_a', '_b', '_n')
+
+    def __init__(self, eps=0.01, a=0, b=1):
+        """
+        Create a new instance.
+
+        :param eps: control the quality of estimation
+        :type eps: real
+
+        :param a: lower bound of the items
+        :type a: real
+
+        :param b: upper bound of the items. Items outside [a, b]
+                  are counted in the first or the last bucket.
+        :type b: real
+        """
+        if eps <= 0:
+            raise ValueError('eps should > 0')
+        if b <= a:
+            raise ValueError('b should > a')
+
+        self._eps = eps
+        self._a = a
+        self._b = b
+        # bucket i counts the items in [bounds[i - 1], bounds[i]),
+        # where bounds[i] = a - 1 + (1 + eps)^i covers [a, a + 2 * (b - a)]
+        num = int(math.floor(math.log(2 * (b - a) + 1) / math.log1p(eps))) + 1
+        self._bounds = a - 1 + np.exp(np.arange(num) * math.log1p(eps))
+        self._counts = np.zeros(num, dtype=np.int64)
+        # prefix sums of the counts, computed on demand
+        self._cum = None
+        self._n = 0
+
+
+    def processBatch(self, dataStream, weighted=False, weights=None):
+        """
+        Summarize the given data stream, chunk by chunk with numpy.
+
+        :param dataStream: any iterable object with numbers.
+                           e.g. a list of integers, or a numpy array.
+        :param weighted: if weighted, each item in dataStream should
+                         be (value, weight) pair, where weight is an
+                         integer > 0
+        :param weights: integer weights > 0, parallel to dataStream
+        """
+        if weights is not None:
+            chunks = zip(utils.chunks(dataStream), utils.chunks(weights))
+        elif weighted:
+            chunks = (zip(*chunk) for chunk in utils.chunks(dataStream))
+        else:
+            chunks = ((chunk, None) for chunk in utils.chunks(dataStream))
+        for values, w in chunks:
+            if w is not None:
+                _checkIntegers(w)
+            pos = np.searchsorted(self._bounds, values, side='right')
+            np.minimum(pos, len(self._bounds) - 1, out=pos)
+            counts = np.bincount(pos, weights=w, minlength=len(self._bounds))
+            counts = counts.astype(np.int64)
+            self._counts += counts
+            self._n += int(counts.sum())
+        self._cum = None
+
+
+    def processItem(self, item, weighted=False):
+        """
+        Summarize the given data stream, but only process one
+        item.
+
+        :param item: number to be processed
+        :param weighted: if weighted, item should be a (value, weight)
+                         pair, where weight is an integer > 0
+        """
+        value, weight = item if weighted else (item, 1)
+        _checkIntegers(weight)
+        pos = min(bisect_right(self._bounds, value), len(self._bounds) - 1)
+        self._counts[pos] += weight
+        self._n += int(weight)
+        self._cum = None
+
+
+    def estimate(self, k):
+        """
+        Estimate the k-th smallest item.
+
+        :param k: rank of the item, between 1 and the number of items
+        :type k: int
+
+        :return: (1 + eps)-approximation of the k-th smallest item
+        :rtype: real
+        """
+        if k < 1 or k > self._n:
+            raise ValueError('k should be between [1, n]')
+        return float(self._bounds[np.searchsorted(self._prefix(), k)])
+
+
+    def quantiles(self, phis):
+        """
+        Estimate many quantiles at once.
+
+        :param phis: fractions in [0, 1], e.g. [.5, .9, .99]
+
+        :return: estimated quantiles
+        :rtype: numpy.ndarray
+        """
+        if self._n == 0:
+            raise ValueError('no item has been processed')
+        ks = np.clip(np.ceil(np.asarray(phis, dtype=np.float64) * self._n),
+                     1, self._n)
+        return self._bounds[np.searchsorted(self._prefix(), ks)]
+
+
+    def ranks(self, values):
+        """
+        Estimate the number of items no larger than each value.
+
+        :param values: numbers, e.g. [10, 100, 1000]
+
+        :return: estimated ranks
+        :rtype: numpy.ndarray
+        """
+        pos = np.minimum(np.searchsorted(self._bounds, values, side='right'),
+                         len(self._bounds) - 1)
+        return self._prefix()[pos]
+
+
+    def cdf(self, values):
+        """
+        Estimate the fraction of items no larger than each value.
+
+        :param values: numbers, e.g. [10, 100, 1000]
+
+        :return: estimated fractions
+        :rtype: numpy.ndarray
+        """
+        return self.ranks(values) / float(max(self._n, 1))
+
+
+    def reproduce(self, num=1):
+        """
+        Reproduce Quantile instance(s) to have the same
+        internal status.
+
+        :param num: number of instances to be reproduced
+        :type num: int
+
+        :return: reproduced instance. if num > 1, a list 
+                 of instances will be returned
+        """
+        if type(num) is not int:
+            raise TypeError('num should be int')
+        if num < 1:
+            raise ValueError('num should >= 1')
+
+        if num == 1:
+            return copy.deepcopy(self)
+        else:
+            return [copy.deepcopy(self) for i in xrange(num)]
+
+
+    def merge(self, other):
+        """
+        Merge two Quantile instances if they are compatible.
+
+        :param other: an instance of Quantile with the same eps, a and b
+        """
+        if (other._eps, other._a, other._b) != (self._eps, self._a, self._b):
+            raise ValueError('two instances are not compatible')
+
+        res = copy.deepcopy(self)
+        res._counts += other._counts
+        res._n += other._n
+        res._cum = None
+        return res
+
+
+    def __add__(self, other):
+        """
+        Overload + for self.merge
+        """
+        return self.merge(other)
+
+
+    def _prefix(self):
+        """
+        Return the prefix sums of the counts.
+        """
+        if self._cum is None:
+            self._cum = np.cumsum(self._counts)
+        return self._cum
+
+
+class _BucketStore(object):
+    """
+    Contiguous counts of integer-indexed buckets, for DDSketch. The
+    lowest buckets are collapsed to keep at most maxBuckets of them.
+    """
+    def __init__(self, maxBuckets):
+        self.maxBuckets = maxBuckets
+        self.offset = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def add(self, indices, weights=None):
+        """
+        Add the weights (1 by default) to the buckets of the indices.
+        """
+        if len(indices) == 0:
+            return
+        lo, hi = int(indices.min()), int(indices.max())
+        if lo < self.offset or hi >= self.offset + len(self.counts):
+            self._resize(lo, hi)
+        pos = np.maximum(indices, self.offset) - self.offset
+        self.counts += np.bincount(pos, weights=weights,
+                                   minlength=len(self.counts)).astype(np.int64)
+
+    def addOne(self, index, weight=1):
+        """
+        Add the weight to the bucket of the index.
+        """
+        if index < self.offset or index >= self.offset + len(self.counts):
+            self._resize(index, index)
+        self.counts[max(index, self.offset) - self.offset] += weight
+
+    def _resize(self, lo, hi):
+        """
+        Cover the buckets lo to hi, collapsing the lowest ones if
+        there are too many.
+        """
+        if len(self.counts):
+            lo = min(lo, self.offset)
+            hi = max(hi, self.offset + len(self.counts) - 1)
+        lo = max(lo, hi - self.maxBuckets + 1)
+        counts = np.zeros(hi - lo + 1, dtype=np.int64)
+        if len(self.counts):
+            old = np.arange(self.offset, self.offset + len(self.counts))
+            counts += np.bincount(np.maximum(old, lo) - lo, weights=self.counts,
+                                  minlength=len(counts)).astype(np.int64)
+        self.offset = lo
+        self.counts = counts
+
+
+class DDSketch(Sketch):
+    """
+    DDSketch, quantile sketch with relative error guarantee.
+    estimate the quantiles of a data stream of numbers in any range,
+    the estimations are within a factor of (1 +- alpha) of the exact ones.
+    """
+    # the bucket stores are written flat, see _parts
+    _BUFFERS = ('_positiveCounts', '_negativeCounts')
+    _STATE = ('_alpha', '_gamma', '_logGamma', '_maxBuckets',
+              '_positiveOffset', '_negativeOffset', '_zero', '_n')
+
+    def __init__(self, alpha=0.01, maxBuckets=2048):
+        """
+        Create a new instance.
+
+        :param alpha: relative accuracy of the estimations
+        :type alpha: real
+
+        :param maxBuckets: maximal number of buckets for each of positive
+                           and negative numbers. The buckets of the
+                           smallest magnitudes collapse beyond that.
+        :type maxBuckets: int
+        """
+        if not 0 < alpha < 1:
+            raise ValueError('alpha should be in (0, 1)')
+        if maxBuckets < 1:
+            raise ValueError('maxBuckets should >= 1')
+
+        self._alpha = alpha
+        self._gamma = (1. + alpha) / (1. - alpha)
+        self._logGamma = math.log(self._gamma)
+        self._positive = _BucketStore(maxBuckets)
+        self._negative = _BucketStore(maxBuckets)
+        self._zero = 0
+        self._n = 0
+
+
+    def processBatch(self, dataStream, weighted=False, weights=None):
+        """
+        Summarize the given data stream, chunk by chunk with numpy.
+
+        :param dataStream: any iterable object with numbers.
+                           e.g. a list of integers, or a numpy array.
+        :param weighted: if weighted, each item in dataStream should
+                         be (value, weight) pair, where weight is an
+                         integer > 0
+        :param weights: integer weights > 0, parallel to dataStream
+        """
+        if weights is not None:
+            chunks = zip(utils.chunks(dataStream), utils.chunks(weights))
+        elif weighted:
+            chunks = (zip(*chunk) for chunk in utils.chunks(dataStream))
+        else:
+            chunks = ((chunk, None) for chunk in utils.chunks(dataStream))
+        for values, w in chunks:
+            if w is not None:
+                _checkIntegers(w)
+            values = np.asarray(values, dtype=np.float64)
+            w = np.ones(len(values), dtype=np.int64) if w is None \
+                else np.asarray(w, dtype=np.int64)
+            for store, sign in ((self._positive, 1), (self._negative, -1)):
+                mask = sign * values > 0
+                store.add(self._index(sign * values[mask]), w[mask])
+            self._zero += int(w[values == 0].sum())
+            self._n += int(w.sum())
+
+
+    def processItem(self, item, weighted=False):
+        """
+        Summarize the given data stream, but only process one
+        item.
+
+        :param item: number to be processed
+        :param weighted: if weighted, item should be a (value, weight)
+                         pair, where weight is an integer > 0
+        """
+        value, weight = item if weighted else (item, 1)
+        _checkIntegers(weight)
+        weight = int(weight)
+        if value > 0:
+            self._positive.addOne(self._index(value), weight)
+        elif value < 0:
+            self._negative.addOne(self._index(-value), weight)
+        else:
+            self._zero += weight
+        self._n += weight
+
+
+    def estimate(self, k):
+        """
+        Estimate the k-th smallest item.
+
+        :param k: rank of the item, between 1 and the number of items
+        :type k: int
+
+        :return: estimation within a factor (1 +- alpha) of
+                 the k-th smallest item
+        :rtype: real
+        """
+        if k < 1 or k > self._n:
+            raise ValueError('k should be between [1, n]')
+        values, cum = self._buckets()
+        return float(values[np.searchsorted(cum, k)])
+
+
+    def quantiles(self, phis):
+        """
+        Estimate many quantiles at once.
+
+        :param phis: fractions in [0, 1], e.g. [.5, .9, .99]
+
+        :return: estimated quantiles
+        :rtype: numpy.ndarray
+        """
+        if self._n == 0:
+            raise ValueError('no item has been processed')
+        ks = np.clip(np.ceil(np.asarray(phis, dtype=np.float64) * self._n),
+                     1, self._n)
+        values, cum = self._buckets()
+        return values[np.searchsorted(cum, ks)]
+
+
+    def cdf(self, values):
+        """
+        Estimate the fraction of items no larger than each value.
+
+        :param values: numbers, e.g. [10, 100, 1000]
+
+        :return: estimated fractions
+        :rtype: numpy.ndarray
+        """
+        buckets, cum = self._buckets()
+        pos = np.searchsorted(buckets, values, side='right')
+        cum = np.concatenate(([0], cum))
+        return cum[pos] / float(max(self._n, 1))
+
+
+    def reproduce(self, num=1):
+        """
+        Reproduce DDSketch instance(s) to have the same
+        internal status.
+
+        :param num: number of instances to be reproduced
+        :type num: int
+
+        :return: reproduced instance. if num > 1, a list 
+                 of instances will be returned
+        """
+        if type(num) is not int:
+            raise TypeError('num should be int')
+        if num < 1:
+            raise ValueError('num should >= 1')
+
+        if num == 1:
+            return copy.deepcopy(self)
+        else:
+            return [copy.deepcopy(self) for i in xrange(num)]
+
+
+    def merge(self, other):
+        """
+        Merge two DDSketch instances if they are compatible, the
+        result is the same as summarizing both streams at once.
+
+        :param other: an instance of DDSketch with the same alpha
+        """
+        if other._alpha != self._alpha:
+            raise ValueError('two instances are not compatible')
+
+        res = copy.deepcopy(self)
+        for mine, theirs in ((res._positive, other._positive),
+                             (res._negative, other._negative)):
+            mine.add(np.arange(theirs.offset, theirs.offset + len(theirs.counts)),
+                     theirs.counts)
+        res._zero += other._zero
+        res._n += other._n
+        return res
+
+
+    def __add__(self, other):
+        """
+        Overload + for self.merge
+        """
+        return self.merge(other)
+
+
+    def _parts(self):
+        flat = copy.copy(self)
+        for name in ('_positive', '_negative'):
+            store = getattr(self, name)
+            setattr(flat, name + 'Counts', store.counts)
+            setattr(flat, name + 'Offset', store.offset)
+        flat._maxBuckets = self._positive.maxBuckets
+        return super(DDSketch, flat)._parts()
+
+
+    @classmethod
+    def fromBytes(cls, data):
+        res = super(DDSketch, cls).fromBytes(data)
+        for name in ('_positive', '_negative'):
+            store = _BucketStore(res._maxBuckets)
+            store.counts = res.__dict__.pop(name + 'Counts')
+            store.offset = res.__dict__.pop(name + 'Offset')
+            setattr(res, name, store)
+        del res._maxBuckets
+        return res
+
+
+    def _index(self, values):
+        """
+        Bucket index of positive number(s), bucket i holds the
+        numbers in (gamma^(i - 1), gamma^i].
+        """
+        if isinstance(values, np.ndarray):
+            return np.ceil(np.log(values) / self._logGamma).astype(np.int64)
+        return int(math.ceil(math.log(values) / self._logGamma))
+
+
+    def _buckets(self):
+        """
+        Representative value of every bucket in increasing order,
+        and the cumulative counts.
+        """
+        def value(store):
+            i = np.arange(store.offset, store.offset + len(store.counts))
+            return 2. * self._gamma**i / (self._gamma + 1.)
+        values = np.concatenate((-value(self._negative)[::-1], [0.],
+                                 value(self._positive)))
+        counts = np.concatenate((self._negative.counts[::-1], [self._zero],
+                                 self._positive.counts))
+        return values, np.cumsum(counts)
+
+
+class KLL(Sketch):
+    """
+    KLL quantile sketch.
+    estimate the quantiles of a data stream of comparable items with
+    rank error about 1.7 / k, with O(k) items kept. only sketches of
+    numbers can be serialized with toBytes, other items are python
+    objects.
+    """
+    # ratio between the capacities of consecutive levels
+    _C = 2. / 3
+    # the levels are written one after the other, see _parts
+    _BUFFERS = ('_items',)
+    _STATE = ('_k', '_n', '_sizes')
+
+    def __init__(self, k=200):
+        """
+        Create a new instance.
+
+        :param k: capacity of the top level, control the quality
+                  of estimation
+        :type k: int
+        """
+        if type(k) is not int:
+            raise TypeError('k should be int')
+        if k < 2:
+            raise ValueError('k should >= 2')
+
+        self._k = k
+        # items of level h have weight 2^h, levels above 0 are sorted
+        self._levels = [None]
+        self._buffer = []
+        self._n = 0
+
+
+    def processBatch(self, dataStream):
+        """
+        Summarize the given data stream, chunk by chunk with numpy.
+
+        :param dataStream: any iterable object with comparable items.
+                           e.g. a list of strings, or a numpy array.
+        """
+        for chunk in utils.chunks(dataStream):
+            self._levels[0] = _concat(self._levels[0], _asArray(chunk))
+            self._n += len(chunk)
+            self._compress()
+
+
+    def processItem(self, item):
+        """
+        Summarize the given data stream, but only process one
+        item.
+
+        :param item: comparable item to be processed
+        """
+        self._buffer.append(item)
+        self._n += 1
+        if len(self._buffer) >= self._capacity(0):
+            self._flush()
+
+
+    def estimate(self, k):
+        """
+        Estimate the k-th smallest item.
+
+        :param k: rank of the item, between 1 and the number of items
+        :type k: int
+
+        :return: an item whose rank is close to k
+        """
+        if k < 1 or k > self._n:
+            raise ValueError('k should be between [1, n]')
+        items, cum = self._sorted()
+        return items[np.searchsorted(cum, k)]
+
+
+    def quantiles(self, phis):
+        """
+        Estimate many quantiles at once.
+
+        :param phis: fractions in [0, 1], e.g. [.5, .9, .99]
+
+        :return: estimated quantiles
+        :rtype: numpy.ndarray
+        """
+        if self._n == 0:
+            raise ValueError('no item has been processed')
+        ks = np.clip(np.ceil(np.asarray(phis, dtype=np.float64) * self._n),
+                     1, self._n)
+        items, cum = self._sorted()
+        return items[np.searchsorted(cum, ks)]
+
+
+    def cdf(self, values):
+        """
+        Estimate the fraction of items no larger than each value.
+
+        :param values: items to compare with
+
+        :return: estimated fractions
+        :rtype: numpy.ndarray
+        """
+        items, cum = self._sorted()
+        pos = np.searchsorted(items, _asArray(values), side='right')
+        cum = np.concatenate(([0], cum))
+        return cum[pos] / float(max(self._n, 1))
+
+
+    def __len__(self):
+        """
+        Number of items kept.
+        """
+        self._flush()
+        return sum(len(level) for level in self._levels if level is not None)
+
+
+    def reproduce(self, num=1):
+        """
+        Reproduce KLL instance(s) to have the same
+        internal status.
+
+        :param num: number of instances to be reproduced
+        :type num: int
+
+        :return: reproduced instance. if num > 1, a list 
+                 of instances will be returned
+        """
+        if type(num) is not int:
+            raise TypeError('num should be int')
+        if num < 1:
+            raise ValueError('num should >= 1')
+
+        if num == 1:
+            return copy.deepcopy(self)
+        else:
+            return [copy.deepcopy(self) for i in xrange(num)]
+
+
+    def merge(self, other):
+        """
+        Merge two KLL instances if they are compatible.
+
+        :param other: an instance of KLL with the same k
+        """
+        if other._k != self._k:
+            raise ValueError('two instances are not compatible')
+
+        res = copy.deepcopy(self)
+        res._flush()
+        other = copy.deepcopy(other)
+        other._flush()
+        for h, level in enumerate(other._levels):
+            if h == len(res._levels):
+                res._levels.append(None)
+            res._levels[h] = _concat(res._levels[h], level)
+            if h > 0 and res._levels[h] is not None:
+                res._levels[h].sort(kind='mergesort')
+        res._n += other._n
+        res._compress()
+        return res
+
+
+    def __add__(self, other):
+        """
+        Overload + for self.merge
+        """
+        return self.merge(other)
+
+
+    def _parts(self):
+        self._flush()
+        flat = copy.copy(self)
+        levels = [level for level in self._levels if level is not None]
+        flat._items = np.concatenate(levels) if levels else None
+        flat._sizes = [None if level is None else len(level)
+                       for level in self._levels]
+        return super(KLL, flat)._parts()
+
+
+    @classmethod
+    def fromBytes(cls, data):
+        res = super(KLL, cls).fromBytes(data)
+        items, offset = res.__dict__.pop('_items'), 0
+        res._levels = []
+        for size in res.__dict__.pop('_sizes'):
+            res._levels.append(None if size is None
+                               else items[offset:offset + size])
+            offset += size or 0
+        res._buffer = []
+        return res
+
+
+    def _capacity(self, h):
+        """
+        Capacity of level h.
+        """
+        depth = len(self._levels) - 1 - h
+        return max(2, int(math.ceil(self._k * self._C**depth)))
+
+
+    def _flush(self):
+        """
+        Move the items processed one by one to level 0.
+        """
+        if self._buffer:
+            self._levels[0] = _concat(self._levels[0], _asArray(self._buffer))
+            self._buffer = []
+            self._compress()
+
+
+    def _compress(self):
+        """
+        Compact the levels over capacity: every other item of the
+        sorted level, at a random offset, moves one level up.
+        """
+        h = 0
+        while h < len(self._levels):
+            level = self._levels[h]
+            if level is None or len(level) < self._capacity(h):
+                h += 1
+                continue
+            if h + 1 == len(self._levels):
+                self._levels.append(None)
+            level = np.sort(level, kind='mergesort')
+            # with an odd number of items, the first one stays
+            odd = len(level) % 2
+            up = level[odd + randint(0, 1)::2]
+            self._levels[h] = level[:odd]
+            upper = _concat(self._levels[h + 1], up)
+            upper.sort(kind='mergesort')
+            self._levels[h + 1] = upper
+            # capacities change when a level is added
+            h = 0
+
+
+    def _sorted(self):
+        """
+        All items kept in increasing order, and their
+        cumulative weights.
+        """
+        self._flush()
+        items = [level for level in self._levels if level is not None]
+        weights = [np.full(len(level), 1 << h, dtype=np.int64)
+                   for h, level in enumerate(self._levels) if level is not None]
+        if not items:
+            return np.zeros(0), np.zeros(0, dtype=np.int64)
+        items = np.concatenate(items)
+        order = np.argsort(items, kind='mergesort')
+        return items[order], np.cumsum(np.concatenate(weights)[order])
+
+
+def _concat(a, b):
+    """
+    Concatenate two numpy arrays, either of which may be None.
+    """
+    if a is None:
+        return None if b is None else b.copy()
+    if b is None:
+        return a
+    if a.dtype != b.dtype and (a.dtype == object or b.dtype == object):
+        return np.concatenate((a.astype(object), b.astype(object)))
+    return np.concatenate((a, b))
+
+
+class TDigest(Sketch):
+    """
+    Merging t-digest.
+    estimate the quantiles of a data stream of numbers, with high
+    accuracy at the extreme quantiles, e.g. p99.9 and p99.99
+    """
+    _BUFFERS = ('_means', '_weights')
+    _STATE = ('_delta', '_bufferSize', '_chunks', '_items', '_buffered',
+              '_min', '_max')
+
+    def __init__(self, delta=200, bufferSize=None):
+        """
+        Create a new instance.
+
+        :param delta: compression, the digest keeps O(delta) centroids
+        :type delta: int
+
+        :param bufferSize: number of items buffered before they are
+                           merged into the centroids, 10 * delta
+                           by default
+        :type bufferSize: int
+        """
+        if delta < 10:
+            raise ValueError('delta should >= 10')
+
+        self._delta = delta
+        self._bufferSize = 10 * delta if bufferSize is None else bufferSize
+        # centroids sorted by mean
+        self._means = np.zeros(0)
+        self._weights = np.zeros(0)
+        # buffered (values, weights) arrays, and (value, weight) pairs
+        self._chunks = []
+        self._items = []
+        self._buffered = 0
+        self._min = float('inf')
+        self._max = float('-inf')
+
+
+    def processBatch(self, dataStream, weighted=False, weights=None):
+        """
+        Summarize the given data stream, chunk by chunk with numpy.
+
+        :param dataStream: any iterable object with numbers.
+                           e.g. a list of integers, or a numpy array.
+        :param weighted: if weighted, each item in dataStream should
+                         be (value, weight) pair, where weight > 0
+        :param weights: weights > 0, parallel to dataStream
+        """
+        if weights is not None:
+            chunks = zip(utils.chunks(dataStream), utils.chunks(weights))
+        elif weighted:
+            chunks = (zip(*chunk) for chunk in utils.chunks(dataStream))
+        else:
+            chunks = ((chunk, None) for chunk in utils.chunks(dataStream))
+        for values, w in chunks:
+            values = np.asarray(values, dtype=np.float64)
+            w = np.ones(len(values)) if w is None \
+                else np.asarray(w, dtype=np.float64)
+            self._chunks.append((values, w))
+            self._buffered += len(values)
+            if self._buffered >= self._bufferSize:
+                self._compress()
+
+
+    def processItem(self, item, weighted=False):
+        """
+        Summarize the given data stream, but only process one
+        item.
+
+        :param item: number to be processed
+        :param weighted: if weighted, item should be a (value, weight)
+                         pair, where weight > 0
+        """
+        self._items.append(item if weighted else (item, 1.))
+        self._buffered += 1
+        if self._buffered >= self._bufferSize:
+            self._compress()
+
+
+    def estimate(self, k):
+        """
+        Estimate the k-th smallest item.
+
+        :param k: rank of the item, between 1 and the number of items
+
+        :return: estimated k-th smallest item
+        :rtype: real
+        """
+        self._compress()
+        if k < 1 or k > self._weights.sum():
+            raise ValueError('k should be between [1, n]')
+        return float(self._interpolate([k - 0.5])[0])
+
+
+    def quantiles(self, phis):
+        """
+        Estimate many quantiles at once.
+
+        :param phis: fractions in [0, 1], e.g. [.5, .99, .999]
+
+        :return: estimated quantiles
+        :rtype: numpy.ndarray
+        """
+        self._compress()
+        if len(self._weights) == 0:
+            raise ValueError('no item has been processed')
+        return self._interpolate(np.asarray(phis, dtype=np.float64) *
+                                 self._weights.sum())
+
+
+    def cdf(self, values):
+        """
+        Estimate the fraction of items no larger than each value.
+
+        :param values: numbers, e.g. [10, 100, 1000]
+
+        :return: estimated fractions
+        :rtype: numpy.ndarray
+        """
+        self._compress()
+        if len(self._weights) == 0:
+            return np.zeros(len(values))
+        total = self._weights.sum()
+        centers = np.cumsum(self._weights) - self._weights / 2.
+        means = np.concatenate(([self._min], self._means, [self._max]))
+        centers = np.concatenate(([0.], centers, [total]))
+        return np.interp(values, means, centers) / total
+
+
+    def __len__(self):
+        """
+        Number of centroids.
+        """
+        self._compress()
+        return len(self._means)
+
+
+    def _parts(self):
+        self._compress()
+        return super(TDigest, self)._parts()
+
+
+    def reproduce(self, num=1):
+        """
+        Reproduce TDigest instance(s) to have the same
+        internal status.
+
+        :param num: number of instances to be reproduced
+        :type num: int
+
+        :return: reproduced instance. if num > 1, a list 
+                 of instances will be returned
+        """
+        if type(num) is not int:
+            raise TypeError('num should be int')
+        if num < 1:
+            raise ValueError('num should >= 1')
+
+        if num == 1:
+            return copy.deepcopy(self)
+        else:
+            return [copy.deepcopy(self) for i in xrange(num)]
+
+
+    def merge(self, other):
+        """
+        Merge two TDigest instances, the centroids of other are
+        merged like weighted items.
+
+        :param other: an instance of TDigest
+        """
+        res = copy.deepcopy(self)
+        other = copy.deepcopy(other)
+        other._compress()
+        res._chunks.append((other._means, other._weights))
+        res._min = min(res._min, other._min)
+        res._max = max(res._max, other._max)
+        res._compress()
+        return res
+
+
+    def __add__(self, other):
+        """
+        Overload + for self.merge
+        """
+        return self.merge(other)
+
+
+    def _compress(self):
+        """
+        Merge the buffered items into the centroids. Sorted points are
+        grouped by the integer part of the scale function k2 of their
+        quantile, so each centroid spans at most one unit of it.
+        """
+        if self._buffered == 0 and not self._chunks:
+            return
+        chunks = [(self._means, self._weights)] + self._chunks
+        if self._items:
+            values, w = zip(*self._items)
+            chunks.append((np.array(values, dtype=np.float64),
+                           np.array(w, dtype=np.float64)))
+        means = np.concatenate([c[0] for c in chunks])
+        weights = np.concatenate([c[1] for c in chunks])
+        self._chunks, self._items, self._buffered = [], [], 0
+        if len(means) == 0:
+            return
+        order = np.argsort(means, kind='mergesort')
+        means, weights = means[order], weights[order]
+        self._min = min(self._min, means[0])
+        self._max = max(self._max, means[-1])
+
+        total = weights.sum()
+        q = (np.cumsum(weights) - weights / 2.) / total
+        norm = 4 * math.log(max(total / self._delta, 1.)) + 24
+        k = np.floor(self._delta / norm * np.log(q / (1. - q)))
+        cluster = (k - k[0]).astype(np.intp)
+        self._weights = np.bincount(cluster, weights=weights)
+        sums = np.bincount(cluster, weights=weights * means)
+        used = self._weights > 0
+        self._weights = self._weights[used]
+        self._means = sums[used] / self._weights
+
+
+    def _interpolate(self, ranks):
+        """
+        Interpolate the items at the given (fractional) ranks between
+        the centers of the centroids and the extreme items.
+        """
+        total = self._weights.sum()
+        centers = np.cumsum(self._weights) - self._weights / 2.
+        centers = np.concatenate(([0.], centers, [total]))
+        means = np.concatenate(([self._min], self._means, [self._max]))
+        return np.interp(ranks, centers, means)
+
+
+class GK(Sketch):
+    """
+    Greenwald-Khanna quantile summary.
+    deterministically estimate the quantiles of a data stream of
+    comparable items, with rank error at most eps * n and
+    O(1/eps * log(eps * n)) tuples kept.
+    """
+    _BUFFERS = ('_values', '_g', '_delta')
+    _STATE = ('_eps', '_buffer', '_n')
+
+    def __init__(self, eps=0.01):
+        """
+        Create a new instance.
+
+        :param eps: rank error, relative to the number of items
+        :type eps: float
+        """
+        if eps <= 0 or eps >= 1:
+            raise ValueError('eps should be in (0, 1)')
+
+        self._eps = eps
+        # tuples (v, g, delta) in parallel arrays, sorted by v: the
+        # rank of v_i is between sum(g[:i + 1]) and that plus delta_i
+        self._values = None
+        self._g = np.zeros(0, dtype=np.int64)
+        self._delta = np.zeros(0, dtype=np.int64)
+        self._buffer = []
+        self._n = 0
+
+
+    def processBatch(self, dataStream):
+        """
+        Summarize the given data stream, chunk by chunk with numpy.
+        Each chunk is sorted, inserted at once and then compressed.
+
+        :param dataStream: any iterable object with comparable items.
+                           e.g. a list of strings, or a numpy array.
+        """
+        self._flush()
+        for chunk in utils.chunks(dataStream):
+            self._insert(_asArray(chunk))
+
+
+    def processItem(self, item):
+        """
+        Summarize the given data stream, but only process one
+        item.
+
+        :param item: comparable item to be processed
+        """
+        self._buffer.append(item)
+        # insert and compress once the buffer is as large as the
+        # summary, so each item costs amortized O(1)
+        if len(self._buffer) >= max(int(1 / (2 * self._eps)), len(self._g)):
+            self._flush()
+
+
+    def estimate(self, k):
+        """
+        Estimate the k-th smallest item.
+
+        :param k: rank of the item, between 1 and the number of items
+        :type k: int
+
+        :return: an item whose rank is within k +- eps * n
+        """
+        self._flush()
+        if k < 1 or k > self._n:
+            raise ValueError('k should be between [1, n]')
+        return self._values[self._query(np.array([k]))[0]]
+
+
+    def quantiles(self, phis):
+        """
+        Estimate many quantiles at once.
+
+        :param phis: fractions in [0, 1], e.g. [.5, .9, .99]
+
+        :return: estimated quantiles
+        :rtype: numpy.ndarray
+        """
+        self._flush()
+        if self._n == 0:
+            raise ValueError('no item has been processed')
+        ks = np.clip(np.ceil(np.asarray(phis, dtype=np.float64) * self._n),
+                     1, self._n)
+        return self._values[self._query(ks)]
+
+
+    def cdf(self, values):
+        """
+        Estimate the fraction of items no larger than each value.
+
+        :param values: items to compare with
+
+        :return: estimated fractions
+        :rtype: numpy.ndarray
+        """
+        self._flush()
+        if self._n == 0:
+            return np.zeros(len(values))
+        rmin = np.cumsum(self._g)
+        pos = np.searchsorted(self._values, _asArray(values), side='right')
+        # the rank is between rmin of the last tuple <= value and
+        # rmax of the next tuple minus 1
+        lo = np.concatenate(([0], rmin))[pos]
+        hi = np.concatenate((rmin + self._delta - 1, [self._n]))[pos]
+        return (lo + hi) / (2. * self._n)
+
+
+    def __len__(self):
+        """
+        Number of tuples kept.
+        """
+        self._flush()
+        return len(self._g)
+
+
+    def _parts(self):
+        self._flush()
+        return super(GK, self)._parts()
+
+
+    def reproduce(self, num=1):
+        """
+        Reproduce GK instance(s) to have the same
+        internal status.
+
+        :param num: number of instances to be reproduced
+        :type num: int
+
+        :return: reproduced instance. if num > 1, a list 
+                 of instances will be returned
+        """
+        if type(num) is not int:
+            raise TypeError('num should be int')
+        if num < 1:
+            raise ValueError('num should >= 1')
+
+        if num == 1:
+            return copy.deepcopy(self)
+        else:
+            return [copy.deepcopy(self) for i in xrange(num)]
+
+
+    def merge(self, other):
+        """
+        Merge two GK instances if they are compatible. The rank
+        bounds of each tuple are widened by the bounds of its
+        neighbours in the other summary.
+
+        :param other: an instance of GK with the same eps
+        """
+        if other._eps != self._eps:
+            raise ValueError('two instances are not compatible')
+
+        res = copy.deepcopy(self)
+        res._flush()
+        other = copy.deepcopy(other)
+        other._flush()
+        if other._n == 0:
+            return res
+        if res._n == 0:
+            return other
+
+        a, b = res._values, other._values
+        aMin, bMin = np.cumsum(res._g), np.cumsum(other._g)
+        aMax, bMax = aMin + res._delta, bMin + other._delta
+        # on ties, the items of self come first
+        pa = np.searchsorted(b, a, side='left')
+        pb = np.searchsorted(a, b, side='right')
+        rmin = np.concatenate((
+            aMin + np.concatenate(([0], bMin))[pa],
+            bMin + np.concatenate(([0], aMin))[pb]))
+        rmax = np.concatenate((
+            aMax + np.concatenate((bMax - 1, [other._n]))[pa],
+            bMax + np.concatenate((aMax - 1, [res._n]))[pb]))
+        values = _concat(a, b)
+        order = np.argsort(values, kind='mergesort')
+        rmin, rmax = rmin[order], rmax[order]
+        res._values = values[order]
+        res._g = np.diff(np.concatenate(([0], rmin)))
+        res._delta = rmax - rmin
+        res._n += other._n
+        res._compress()
+        return res
+
+
+    def __add__(self, other):
+        """
+        Overload + for self.merge
+        """
+        return self.merge(other)
+
+
+    def _flush(self):
+        """
+        Insert the items processed one by one.
+        """
+        if self._buffer:
+            items, self._buffer = self._buffer, []
+            self._insert(_asArray(items))
+
+
+    def _insert(self, items):
+        """
+        Insert a chunk of items, each as a tuple with g = 1, then
+        compress the summary.
+        """
+        if len(items) == 0:
+            return
+        items = np.sort(items, kind='mergesort')
+        if self._values is None:
+            self._values = items[:0]
+        # new items go after the equal items already kept
+        pos = np.searchsorted(self._values, items, side='right')
+        # an item inserted before the tuple i has delta g_i + delta_i - 1,
+        # the new minimum and maximum are exact
+        gaps = np.concatenate((self._g + self._delta - 1, [0]))
+        delta = gaps[pos]
+        delta[pos == 0] = 0
+
+        at = pos + np.arange(len(items))
+        size = len(self._g) + len(items)
+        old = np.ones(size, dtype=bool)
+        old[at] = False
+        values = np.empty(size, dtype=np.result_type(self._values, items))
+        values[old], values[at] = self._values, items
+        g = np.ones(size, dtype=np.int64)
+        g[old] = self._g
+        d = np.empty(size, dtype=np.int64)
+        d[old], d[at] = self._delta, delta
+        self._values, self._g, self._delta = values, g, d
+        self._n += len(items)
+        self._compress()
+
+
+    def _compress(self):
+        """
+        Merge each tuple into its successor while the band of ranks
+        they cover stays within 2 * eps * n. Scanning from the largest
+        tuple, every kept tuple absorbs the longest run of tuples
+        before it, found with a binary search over the prefix sums of g.
+        The first tuple, i.e. the minimum, is always kept.
+        """
+        size = len(self._g)
+        if size < 3:
+            return
+        thresh = int(math.floor(2 * self._eps * self._n))
+        rmin = np.cumsum(self._g)
+        keep = []
+        j = size - 1
+        while j > 0:
+            keep.append(j)
+            # smallest i with rmin[j] - rmin[i - 1] + delta_j <= thresh
+            i = np.searchsorted(rmin, rmin[j] + self._delta[j] - thresh) + 1
+            j = min(max(i, 1), j) - 1
+        keep.append(0)
+        if len(keep) == size:
+            return
+        keep = np.array(keep[::-1])
+        self._values = self._values[keep]
+        self._g = np.diff(np.concatenate(([0], rmin[keep])))
+        self._delta = self._delta[keep]
+
+
+    def _query(self, ks):
+        """
+        Indexes of the tuples answering ranks ks: the first tuple with
+        rmin >= k - eps * n, whose rmax is then below k + eps * n.
+        """
+        rmin = np.cumsum(self._g)
+        pos = np.searchsorted(rmin, ks - self._eps * self._n, side='left')
+        return np.minimum(pos, len(rmin) - 1)
+
+
+def _childSeed(seed, i):
+    """
+    Seed of the i-th generator derived from a generator seeded with
+    seed, None when it is not seeded.
+    """
+    if seed is None:
+        return None
+    return (seed if isinstance(seed, list) else [seed]) + [i]
+
+
+class Reservoir(Sketch):
+    """
+    Reservoir sampling with Algorithm L.
+    keep a uniform random sample of k items of a data stream. The
+    number of items skipped before the next replacement is drawn from
+    a geometric distribution, so only O(k log(n / k)) random numbers
+    are drawn for n items.
+    """
+    def __init__(self, k=1024, seed=None):
+        """
+        Create a new instance.
+
+        :param k: number of items to be sampled
+        :type k: int
+
+        :param seed: seed of the random number generator
+        :type seed: int
+        """
+        if type(k) is not int:
+            raise TypeError('k should be int')
+        if k < 1:
+            raise ValueError('k should >= 1')
+
+        self._k = k
+        # copies draw from generators derived from the seed, see _copy
+        self._seed = seed
+        self._copies = 0
+        self._random = np.random.RandomState(seed)
+        self._sample = []
+        self._n = 0
+        # w is distributed as the largest of the k smallest random keys
+        # given to the items so far, next is the index of the next item
+        # to replace a sampled one
+        self._w = math.exp(math.log(1. - self._random.random_sample()) / k)
+        self._next = k - 1 + self._skip()
+
+
+    def processBatch(self, dataStream):
+        """
+        Summarize the given data stream, chunk by chunk: only the
+        items replacing a sampled one are visited.
+
+        :param dataStream: any iterable object, e.g. a list of
+                           strings, or a numpy array.
+        """
+        for chunk in utils.chunks(dataStream):
+            if len(self._sample) < self._k:
+                self._sample.extend(chunk[:self._k - len(self._sample)])
+            end = self._n + len(chunk)
+            while self._next < end:
+                self._sample[self._random.randint(self._k)] = \
+                    chunk[self._next - self._n]
+                self._advance()
+            self._n = end
+
+
+    def processItem(self, item):
+        """
+        Summarize the given data stream, but only process one
+        item.
+
+        :param item: item to be processed
+        """
+        if len(self._sample) < self._k:
+            self._sample.append(item)
+        elif self._n == self._next:
+            self._sample[self._random.randint(self._k)] = item
+            self._advance()
+        self._n += 1
+
+
+    def estimate(self):
+        """
+        Return the sample.
+
+        :return: a uniform random sample of min(k, n) items, without
+                 replacement
+        :rtype: list
+        """
+        return list(self._sample)
+
+
+    def __len__(self):
+        """
+        Number of items sampled.
+        """
+        return len(self._sample)
+
+
+    def reproduce(self, num=1):
+        """
+        Reproduce Reservoir instance(s) to have the same
+        internal status. Each instance draws its random numbers
+        from a new generator, derived from the seed of this one.
+
+        :param num: number of instances to be reproduced
+        :type num: int
+
+        :return: reproduced instance. if num > 1, a list 
+                 of instances will be returned
+        """
+        if type(num) is not int:
+            raise TypeError('num should be int')
+        if num < 1:
+            raise ValueError('num should >= 1')
+
+        res = [self._copy() for i in xrange(num)]
+        return res[0] if num == 1 else res
+
+
+    def merge(self, other):
+        """
+        Merge two Reservoir instances if they are compatible. Each
+        reservoir is weighted by the number of items it has seen: the
+        number of items taken from self follows a hypergeometric
+        distribution, so the result is a uniform sample of the union.
+
+        :param other: an instance of Reservoir with the same k
+        """
+        if other._k != self._k:
+            raise ValueError('two instances are not compatible')
+
+        res = self._copy()
+        if other._n == 0:
+            return res
+        if self._n == 0:
+            res._sample = list(other._sample)
+            res._n, res._w, res._next = other._n, other._w, other._next
+            return res
+
+        n = self._n + other._n
+        size = min(self._k, n)
+        take = res._random.hypergeometric(self._n, other._n, size)
+        res._sample = res._choose(self._sample, take) + \
+            res._choose(other._sample, size - take)
+        res._n = n
+        # restart the skips from the distribution of w given n
+        if n >= self._k:
+            res._w = res._random.beta(self._k, n - self._k + 1)
+            res._next = n - 1 + res._skip()
+        return res
+
+
+    def __add__(self, other):
+        """
+        Overload + for self.merge
+        """
+        return self.merge(other)
+
+
+    def _skip(self):
+        """
+        Draw the distance to the next item to be sampled.
+        """
+        u = self._random.random_sample()
+        return int(math.log(1. - u) / math.log1p(-self._w)) + 1
+
+
+    def _advance(self):
+        """
+        Shrink w and move to the next item to be sampled.
+        """
+        u = self._random.random_sample()
+        self._w *= math.exp(math.log(1. - u) / self._k)
+        self._next += self._skip()
+
+
+    def _choose(self, items, size):
+        """
+        Draw size of the items, without replacement.
+        """
+        return [items[i] for i in
+                self._random.choice(len(items), size, replace=False)]
+
+
+    def _copy(self):
+        """
+        Deep copy with a new random number generator, seeded by the
+        seed of this one and the number of copies made so far, so the
+        copies do not draw the same numbers, and this one draws the
+        same numbers whether it is copied or not.
+        """
+        self._copies += 1
+        res = copy.deepcopy(self)
+        res._seed = _childSeed(self._seed, self._copies)
+        res._copies = 0
+        res._random = np.random.RandomState(res._seed)
+        return res
+
+
+class WeightedReservoir(Sketch):
+    """
+    Weighted reservoir sampling with exponential jumps (A-ExpJ).
+    keep a sample of k items without replacement, where each item is
+    included with probability increasing with its weight. Each item
+    has the random key u^(1 / weight), and the k items with the
+    largest keys are kept; the weight skipped before the next key
+    larger than the smallest kept one is drawn at once, so only
+    O(k log(W / k)) random numbers are drawn for total weight W.
+    """
+    def __init__(self, k=1024, seed=None):
+        """
+        Create a new instance.
+
+        :param k: number of items to be sampled
+        :type k: int
+
+        :param seed: seed of the random number generator
+        :type seed: int
+        """
+        if type(k) is not int:
+            raise TypeError('k should be int')
+        if k < 1:
+            raise ValueError('k should >= 1')
+
+        self._k = k
+        # copies draw from generators derived from the seed, see _copy
+        self._seed = seed
+        self._copies = 0
+        self._random = np.random.RandomState(seed)
+        # min-heap of (log(key), index, item, weight)
+        self._heap = []
+        self._n = 0
+        # weight to be skipped before the next item enters the sample
+        self._jump = 0.
+
+
+    def processBatch(self, dataStream, weighted=False, weights=None):
+        """
+        Summarize the given data stream, chunk by chunk: only the
+        items entering the sample are visited.
+
+        :param dataStream: any iterable object, e.g. a list of
+                           strings, or a numpy array.
+        :param weighted: if weighted, each item in dataStream should
+                         be (key, weight) pair, where weight > 0
+        :param weights: weights > 0, parallel to dataStream
+        """
+        if weights is not None:
+            chunks = zip(utils.chunks(dataStream), utils.chunks(weights))
+        elif weighted:
+            chunks = (zip(*chunk) for chunk in utils.chunks(dataStream))
+        else:
+            chunks = ((chunk, None) for chunk in utils.chunks(dataStream))
+        for items, w in chunks:
+            w = np.ones(len(items)) if w is None \
+                else np.asarray(w, dtype=np.float64)
+            start = min(self._k - len(self._heap), len(items))
+            if start > 0:
+                keys = np.log1p(-self._random.random_sample(start)) / w[:start]
+                for i in xrange(start):
+                    self._heap.append((keys[i], self._n + i, items[i], w[i]))
+                heapq.heapify(self._heap)
+                if len(self._heap) == self._k:
+                    self._jump = self._draw()
+            cum = np.cumsum(w[start:])
+            base = 0.
+            while True:
+                # the first item where the skipped weight reaches jump
+                i = np.searchsorted(cum, base + self._jump)
+                if i == len(cum):
+                    if len(cum):
+                        self._jump -= cum[-1] - base
+                    break
+                self._replace(items[start + i], w[start + i],
+                              self._n + start + i)
+                base = cum[i]
+            self._n += len(items)
+
+
+    def processItem(self, item, weighted=False):
+        """
+        Summarize the given data stream, but only process one
+        item.
+
+        :param item: item to be processed
+        :param weighted: if weighted, item should be a (key, weight)
+                         pair, where weight > 0
+        """
+        key, weight = item if weighted else (item, 1.)
+        if len(self._heap) < self._k:
+            u = self._random.random_sample()
+            heapq.heappush(self._heap, (math.log(1. - u) / weight,
+                                        self._n, key, weight))
+            if len(self._heap) == self._k:
+                self._jump = self._draw()
+        else:
+            self._jump -= weight
+            if self._jump <= 0:
+                self._replace(key, weight, self._n)
+        self._n += 1
+
+
+    def estimate(self):
+        """
+        Return the sample.
+
+        :return: min(k, n) (key, weight) pairs sampled without
+                 replacement
+        :rtype: list
+        """
+        return [(item, weight) for _, _, item, weight in self._heap]
+
+
+    def __len__(self):
+        """
+        Number of items sampled.
+        """
+        return len(self._heap)
+
+
+    def reproduce(self, num=1):
+        """
+        Reproduce WeightedReservoir instance(s) to have the same
+        internal status. Each instance draws its random numbers
+        from a new generator, derived from the seed of this one.
+
+        :param num: number of instances to be reproduced
+        :type num: int
+
+        :return: reproduced instance. if num > 1, a list 
+                 of instances will be returned
+        """
+        if type(num) is not int:
+            raise TypeError('num should be int')
+        if num < 1:
+            raise ValueError('num should >= 1')
+
+        res = [self._copy() for i in xrange(num)]
+        return res[0] if num == 1 else res
+
+
+    def merge(self, other):
+        """
+        Merge two WeightedReservoir instances if they are compatible.
+        The keys of the items are independent, so the k items with
+        the largest keys of both samples are a sample of the union.
+
+        :param other: an instance of WeightedReservoir with the same k
+        """
+        if other._k != self._k:
+            raise ValueError('two instances are not compatible')
+
+        res = self._copy()
+        # indexes of other follow the ones of self
+        entries = [(key, self._n + i, item, weight)
+                   for key, i, item, weight in other._heap]
+        res._heap = heapq.nlargest(self._k, res._heap + entries)
+        heapq.heapify(res._heap)
+        res._n += other._n
+        # the skipped weight is memoryless, so it can be drawn again
+        if len(res._heap) == self._k:
+            res._jump = res._draw()
+        return res
+
+
+    def __add__(self, other):
+        """
+        Overload + for self.merge
+        """
+        return self.merge(other)
+
+
+    def _draw(self):
+        """
+        Draw the weight skipped before an item gets a key larger
+        than the smallest key kept, which is exponential with rate
+        -log(smallest key).
+        """
+        u = self._random.random_sample()
+        return math.log(1. - u) / self._heap[0][0]
+
+
+    def _replace(self, item, weight, index):
+        """
+        Replace the item with the smallest key: the key of the new
+        item is drawn conditionally on being larger than it.
+        """
+        threshold = math.exp(self._heap[0][0] * weight)
+        u = threshold + (1. - threshold) * self._random.random_sample()
+        heapq.heapreplace(self._heap, (math.log(u) / weight, index,
+                                       item, weight))
+        self._jump = self._draw()
+
+
+    def _copy(self):
+        """
+        Deep copy with a new random number generator, seeded by the
+        seed of this one and the number of copies made so far, so the
+        copies do not draw the same numbers, and this one draws the
+        same numbers whether it is copied or not.
+        """
+        self._copies += 1
+        res = copy.deepcopy(self)
+        res._seed = _childSeed(self._seed, self._copies)
+        res._copies = 0
+        res._random = np.random.RandomState(res._seed)
+        return res
+
+
+class PrioritySample(Sketch):
+    """
+    Priority sampling.
+    keep k weighted items of a data stream with the largest
+    priorities weight / u, u uniform in (0, 1]. With tau the (k+1)-th
+    largest priority, max(weight, tau) is an unbiased estimate of the
+    weight of each sampled item, so the total weight of any subset of
+    the keys can be estimated after the fact.
+    """
+    # the state of the random number generator is written too, see _parts
+    _BUFFERS = ('_keys', '_weights', '_priorities', '_mt')
+    _STATE = ('_k', '_buffer', '_seed', '_copies', '_mtState')
+
+    def __init__(self, k=1024, seed=None):
+        """
+        Create a new instance.
+
+        :param k: number of items to be sampled
+        :type k: int
+
+        :param seed: seed of the random number generator
+        :type seed: int
+        """
+        if type(k) is not int:
+            raise TypeError('k should be int')
+        if k < 1:
+            raise ValueError('k should >= 1')
+
+        self._k = k
+        # copies draw from generators derived from the seed, see _copy
+        self._seed = seed
+        self._copies = 0
+        self._random = np.random.RandomState(seed)
+        # the k + 1 items with the largest priorities, unordered
+        self._keys = None
+        self._weights = np.zeros(0)
+        self._priorities = np.zeros(0)
+        self._buffer = []
+
+
+    def processBatch(self, dataStream, weighted=False, weights=None):
+        """
+        Summarize the given data stream, chunk by chunk with numpy.
+
+        :param dataStream: any iterable object, e.g. a list of
+                           strings, or a numpy array.
+        :param weighted: if weighted, each item in dataStream should
+                         be (key, weight) pair, where weight > 0
+        :param weights: weights > 0, parallel to dataStream
+        """
+        self._flush()
+        if weights is not None:
+            chunks = zip(utils.chunks(dataStream), utils.chunks(weights))
+        elif weighted:
+            chunks = (zip(*chunk) for chunk in utils.chunks(dataStream))
+        else:
+            chunks = ((chunk, None) for chunk in utils.chunks(dataStream))
+        for keys, w in chunks:
+            w = np.ones(len(keys)) if w is None \
+                else np.asarray(w, dtype=np.float64)
+            self._update(_asArray(keys), w)
+
+
+    def processItem(self, item, weighted=False):
+        """
+        Summarize the given data stream, but only process one
+        item.
+
+        :param item: item to be processed
+        :param weighted: if weighted, item should be a (key, weight)
+                         pair, where weight > 0
+        """
+        self._buffer.append(item if weighted else (item, 1.))
+        if len(self._buffer) > self._k:
+            self._flush()
+
+
+    def estimate(self, key):
+        """
+        Estimate the total weight of given key.
+
+        :param key: key/item in the data stream
+
+        :return: estimated total weight of the key
+        :rtype: real
+        """
+        return self.subsetSum(set([key]))[0]
+
+
+    def subsetSum(self, subset):
+        """
+        Estimate the total weight of a subset of the keys.
+
+        :param subset: a set of keys, or a predicate returning
+                       whether a key belongs to the subset
+
+        :return: unbiased estimates of the total weight, and of the
+                 variance of this estimate
+        :rtype: (real, real)
+        """
+        self._flush()
+        keys, weights, tau = self._sample()
+        if callable(subset):
+            selected = np.array([bool(subset(key)) for key in keys],
+                                dtype=bool)
+        else:
+            selected = np.array([key in subset for key in keys],
+                                dtype=bool)
+        weights = weights[selected]
+        estimate = np.maximum(weights, tau).sum()
+        variance = (tau * np.maximum(tau - weights, 0)).sum()
+        return float(estimate), float(variance)
+
+
+    def __len__(self):
+        """
+        Number of items sampled.
+        """
+        self._flush()
+        return min(len(self._weights), self._k)
+
+
+    def _parts(self):
+        self._flush()
+        flat = copy.copy(self)
+        state = self._random.get_state()
+        flat._mt, flat._mtState = state[1], list(state[2:])
+        return super(PrioritySample, flat)._parts()
+
+
+    @classmethod
+    def fromBytes(cls, data):
+        res = super(PrioritySample, cls).fromBytes(data)
+        res._random = np.random.RandomState()
+        res._random.set_state(('MT19937', res.__dict__.pop('_mt')) +
+                              tuple(res.__dict__.pop('_mtState')))
+        return res
+
+
+    def reproduce(self, num=1):
+        """
+        Reproduce PrioritySample instance(s) to have the same
+        internal status. Each instance draws its random numbers
+        from a new generator, derived from the seed of this one.
+
+        :param num: number of instances to be reproduced
+        :type num: int
+
+        :return: reproduced instance. if num > 1, a list 
+                 of instances will be returned
+        """
+        if type(num) is not int:
+            raise TypeError('num should be int')
+        if num < 1:
+            raise ValueError('num should >= 1')
+
+        res = [self._copy() for i in xrange(num)]
+        return res[0] if num == 1 else res
+
+
+    def merge(self, other):
+        """
+        Merge two PrioritySample instances if they are compatible.
+        The priorities are independent, so the k + 1 largest
+        priorities of both samples are the ones of the union.
+
+        :param other: an instance of PrioritySample with the same k
+        """
+        if other._k != self._k:
+            raise ValueError('two instances are not compatible')
+
+        res = self._copy()
+        res._flush()
+        other = copy.deepcopy(other)
+        other._flush()
+        if other._keys is not None:
+            res._keep(_concat(res._keys, other._keys),
+                      np.concatenate((res._weights, other._weights)),
+                      np.concatenate((res._priorities, other._priorities)))
+        return res
+
+
+    def __add__(self, other):
+        """
+        Overload + for self.merge
+        """
+        return self.merge(other)
+
+
+    def _flush(self):
+        """
+        Process the items processed one by one.
+        """
+        if self._buffer:
+            keys, w = zip(*self._buffer)
+            self._buffer = []
+            self._update(_asArray(keys), np.asarray(w, dtype=np.float64))
+
+
+    def _update(self, keys, weights):
+        """
+        Draw the priorities of a chunk of items and keep the largest.
+        """
+        if len(keys) == 0:
+            return
+        priorities = weights / (1. - self._random.random_sample(len(weights)))
+        if self._keys is None:
+            self._keep(keys, weights, priorities)
+        else:
+            self._keep(_concat(self._keys, keys),
+                       np.concatenate((self._weights, weights)),
+                       np.concatenate((self._priorities, priorities)))
+
+
+    def _keep(self, keys, weights, priorities):
+        """
+        Keep the k + 1 items with the largest priorities.
+        """
+        if len(priorities) > self._k + 1:
+            top = np.argpartition(-priorities, self._k)[:self._k + 1]
+            keys, weights, priorities = keys[top], weights[top], \
+                priorities[top]
+        self._keys, self._weights, self._priorities = \
+            keys, weights, priorities
+
+
+    def _sample(self):
+        """
+        The sampled keys and weights, and the threshold tau.
+        """
+        if self._keys is None:
+            return np.zeros(0), np.zeros(0), 0.
+        if len(self._priorities) <= self._k:
+            # every item is sampled, weights are exact
+            return self._keys, self._weights, 0.
+        last = np.argmin(self._priorities)
+        kept = np.arange(len(self._priorities)) != last
+        return self._keys[kept], self._weights[kept], \
+            self._priorities[last]
+
+
+    def _copy(self):
+        """
+        Deep copy with a new random number generator, seeded by the
+        seed of this one and the number of copies made so far, so the
+        copies do not draw the same numbers, and this one draws the
+        same numbers whether it is copied or not.
+        """
+        self._copies += 1
+        res = copy.deepcopy(self)
+        res._seed = _childSeed(self._seed, self._copies)
+        res._copies = 0
+        res._random = np.random.RandomState(res._seed)
+        return res
+
+
+class BloomFilter(Sketch):
+    """
+    Bloom filter.
+    answer whether a key has been processed, with no false negative
+    and a false positive rate close to fpr until capacity distinct
+    keys have been processed.
+    """
+    _BUFFERS = ('_bits',)
+    _HASHES = ('_hashes',)
+    _STATE = ('_capacity', '_fpr', '_m', '_k', '_hash')
+    _MAPPABLE = True
+
+    def __init__(self, capacity=1000000, fpr=0.01):
+        """
+        Create a new instance, with the number of bits and probes
+        which minimize the memory for the given error.
+
+        :param capacity: expected number of distinct keys
+        :type capacity: int
+
+        :param fpr: false positive rate at capacity
+        :type fpr: float
+        """
+        if capacity < 1:
+            raise ValueError('capacity should >= 1')
+        if fpr <= 0 or fpr >= 1:
+            raise ValueError('fpr should be in (0, 1)')
+
+        self._capacity = capacity
+        self._fpr = fpr
+        # m = -n ln(p) / ln(2)^2 bits, and k = m / n ln(2) probes
+        self._m = max(8, int(math.ceil(-capacity * math.log(fpr) /
+                                       math.log(2) ** 2)))
+        self._k = max(1, int(round(self._m / float(capacity) *
+                                   math.log(2))))
+        self._bits = np.zeros((self._m + 7) // 8, dtype=np.uint8)
+        self._hashes = MurmurHash()
+        self._hash = hash(self)
+
+
+    def processBatch(self, dataStream):
+        """
+        Add the keys of the given data stream, chunk by chunk with
+        numpy.
+
+        :param dataStream: any iterable object with hashable elements.
+                           e.g. a list of integers, or a numpy array.
+        """
+        for chunk in utils.chunks(dataStream):
+            utils.setbits(self._bits, self._probes(chunk).ravel())
+
+
+    def processItem(self, item):
+        """
+        Add one key.
+
+        :param item: hashable object to be processed
+                     e.g. an integer
+        """
+        utils.setbits(self._bits, self._probes([item]).ravel())
+
+
+    def containsMany(self, keys):
+        """
+        Test whether many keys have been processed at once.
+
+        :param keys: a numpy array or any sequence of hashable objects
+
+        :return: False for the keys never processed, True for the
+                 processed keys and a few false positives
+        :rtype: numpy.ndarray of bool
+        """
+        return np.concatenate([self._contains(chunk)
+                               for chunk in utils.chunks(keys)] or
+                              [np.zeros(0, dtype=bool)])
+
+
+    def __contains__(self, key):
+        """
+        Overload in for membership of one key.
+        """
+        return bool(self._contains([key])[0])
+
+
+    def estimate(self):
+        """
+        Estimate the number of distinct keys processed, from the
+        number of bits set.
+
+        :return: estimated number of distinct keys
+        :rtype: real
+        """
+        unset = self._m - utils.popcount(self._bits)
+        if unset == 0:
+            return float('inf')
+        return -self._m / float(self._k) * math.log(unset / float(self._m))
+
+
+    def reproduce(self, num=1):
+        """
+        Reproduce BloomFilter instance(s) to have the same
+        internal status.
+
+        :param num: number of instances to be reproduced
+        :type num: int
+
+        :return: reproduced instance. if num > 1, a list 
+                 of instances will be returned
+        """
+        if type(num) is not int:
+            raise TypeError('num should be int')
+        if num < 1:
+            raise ValueError('num should >= 1')
+
+        if num == 1:
+            return copy.deepcopy(self)
+        else:
+            return [copy.deepcopy(self) for i in xrange(num)]
+
+
+    def merge(self, other):
+        """
+        Merge two BloomFilter instances if they are compatible,
+        the result contains the keys of both.
+
+        :param other: an instance of BloomFilter reproduced from
+                      the same instance
+        """
+        if other._hash != self._hash:
+            raise ValueError('two instances are not compatible')
+
+        res = copy.deepcopy(self)
+        res._bits |= other._bits
+        return res
+
+
+    def __add__(self, other):
+        """
+        Overload + for self.merge
+        """
+        return self.merge(other)
+
+
+    def _probes(self, keys):
+        """
+        Bit positions of the keys, one row of k probes per key.
+        """
+        return self._positions(*self._hashes.hash128Batch(keys))
+
+
+    def _positions(self, h1, h2):
+        """
+        Bit positions h1 + i * h2, from the two halves of the
+        128-bit hash values of the keys.
+        """
+        i = np.arange(self._k, dtype=np.uint64)
+        return (h1[:, None] + i * h2[:, None]) % np.uint64(self._m)
+
+
+    def _contains(self, keys):
+        """
+        Membership of a chunk of keys.
+        """
+        return self._lookup(*self._hashes.hash128Batch(keys))
+
+
+    def _lookup(self, h1, h2):
+        """
+        Membership of hashed keys. The probes are tested one at a
+        time, and a key is dropped at its first unset bit, so a
+        missing key costs about 2 probes instead of k.
+        """
+        found = np.zeros(len(h1), dtype=bool)
+        pending = np.arange(len(h1))
+        m = np.uint64(self._m)
+        for i in xrange(self._k):
+            probe = (h1[pending] + np.uint64(i) * h2[pending]) % m
+            pending = pending[utils.getbits(self._bits, probe)]
+            if len(pending) == 0:
+                return found
+        found[pending] = True
+        return found
+
+
+class CountingBloomFilter(BloomFilter):
+    """
+    Counting Bloom filter.
+    a Bloom filter with 4-bit counters instead of bits, two per byte,
+    so keys can be deleted. A counter reaching 15 stays there, and
+    deleting keys never added may cause false negatives.
+    """
+    _BUFFERS = ('_counters',)
+
+    # largest value of a counter
+    _MAX = 15
+
+    @doc_inherit
+    def __init__(self, capacity=1000000, fpr=0.01):
+        super(CountingBloomFilter, self).__init__(capacity, fpr)
+        del self._bits
+        self._counters = np.zeros((self._m + 1) // 2, dtype=np.uint8)
+
+
+    def processBatch(self, dataStream):
+        """
+        Add the keys of the given data stream, chunk by chunk with
+        numpy.
+
+        :param dataStream: any iterable object with hashable elements.
+                           e.g. a list of integers, or a numpy array.
+        """
+        for chunk in utils.chunks(dataStream):
+            self._update(self._probes(chunk).ravel(), 1)
+
+
+    def processItem(self, item):
+        """
+        Add one key.
+
+        :param item: hashable object to be processed
+                     e.g. an integer
+        """
+        self._update(self._probes([item]).ravel(), 1)
+
+
+    def deleteBatch(self, dataStream):
+        """
+        Delete the keys of the given data stream, each of which
+        should have been added before.
+
+        :param dataStream: any iterable object with hashable elements.
+                           e.g. a list of integers, or a numpy array.
+        """
+        for chunk in utils.chunks(dataStream):
+            self._update(self._probes(chunk).ravel(), -1)
+
+
+    def deleteItem(self, item):
+        """
+        Delete one key, which should have been added before.
+
+        :param item: hashable object to be deleted
+        """
+        self._update(self._probes([item]).ravel(), -1)
+
+
+    def estimate(self):
+        """
+        Estimate the number of distinct keys kept, from the
+        number of non-zero counters.
+
+        :return: estimated number of distinct keys
+        :rtype: real
+        """
+        unset = self._m - np.count_nonzero(self._unpack())
+        if unset == 0:
+            return float('inf')
+        return -self._m / float(self._k) * math.log(unset / float(self._m))
+
+
+    def merge(self, other):
+        """
+        Merge two CountingBloomFilter instances if they are
+        compatible, counters are added up to 15.
+
+        :param other: an instance of CountingBloomFilter reproduced
+                      from the same instance
+        """
+        if other._hash != self._hash:
+            raise ValueError('two instances are not compatible')
+
+        res = copy.deepcopy(self)
+        counters = self._unpack() + other._unpack()
+        res._counters = _packNibbles(np.minimum(counters, self._MAX))
+        return res
+
+
+    def _update(self, positions, sign):
+        """
+        Add sign to the counters at positions, repeated positions
+        are added up first. Saturated counters are left as they are.
+        """
+        positions, counts = np.unique(positions.astype(np.intp),
+                                      return_counts=True)
+        values = self._get(positions).astype(np.int64)
+        updated = np.clip(values + sign * counts, 0, self._MAX)
+        updated[values == self._MAX] = self._MAX
+        # the two counters of a byte are written in separate passes
+        for parity in (0, 1):
+            selected = (positions & 1) == parity
+            byte = positions[selected] >> 1
+            shift = 4 * (1 - parity)
+            self._counters[byte] = (self._counters[byte] & (0xf << shift)) | \
+                (updated[selected] << (4 - shift)).astype(np.uint8)
+
+
+    def _get(self, positions):
+        """
+        Counters at positions.
+        """
+        byte = self._counters[positions >> 1]
+        return (byte >> (4 * (positions & 1)).astype(np.uint8)) & 0xf
+
+
+    def _contains(self, keys):
+        """
+        Membership of a chunk of keys.
+        """
+        probes = self._probes(keys).astype(np.intp)
+        return (self._get(probes.ravel()) > 0).reshape(probes.shape) \
+            .all(axis=1)
+
+
+    def _unpack(self):
+        """
+        All the counters, one per byte.
+        """
+        counters = np.empty(2 * len(self._counters), dtype=np.uint8)
+        counters[0::2] = self._counters & 0xf
+        counters[1::2] = self._counters >> 4
+        return counters[:self._m]
+
+
+def _packNibbles(counters):
+    """
+    Pack counters smaller than 16 two per byte, the first of each
+    pair in the low half.
+    """
+    if len(counters) % 2:
+        counters = np.append(counters, 0)
+    counters = counters.astype(np.uint8)
+    return counters[0::2] | (counters[1::2] << 4)
+
+
+class CuckooFilter(Sketch):
+    """
+    Cuckoo filter.
+    answer whether a key has been processed, with no false negative,
+    and support deletions. A fingerprint of each key is kept in one
+    of its two candidate buckets, and moved to the other when its
+    bucket is needed by a new key.
+
+    The fingerprints that find no room are kept aside, in a stash,
+    so no key added is ever lost. The filter is then full: adding
+    more keys raises ValueError, and leaves the filter unchanged,
+    until deletions make room again.
+    """
+    _BUFFERS = ('_table', '_counts', '_stash')
+    _HASHES = ('_hashes',)
+    _STATE = ('_capacity', '_fpr', '_bits', '_mask', '_size', '_hash')
+
+    # largest number of moves to find a free slot
+    _MAX_KICKS = 500
+
+    def __init__(self, capacity=1000000, fpr=0.001, bucketSize=4):
+        """
+        Create a new instance, with fingerprints just large enough
+        for the given error.
+
+        :param capacity: number of keys to be kept, up to about 95%
+                         load of the buckets
+        :type capacity: int
+
+        :param fpr: false positive rate when full
+        :type fpr: float
+
+        :param bucketSize: number of fingerprints in a bucket
+        :type bucketSize: int
+        """
+        if capacity < 1:
+            raise ValueError('capacity should >= 1')
+        if fpr <= 0 or fpr >= 1:
+            raise ValueError('fpr should be in (0, 1)')
+        if bucketSize < 1:
+            raise ValueError('bucketSize should >= 1')
+
+        self._capacity = capacity
+        self._fpr = fpr
+        # a key collides with 2 * bucketSize fingerprints at most
+        self._bits = max(4, int(math.ceil(math.log(2. * bucketSize / fpr,
+                                                   2))))
+        if self._bits > 32:
+            raise ValueError('fpr is too small')
+        dtype = np.uint8 if self._bits <= 8 else \
+            np.uint16 if self._bits <= 16 else np.uint32
+        buckets = 1 << max(1, int(math.ceil(math.log(
+            capacity / (0.95 * bucketSize), 2))))
+        self._mask = buckets - 1
+        # fingerprints of a bucket are packed at its start, 0 is empty
+        self._table = np.zeros((buckets, bucketSize), dtype=dtype)
+        self._counts = np.zeros(buckets, dtype=np.intp)
+        # fingerprints left out when the table is full, each encoded
+        # as bucket << bits | fingerprint
+        self._stash = np.zeros(0, dtype=np.uint64)
+        self._size = 0
+        self._hashes = MurmurHash()
+        self._hash = hash(self)
+
+
+    def processBatch(self, dataStream):
+        """
+        Add the keys of the given data stream, chunk by chunk with
+        numpy. Raise ValueError, without adding the chunk, once the
+        filter is full; the keys added before are all kept.
+
+        :param dataStream: any iterable object with hashable elements.
+                           e.g. a list of integers, or a numpy array.
+        """
+        for chunk in utils.chunks(dataStream):
+            self._checkRoom()
+            self._insert(*self._locate(chunk))
+
+
+    def processItem(self, item):
+        """
+        Add one key. Raise ValueError, without adding it, if the
+        filter is full.
+
+        :param item: hashable object to be processed
+                     e.g. an integer
+        """
+        self._checkRoom()
+        self._insert(*self._locate([item]))
+
+
+    def deleteBatch(self, dataStream):
+        """
+        Delete the keys of the given data stream, each of which
+        should have been added before.
+
+        :param dataStream: any iterable object with hashable elements.
+                           e.g. a list of integers, or a numpy array.
+        """
+        for chunk in utils.chunks(dataStream):
+            self._delete(*self._locate(chunk))
+
+
+    def deleteItem(self, item):
+        """
+        Delete one key, which should have been added before.
+
+        :param item: hashable object to be deleted
+        """
+        self._delete(*self._locate([item]))
+
+
+    def containsMany(self, keys):
+        """
+        Test whether many keys have been processed at once.
+
+        :param keys: a numpy array or any sequence of hashable objects
+
+        :return: False for the keys never processed, True for the
+                 processed keys and a few false positives
+        :rtype: numpy.ndarray of bool
+        """
+        return np.concatenate([self._contains(*self._locate(chunk))
+                               for chunk in utils.chunks(keys)] or
+                              [np.zeros(0, dtype=bool)])
+
+
+    def __contains__(self, key):
+        """
+        Overload in for membership of one key.
+        """
+        return bool(self._contains(*self._locate([key]))[0])
+
+
+    def estimate(self):
+        """
+        Number of keys kept.
+
+        :return: number of keys added and not deleted
+        :rtype: int
+        """
+        return self._size
+
+
+    def reproduce(self, num=1):
+        """
+        Reproduce CuckooFilter instance(s) to have the same
+        internal status.
+
+        :param num: number of instances to be reproduced
+        :type num: int
+
+        :return: reproduced instance. if num > 1, a list 
+                 of instances will be returned
+        """
+        if type(num) is not int:
+            raise TypeError('num should be int')
+        if num < 1:
+            raise ValueError('num should >= 1')
+
+        if num == 1:
+            return copy.deepcopy(self)
+        else:
+            return [copy.deepcopy(self) for i in xrange(num)]
+
+
+    def merge(self, other):
+        """
+        Merge two CuckooFilter instances if they are compatible, the
+        fingerprints of other are inserted again from their buckets.
+
+        :param other: an instance of CuckooFilter reproduced from
+                      the same instance
+        """
+        if other._hash != self._hash:
+            raise ValueError('two instances are not compatible')
+
+        res = copy.deepcopy(self)
+        buckets, slots = np.nonzero(other._table)
+        res._insert(buckets, other._table[buckets, slots])
+        res._insert(*other._unstash(other._stash))
+        return res
+
+
+    def __add__(self, other):
+        """
+        Overload + for self.merge
+        """
+        return self.merge(other)
+
+
+    def _locate(self, keys):
+        """
+        First bucket and fingerprint of each key, from the two
+        halves of a 128-bit hash value.
+        """
+        h1, h2 = self._hashes.hash128Batch(keys)
+        buckets = (h1 & np.uint64(self._mask)).astype(np.intp)
+        fps = h2 % np.uint64((1 << self._bits) - 1) + np.uint64(1)
+        return buckets, fps.astype(self._table.dtype)
+
+
+    def _checkRoom(self):
+        """
+        Raise ValueError if some fingerprints are in the stash.
+        """
+        if len(self._stash):
+            raise ValueError('the filter is full')
+
+
+    def _stashed(self, buckets, fps):
+        """
+        Encode fingerprints with their bucket, as in the stash.
+        """
+        return buckets.astype(np.uint64) << np.uint64(self._bits) | \
+            fps.astype(np.uint64)
+
+
+    def _unstash(self, stash):
+        """
+        Buckets and fingerprints of encoded stash entries.
+        """
+        return (stash >> np.uint64(self._bits)).astype(np.intp), \
+            (stash & np.uint64((1 << self._bits) - 1)).astype(
+                self._table.dtype)
+
+
+    def _alternate(self, buckets, fps):
+        """
+        The other bucket of each fingerprint, from its bucket and
+        a hash of the fingerprint only.
+        """
+        h = (fps.astype(np.uint64) * np.uint64(0xc6a4a7935bd1e995)) \
+            >> np.uint64(32)
+        return buckets ^ (h & np.uint64(self._mask)).astype(np.intp)
+
+
+    def _insert(self, buckets, fps):
+        """
+        Insert fingerprints in rounds: each round fills at most one
+        slot per bucket, in the first candidate bucket with room.
+        The fingerprints whose buckets are both full are moved in,
+        or stashed once the table is full.
+        """
+        others = self._alternate(buckets, fps)
+        size = self._table.shape[1]
+        pending = np.arange(len(fps))
+        full = [np.zeros(0, dtype=np.intp)]
+        while len(pending):
+            first, second = buckets[pending], others[pending]
+            target = np.where(self._counts[first] < size, first,
+                              np.where(self._counts[second] < size,
+                                       second, -1))
+            full.append(pending[target < 0])
+            pending, target = pending[target >= 0], target[target >= 0]
+            target, index = np.unique(target, return_index=True)
+            self._table[target, self._counts[target]] = fps[pending[index]]
+            self._counts[target] += 1
+            self._size += len(target)
+            rest = np.ones(len(pending), dtype=bool)
+            rest[index] = False
+            pending = pending[rest]
+        full = np.concatenate(full)
+        for n, i in enumerate(full):
+            if len(self._stash):
+                # the table is full, no need to try the rest
+                rest = full[n:]
+                self._stash = np.append(self._stash, self._stashed(
+                    buckets[rest], fps[rest]))
+                self._size += len(rest)
+                break
+            self._kick(buckets[i], others[i], fps[i])
+
+
+    def _kick(self, first, second, fp):
+        """
+        Insert one fingerprint when both of its buckets are full,
+        moving random fingerprints to their other bucket. The last
+        fingerprint moved goes to the stash if no room is found.
+        """
+        bucket = first if randint(0, 1) else second
+        size = self._table.shape[1]
+        for i in xrange(self._MAX_KICKS):
+            slot = randint(0, size - 1)
+            fp, self._table[bucket, slot] = self._table[bucket, slot], fp
+            # arrays wrap around silently where scalars would warn
+            bucket = self._alternate(np.array([bucket]), np.array([fp]))[0]
+            if self._counts[bucket] < size:
+                self._table[bucket, self._counts[bucket]] = fp
+                self._counts[bucket] += 1
+                self._size += 1
+                return
+        self._stash = np.append(self._stash, self._stashed(
+            np.array([bucket]), np.array([fp])))
+        self._size += 1
+
+
+    def _delete(self, buckets, fps):
+        """
+        Delete one copy of each fingerprint in rounds, at most one
+        per bucket in each round, keeping the buckets packed.
+        """
+        others = self._alternate(buckets, fps)
+        pending = np.arange(len(fps))
+        while len(pending):
+            first, second, fp = buckets[pending], others[pending], \
+                fps[pending]
+            inFirst = (self._table[first] == fp[:, None]).any(axis=1)
+            inSecond = (self._table[second] == fp[:, None]).any(axis=1)
+            target = np.where(inFirst, first, np.where(inSecond, second, -1))
+            for i in pending[target < 0]:
+                hit = np.flatnonzero(np.in1d(self._stash, self._stashed(
+                    np.array([buckets[i], others[i]]), fps[[i, i]])))
+                if len(hit):
+                    self._stash = np.delete(self._stash, hit[0])
+                    self._size -= 1
+            pending, target = pending[target >= 0], target[target >= 0]
+            target, index = np.unique(target, return_index=True)
+            slot = np.argmax(self._table[target] ==
+                             fps[pending[index]][:, None], axis=1)
+            last = self._counts[target] - 1
+            self._table[target, slot] = self._table[target, last]
+            self._table[target, last] = 0
+            self._counts[target] -= 1
+            self._size -= len(target)
+            rest = np.ones(len(pending), dtype=bool)
+            rest[index] = False
+            pending = pending[rest]
+        if len(self._stash):
+            # there may be room for them now
+            stash = self._stash
+            self._stash = np.zeros(0, dtype=np.uint64)
+            self._size -= len(stash)
+            self._insert(*self._unstash(stash))
+
+
+    def _contains(self, buckets, fps):
+        """
+        Membership of a chunk of fingerprints.
+        """
+        others = self._alternate(buckets, fps)
+        found = (self._table[buckets] == fps[:, None]).any(axis=1) | \
+            (self._table[others] == fps[:, None]).any(axis=1)
+        if len(self._stash):
+            found |= np.in1d(self._stashed(buckets, fps), self._stash) | \
+                np.in1d(self._stashed(others, fps), self._stash)
+        return found
+
+
+class ScalableBloomFilter(Sketch):
+    """
+    Scalable Bloom filter.
+    a chain of Bloom filters which grows with the number of distinct
+    keys. Filter i holds capacity * growth^i keys with false positive
+    rate fpr * (1 - ratio) * ratio^i, so the false positive rate of
+    the chain stays below fpr however many keys are processed.
+    """
+    # the bits of the filters are written one buffer each, see _parts
+    _BUFFERS = ('_bits', '_counts')
+    _HASHES = ('_hashes',)
+    _STATE = ('_capacity', '_fpr', '_growth', '_ratio', '_hash')
+
+    def __init__(self, capacity=10000, fpr=0.01, growth=2, ratio=0.9):
+        """
+        Create a new instance.
+
+        :param capacity: number of keys of the first filter
+        :type capacity: int
+
+        :param fpr: false positive rate of the chain
+        :type fpr: float
+
+        :param growth: ratio between the capacities of consecutive
+                       filters
+        :type growth: int
+
+        :param ratio: ratio between the false positive rates of
+                      consecutive filters
+        :type ratio: float
+        """
+        if capacity < 1:
+            raise ValueError('capacity should >= 1')
+        if fpr <= 0 or fpr >= 1:
+            raise ValueError('fpr should be in (0, 1)')
+        if type(growth) is not int:
+            raise TypeError('growth should be int')
+        if growth < 1:
+            raise ValueError('growth should >= 1')
+        if ratio <= 0 or ratio >= 1:
+            raise ValueError('ratio should be in (0, 1)')
+
+        self._capacity = capacity
+        self._fpr = fpr
+        self._growth = growth
+        self._ratio = ratio
+        # the filters share one hash function, and the number of
+        # distinct keys added to each of them
+        self._hashes = MurmurHash()
+        self._hash = hash(self)
+        self._filters = []
+        self._counts = []
+        self._grow()
+
+
+    def processBatch(self, dataStream):
+        """
+        Add the keys of the given data stream, chunk by chunk with
+        numpy.
+
+        :param dataStream: any iterable object with hashable elements.
+                           e.g. a list of integers, or a numpy array.
+        """
+        for chunk in utils.chunks(dataStream):
+            self._add(*self._hashes.hash128Batch(chunk))
+
+
+    def processItem(self, item):
+        """
+        Add one key.
+
+        :param item: hashable object to be processed
+                     e.g. an integer
+        """
+        self._add(*self._hashes.hash128Batch([item]))
+
+
+    def containsMany(self, keys):
+        """
+        Test whether many keys have been processed at once.
+
+        :param keys: a numpy array or any sequence of hashable objects
+
+        :return: False for the keys never processed, True for the
+                 processed keys and a few false positives
+        :rtype: numpy.ndarray of bool
+        """
+        return np.concatenate([self._contains(
+            *self._hashes.hash128Batch(chunk))
+            for chunk in utils.chunks(keys)] or [np.zeros(0, dtype=bool)])
+
+
+    def __contains__(self, key):
+        """
+        Overload in for membership of one key.
+        """
+        return bool(self._contains(*self._hashes.hash128Batch([key]))[0])
+
+
+    def estimate(self):
+        """
+        Number of distinct keys added, keys taken for false positives
+        are not counted.
+
+        :return: number of distinct keys
+        :rtype: int
+        """
+        return sum(self._counts)
+
+
+    def __len__(self):
+        """
+        Number of filters in the chain.
+        """
+        return len(self._filters)
+
+
+    def reproduce(self, num=1):
+        """
+        Reproduce ScalableBloomFilter instance(s) to have the same
+        internal status.
+
+        :param num: number of instances to be reproduced
+        :type num: int
+
+        :return: reproduced instance. if num > 1, a list 
+                 of instances will be returned
+        """
+        if type(num) is not int:
+            raise TypeError('num should be int')
+        if num < 1:
+            raise ValueError('num should >= 1')
+
+        if num == 1:
+            return copy.deepcopy(self)
+        else:
+            return [copy.deepcopy(self) for i in xrange(num)]
+
+
+    def merge(self, other):
+        """
+        Merge two ScalableBloomFilter instances if they are
+        compatible: filters at the same position are merged. The
+        false positive rate of a merged filter holding more keys than
+        its capacity is larger than planned.
+
+        :param other: an instance of ScalableBloomFilter reproduced
+                      from the same instance
+        """
+        if other._hash != self._hash:
+            raise ValueError('two instances are not compatible')
+
+        res = copy.deepcopy(self)
+        while len(res._filters) < len(other._filters):
+            res._grow()
+        for i, f in enumerate(other._filters):
+            res._filters[i]._bits = res._filters[i]._bits | f._bits
+            res._counts[i] += other._counts[i]
+        return res
+
+
+    def __add__(self, other):
+        """
+        Overload + for self.merge
+        """
+        return self.merge(other)
+
+
+    def _parts(self):
+        flat = copy.copy(self)
+        flat._bits = [f._bits for f in self._filters]
+        flat._counts = np.array(self._counts, dtype=np.uint64)
+        return super(ScalableBloomFilter, flat)._parts()
+
+
+    @classmethod
+    def fromBytes(cls, data):
+        """
+        Create a ScalableBloomFilter from its serialized form. The
+        bits of the full filters are read in place, without copy.
+
+        :param data: bytes-like object returned by toBytes
+
+        :return: the deserialized chain
+        :rtype: ScalableBloomFilter
+        """
+        res = super(ScalableBloomFilter, cls).fromBytes(data)
+        bits, counts = res.__dict__.pop('_bits'), res._counts.tolist()
+        res._filters, res._counts = [], []
+        while len(res._filters) < len(bits):
+            res._grow()
+        for f, b in zip(res._filters, bits):
+            f._bits = b
+        res._counts = counts
+        # only the last filter gets new keys
+        last = res._filters[-1]
+        if not last._bits.flags.writeable:
+            last._bits = last._bits.copy()
+        return res
+
+
+    def _grow(self):
+        """
+        Append a larger filter with a lower false positive rate.
+        """
+        i = len(self._filters)
+        f = BloomFilter(capacity=self._capacity * self._growth ** i,
+                        fpr=self._fpr * (1 - self._ratio) * self._ratio ** i)
+        f._hashes = self._hashes
+        f._hash = self._hash
+        self._filters.append(f)
+        self._counts.append(0)
+
+
+    def _add(self, h1, h2):
+        """
+        Add the keys not found yet to the last filter, growing the
+        chain when it is full.
+        """
+        new = ~self._contains(h1, h2)
+        h1, h2 = h1[new], h2[new]
+        # a key repeated in the chunk is added and counted once
+        pairs = np.empty(len(h1), dtype=[('h1', np.uint64), ('h2', np.uint64)])
+        pairs['h1'], pairs['h2'] = h1, h2
+        first = np.sort(np.unique(pairs, return_index=True)[1])
+        h1, h2 = h1[first], h2[first]
+        while len(h1):
+            f = self._filters[-1]
+            room = f._capacity - self._counts[-1]
+            if room <= 0:
+                self._grow()
+                continue
+            utils.setbits(f._bits, f._positions(h1[:room], h2[:room]).ravel())
+            self._counts[-1] += min(room, len(h1))
+            h1, h2 = h1[room:], h2[room:]
+
+
+    def _contains(self, h1, h2):
+        """
+        Membership of a chunk of hashed keys. The largest filters are
+        tested first, and a key found is not tested again.
+        """
+        found = np.zeros(len(h1), dtype=bool)
+        pending = np.arange(len(h1))
+        for f in reversed(self._filters):
+            hit = f._lookup(h1[pending], h2[pending])
+            found[pending[hit]] = True
+            pending = pending[~hit]
+            if len(pending) == 0:
+                break
+        return found
+
+
+
+def _sharedZeros(shape, dtype):
+    """
+    Array of zeros in anonymous shared memory, inherited by the
+    processes forked afterwards. The pages are allocated lazily,
+    on first write.
+    """
+    dtype = np.dtype(dtype)
+    count = int(np.prod(shape))
+    data = mmap.mmap(-1, max(1, count * dtype.itemsize))
+    return np.frombuffer(data, dtype=dtype, count=count).reshape(shape)
+
+
+class _SharedSketch(Sketch):
+    """
+    Sketch whose counters live in memory shared by processes, split
+    into shards. Each worker updates its own shard, so no update is
+    lost to a race, and the queries combine the shards in place.
+    """
+    # name of the buffer of the plain sketch held in shared memory
+    _BUFFER = None
+
+    def _share(self, sketch, shards):
+        """
+        Move the counters of the plain sketch into shared memory,
+        with one copy per shard.
+        """
+        if type(shards) is not int:
+            raise TypeError('shards should be int')
+        if shards < 1:
+            raise ValueError('shards should >= 1')
+        buf = getattr(sketch, self._BUFFER)
+        self._shards = _sharedZeros((shards,) + buf.shape, buf.dtype)
+        self._base = self._view(sketch, 0)
+        self._hash = sketch._hash
+
+
+    def _view(self, sketch, i):
+        """
+        Plain sketch, sharing its hashes with sketch, whose counters
+        are shard i.
+        """
+        res = object.__new__(type(sketch))
+        res.__dict__.update(sketch.__dict__)
+        setattr(res, self._BUFFER, self._shards[i])
+        return res
+
+
+    def shard(self, i):
+        """
+        Return the shard i as a plain sketch. Its counters are not
+        copied: its updates are seen by every process sharing this
+        instance. Give each worker process its own shard.
+
+        :param i: index of the shard
+        :type i: int
+
+        :return: plain sketch updating the shard i
+        """
+        if not 0 <= i < len(self._shards):
+            raise IndexError('there are %d shards' % len(self._shards))
+        return self._view(self._base, i)
+
+
+    def processBatch(self, *args, **kwargs):
+        """
+        Summarize the given data stream into the first shard, see
+        the plain sketch for the arguments.
+        """
+        self._base.processBatch(*args, **kwargs)
+
+
+    def processItem(self, *args, **kwargs):
+        """
+        Summarize one item into the first shard, see the plain
+        sketch for the arguments.
+        """
+        self._base.processItem(*args, **kwargs)
+
+
+    def snapshot(self):
+        """
+        Return a plain sketch holding the counters of all the shards
+        combined, copied out of shared memory.
+
+        :return: plain sketch summarizing all the shards
+        """
+        res = self._view(self._base, 0)
+        setattr(res, self._BUFFER, self._combine())
+        for name in res._HASHES:
+            setattr(res, name, copy.deepcopy(getattr(res, name)))
+        return res
+
+
+    def _combine(self):
+        """
+        Counters of all the shards combined, of the same type as the
+        counters of a shard. Raise OverflowError where integer
+        counters would wrap around.
+        """
+        res = self._shards[0].copy()
+        for shard in self._shards[1:]:
+            res = _sumOf(res, shard)
+        return res
+
+
+    def reproduce(self, num=1):
+        """
+        Reproduce instance(s) to have the same internal status, each
+        in its own shared memory.
+
+        :param num: number of instances to be reproduced
+        :type num: int
+
+        :return: reproduced instance. if num > 1, a list
+                 of instances will be returned
+        """
+        if type(num) is not int:
+            raise TypeError('num should be int')
+        if num < 1:
+            raise ValueError('num should >= 1')
+
+        res = []
+        for i in xrange(num):
+            other = object.__new__(type(self))
+            other._share(self._base, len(self._shards))
+            other._shards[...] = self._shards
+            res.append(other)
+        return res[0] if num == 1 else res
+
+
+    def merge(self, other):
+        """
+        Merge with a compatible instance, shared or not.
+
+        :param other: a shared instance, or an instance of the plain
+                      sketch
+
+        :return: plain sketch summarizing both
+        """
+        if isinstance(other, _SharedSketch):
+            other = other.snapshot()
+        return self.snapshot().merge(other)
+
+
+    def __add__(self, other):
+        """
+        Overload + for self.merge
+        """
+        return self.merge(other)
+
+
+    def _parts(self):
+        # serialized as the plain sketch
+        return self.snapshot()._parts()
+
+
+    def __getstate__(self):
+        raise TypeError('%s lives in shared memory: fork the processes '
+                        'that use it, or pickle its snapshot'
+                        % type(self).__name__)
+
+
+
+class SharedCountMin(_SharedSketch):
+    """
+    Count-Min sketch updated by many processes at once. The counters
+    live in shared memory, one copy per shard, and are summed when
+    queried.
+
+    e.g. with one worker process per shard::
+
+        cm = SharedCountMin(w=1 << 20, mu=5, shards=4)
+        workers = [Process(target=cm.shard(i).processBatch,
+                           args=(chunk,))
+                   for i, chunk in enumerate(chunks)]
+
+    The workers should be forked, e.g. by multiprocessing on unix.
+    """
+    _BUFFER = '_sketch'
+
+    def __init__(self, w=20, mu=5, typecode='i', shards=2):
+        """
+        Create a new instance.
+
+        :param w: The number of buckets.
+        :type w: int
+
+        :param mu: The number of repeated copies. Used to control the
+                   failure probability ~= 2^{-mu}
+        :type mu: int
+
+        :param typecode: type to represent the frequencies, check
+                         docs.python.org for module `array`
+
+        :param shards: The number of shards, one per worker process.
+        :type shards: int
+        """
+        self._share(CountMin(w=w, mu=mu, typecode=typecode), shards)
+
+
+    def estimate(self, key):
+        """
+        Estimate the frequency of given item, over all the shards.
+
+        :param key: key/item in the data stream
+
+        :return: estimated frequency of the given key.
+        :rtype: int/real
+        """
+        base = self._base
+        return min(self._shards[:, i, h % base._w].sum()
+                   for i, h in enumerate(hash64Each(base._hashes, key)))
+
+
+
+class SharedCountSketch(_SharedSketch):
+    """
+    Count Sketch updated by many processes at once. The counters
+    live in shared memory, one copy per shard, and are summed when
+    queried. See SharedCountMin for an example.
+    """
+    _BUFFER = '_sketch'
+
+    def __init__(self, w=20, mu=5, typecode='i', shards=2):
+        """
+        Create a new instance.
+
+        :param w: The number of buckets.
+        :type w: int
+
+        :param mu: The number of repeated copies. Used to control the
+                   failure probability ~= 2^{-mu}
+        :type mu: int
+
+        :param typecode: type to represent the frequencies, check
+                         docs.python.org for module `array`
+
+        :param shards: The number of shards, one per worker process.
+        :type shards: int
+        """
+        self._share(CountSketch(w=w, mu=mu, typecode=typecode), shards)
+
+
+    def estimate(self, key):
+        """
+        Estimate the frequency of given item, over all the shards.
+
+        :param key: key/item in the data stream
+
+        :return: estimated frequency of the given key.
+        :rtype: int/real
+        """
+        base = self._base
+        signs = hash64Each(base._sign, key)
+        return utils.median([
+            ((signs[i] & 1) * 2 - 1) * self._shards[:, i, h % base._w].sum()
+            for i, h in enumerate(hash64Each(base._hashes, key))])
+
+
+
+class SharedHyperLogLog(_SharedSketch):
+    """
+    HyperLogLog updated by many processes at once. The registers
+    live in shared memory, one copy per shard, and the largest of
+    each register is taken when queried. See SharedCountMin for an
+    example.
+    """
+    _BUFFER = '_registers'
+
+    def __init__(self, p=14, shards=2):
+        """
+        Create a new instance.
+
+        :param p: precision, the number of registers is 2^p
+        :type p: int
+
+        :param shards: The number of shards, one per worker process.
+        :type shards: int
+        """
+        self._share(HyperLogLog(p=p, sparse=False), shards)
+
+
+    def estimate(self):
+        """
+        Estimate the number of distinct elements, over all the
+        shards.
+
+        :return: estimated number of distinct elements
+        :rtype: real
+        """
+        return _ertlEstimate(self._combine(), self._base._p)
+
 
+    def _combine(self):
+        return self._shards.max(axis=0)
@@ -1,7 +1,8 @@
 
 
 
-
+import numpy as np
+from itertools import islice
 
 def median(numbers):
     st = sorted(numbers)
@@ -23,6 +24,54 @@ def zeros(numbers):
         p += 1
     return p 
 
+#Number of bits needed to represent each integer in an uint64 array
+def bitlength(numbers):
+    numbers = np.asarray(numbers, dtype=np.uint64)
+    hi = (numbers >> np.uint64(32)).astype(np.float64)
+    lo = (numbers & np.uint64(0xffffffff)).astype(np.float64)
+    # frexp gives the exact exponent as both halves fit in a float64
+    return np.where(hi > 0, np.frexp(hi)[1] + 32, np.frexp(lo)[1])
+
+#Vectorized zeros over an uint64 array
+def zerosBatch(numbers):
+    numbers = np.asarray(numbers, dtype=np.uint64)
+    lowest = numbers & (~numbers + np.uint64(1))
+    return np.where(numbers == 0, 0, bitlength(lowest) - 1)
+
+_POPCOUNT = np.array([bin(i).count('1') for i in xrange(256)], dtype=np.uint8)
+
+#Counts the set bits of a packed uint8 bitmap
+def popcount(bitmap):
+    return int(_POPCOUNT[bitmap].sum())
+
+#Sets the given bit positions of a packed uint8 bitmap, one pass per
+#bit offset so that repeated bytes in a pass get the same mask
+def setbits(bitmap, positions):
+    positions = np.asarray(positions, dtype=np.uint64)
+    byte = (positions >> np.uint64(3)).astype(np.intp)
+    offset = (positions & np.uint64(7)).astype(np.uint8)
+    for i in xrange(8):
+        bitmap[byte[offset == i]] |= np.uint8(1 << i)
+
+#Tests the given bit positions of a packed uint8 bitmap
+def getbits(bitmap, positions):
+    positions = np.asarray(positions, dtype=np.uint64)
+    byte = bitmap[(positions >> np.uint64(3)).astype(np.intp)]
+    return (byte >> (positions & np.uint64(7)).astype(np.uint8)) & 1 == 1
+
+#Splits a data stream into numpy arrays or lists of at most size items
+def chunks(dataStream, size=1 << 16):
+    if isinstance(dataStream, np.ndarray):
+        for i in xrange(0, len(dataStream), size):
+            yield dataStream[i:i + size]
+    else:
+        it = iter(dataStream)
+        while True:
+            chunk = list(islice(it, size))
+            if not chunk:
+                return
+            yield chunk
+
 from functools import wraps
 
 class DocInherit(object):
@@ -0,0 +1,47 @@
+import pytest
+import numpy as np
+
+from streamlib.generators import AliasSampler
+class Test_AliasSampler(object):
+
+    def test_sample(self):
+        a = AliasSampler([1, 2, 0, 5], keys=['a', 'b', 'c', 'd'], seed=1)
+        sample = a.sample(80000)
+        freqs = [(sample == key).mean() for key in 'abcd']
+        assert np.allclose(freqs, [.125, .25, 0, .625], atol=0.01)
+        assert a.sample() in 'abd'
+        with pytest.raises(ValueError):
+            AliasSampler([0, 0])
+
+
+    def test_stream(self):
+        a = AliasSampler(np.ones(10), seed=2)
+        sizes = [len(chunk) for chunk in a.stream(count=250, chunkSize=100)]
+        assert sizes == [100, 100, 50]
+        b = AliasSampler(np.ones(10), seed=3)
+        c = AliasSampler(np.ones(10), seed=3)
+        assert (next(b.stream(chunkSize=100)) == c.sample(100)).all()
+
+
+from streamlib.generators import zipfStream, uniformStream, paretoStream
+class Test_Streams(object):
+
+    def test_zipf(self):
+        chunks = list(zipfStream(100, s=1., count=200000, seed=3))
+        counts = np.bincount(np.concatenate(chunks), minlength=100)
+        assert counts.sum() == 200000
+        assert abs(counts[0] / float(counts[9]) - 10) < 1.5
+
+
+    def test_uniform(self):
+        keys = np.concatenate(list(uniformStream(10, count=100000, seed=4)))
+        counts = np.bincount(keys, minlength=10)
+        assert len(counts) == 10
+        assert (np.abs(counts - 10000) < 500).all()
+
+
+    def test_pareto(self):
+        values = np.concatenate(list(paretoStream(alpha=1.5, scale=2.,
+                                                  count=100000, seed=5)))
+        assert values.min() >= 2
+        assert abs((values > 20).mean() - 10 ** -1.5) < 0.005
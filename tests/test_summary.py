@@ -1,5 +1,8 @@
 import pytest
 import math
+import multiprocessing
+import pickle
+import numpy as np
 
 from streamlib import CountMin
 class Test_CountMin(object):
@@ -30,6 +33,85 @@ class Test_CountMin(object):
         assert c.estimate(1) == 9
         assert c.estimate(2) == 1
         assert c.estimate(3) == 2
+
+
+    def test_batch(self):
+        a = CountMin(w=50, mu=5)
+        b = a.reproduce()
+        ls = [(i % 37, i % 5 + 1) for i in xrange(1000)]
+        a.processBatch(ls, True)
+        for item in ls:
+            b.processItem(item, True)
+        assert (a._sketch == b._sketch).all()
+        assert a.estimate(1) >= 27 * 3
+
+
+    def test_overflow(self):
+        a = CountMin(w=10, mu=3, typecode='b')
+        b = a.reproduce()
+        a.processBatch([1] * 127)
+        for item in [1] * 127:
+            b.processItem(item)
+        for c in (a, b):
+            sketch = c._sketch.copy()
+            with pytest.raises(OverflowError):
+                c.processBatch([1, 2])
+            with pytest.raises(OverflowError):
+                c.processItem(1)
+            assert (c._sketch == sketch).all()
+        with pytest.raises(OverflowError):
+            a + b
+
+
+    def test_weights(self):
+        a = CountMin(w=10, mu=3)
+        b = CountMin(w=10, mu=3, typecode='d')
+        b._hashes = a._hashes
+        for c in (a, b):
+            c.processBatch([(1, 2.)] * 2, True)
+            c.processItem((1, 2.), True)
+        with pytest.raises(TypeError):
+            a.processBatch([(1, .5)] * 4, True)
+        with pytest.raises(TypeError):
+            a.processItem((1, .5), True)
+        assert a.estimate(1) == 6
+        b.processBatch([(1, .5)] * 2, True)
+        b.processItem((1, .5), True)
+        assert b.estimate(1) == 7.5
+
+
+    def test_bytes(self):
+        a = CountMin(w=1 << 12, mu=5)
+        a.processBatch([1, 1, 1, 2, 1, 1, 1])
+        data = a.toBytes()
+        assert len(data) < 5 * 4 * (1 << 12) + 256
+        b = CountMin.fromBytes(data)
+        assert b.estimate(1) == 6 and b.estimate(2) == 1
+        with pytest.raises(ValueError):
+            b.processItem(1)
+        c = CountMin.fromBytes(bytearray(data))
+        c.processItem(2)
+        assert c.estimate(2) == 2
+        assert (c + a).estimate(1) == 12
+        with pytest.raises(ValueError):
+            CountMedian.fromBytes(data)
+
+
+    def test_open(self, tmpdir):
+        path = str(tmpdir.join('counters'))
+        a = CountMin(w=1 << 12, mu=5, typecode='Q')
+        a.processBatch([1, 1, 1, 2, 1, 1, 1])
+        a.save(path)
+        b = CountMin.open(path)
+        b.processBatch([2, 2])
+        c = CountMin.open(path, 'r')
+        assert c.estimate(1) == 6 and c.estimate(2) == 3
+        with pytest.raises(ValueError):
+            c.processItem(1)
+        d = CountMin.open(path, 'c')
+        d.processItem(1)
+        assert d.estimate(1) == 7 and CountMin.open(path).estimate(1) == 6
+        assert (b + a).estimate(2) == 4
         
 
 
@@ -63,6 +145,16 @@ class Test_CountMedian(object):
         assert c.estimate(3) == 2
 
 
+    def test_batch(self):
+        a = CountMedian(w=50, mu=5)
+        b = a.reproduce()
+        ls = [(i % 37, i % 5 - 2) for i in xrange(1000)]
+        a.processBatch(ls, True)
+        for item in ls:
+            b.processItem(item, True)
+        assert (a._sketch == b._sketch).all()
+
+
 from streamlib import F2
 class Test_F2(object):
     
@@ -109,6 +201,39 @@ class Test_DistinctElement(object):
         assert value < 1.5*answer
         assert value > answer/1.5
 
+    def test_bitmap(self):
+        a = DistinctElement(n=2**20, mu=5, bitmap=4096)
+        b = a.reproduce()
+        a.processBatch(range(200) * 3)
+        for item in range(100, 300):
+            b.processItem(item)
+        assert abs(a.estimate() - 200) < 10
+        assert abs((a + b).estimate() - 300) < 15
+        a.processBatch(np.arange(10000))
+        assert a.bitmap is None
+        assert (a + b).bitmap is None
+
+from streamlib import PCSA
+class Test_PCSA(object):
+
+    def test_estimate(self):
+        a = PCSA(m=256)
+        b = a.reproduce()
+        a.processBatch(np.arange(50000))
+        for item in xrange(1000):
+            b.processItem(item)
+        assert abs(a.estimate() - 50000) < 0.2 * 50000
+        assert abs(b.estimate() - 1000) < 0.2 * 1000
+
+    def test_merge(self):
+        a = PCSA(m=256)
+        b = a.reproduce()
+        with pytest.raises(ValueError):
+            a + PCSA(m=256)
+        a.processBatch(np.arange(0, 30000))
+        b.processBatch(np.arange(20000, 50000))
+        assert abs((a + b).estimate() - 50000) < 0.2 * 50000
+
 from streamlib import BJKST
 class Test_BJKST(object):
 
@@ -119,3 +244,871 @@ class Test_BJKST(object):
         value = a.estimate()
         assert value == 2
 
+    def test_batch(self):
+        a = BJKST(n=10**6, mu=5, eps=.1)
+        b = a.reproduce()
+        ls = range(5000)
+        a.processBatch(np.array(ls))
+        for item in ls:
+            b.processItem(item)
+        assert a.sketch == b.sketch
+        assert a.estimate() == b.estimate()
+        assert max(a._count) < a._thresh
+
+    def test_merge(self):
+        a = BJKST(n=10**6, mu=9, eps=.05)
+        b = a.reproduce()
+        with pytest.raises(ValueError):
+            a + BJKST(n=10**6, mu=9, eps=.05)
+        a.processBatch(np.arange(0, 30000))
+        b.processBatch(np.arange(20000, 50000))
+        value = (a + b).estimate()
+        assert abs(value - 50000) < 0.25 * 50000
+
+
+from streamlib import HyperLogLog
+class Test_HyperLogLog(object):
+
+    def test_sparse(self):
+        a = HyperLogLog(p=14)
+        a.processBatch(range(1000) * 3)
+        assert abs(a.estimate() - 1000) < 10
+
+    def test_dense(self):
+        a = HyperLogLog(p=14)
+        b = HyperLogLog(p=14, sparse=False)
+        ls = range(50000)
+        a.processBatch(ls)
+        b.processBatch(ls)
+        assert a._registers is not None
+        assert abs(a.estimate() - 50000) < 0.05 * 50000
+        assert abs(b.estimate() - 50000) < 0.05 * 50000
+
+    def test_merge(self):
+        a = HyperLogLog(p=12)
+        b = a.reproduce()
+        with pytest.raises(ValueError):
+            a + HyperLogLog(p=12)
+        a.processBatch(range(0, 3000))
+        b.processBatch(range(2000, 20000))
+        c = a + b
+        assert abs(c.estimate() - 20000) < 0.1 * 20000
+        d = a + a.reproduce()
+        assert abs(d.estimate() - 3000) < 0.1 * 3000
+
+    def test_batch(self):
+        a = HyperLogLog(p=10)
+        b = a.reproduce()
+        ls = range(20000)
+        a.processBatch(np.array(ls))
+        for item in ls:
+            b.processItem(item)
+        assert (a._registers == b._registers).all()
+
+    def test_unionAll(self):
+        a = HyperLogLog(p=12, sparse=False)
+        sketches = a.reproduce(10)
+        for i, s in enumerate(sketches):
+            s.processBatch(np.arange(i * 1000, (i + 2) * 1000))
+        c = HyperLogLog.unionAll(sketches)
+        assert abs(c.estimate() - 11000) < 0.1 * 11000
+
+    def test_bytes(self):
+        a = HyperLogLog(p=12)
+        a.processBatch(range(100))
+        a.processItem(100)
+        b = HyperLogLog.fromBytes(bytearray(a.toBytes()))
+        assert b.estimate() == a.estimate()
+        b.processBatch(np.arange(100000))
+        assert abs(b.estimate() - 100000) < 0.1 * 100000
+        c = HyperLogLog.fromBytes(b.toBytes())
+        assert c.estimate() == b.estimate()
+
+    def test_open(self, tmpdir):
+        path = str(tmpdir.join('registers'))
+        a = HyperLogLog(p=12)
+        a.processBatch(range(100))
+        a.save(path)
+        with pytest.raises(NotImplementedError):
+            HyperLogLog.open(path)
+        assert HyperLogLog.open(path, 'r').estimate() == a.estimate()
+        HyperLogLog(p=12, sparse=False).save(path)
+        HyperLogLog.open(path).processBatch(np.arange(100000))
+        b = HyperLogLog.open(path, 'r')
+        assert abs(b.estimate() - 100000) < 0.1 * 100000
+
+from streamlib import SlidingHyperLogLog
+class Test_SlidingHyperLogLog(object):
+
+    def test_estimate(self):
+        a = SlidingHyperLogLog(p=12, window=900)
+        b = a.reproduce()
+        t = np.arange(36000) / 10.
+        a.processBatch(t, np.arange(36000))
+        for item in zip(t[:3000], range(3000)):
+            b.processItem(item)
+        b.processBatch(zip(t[3000:], range(3000, 36000)))
+        assert (a._times == b._times).all()
+        assert abs(a.estimate() - 9000) < 0.1 * 9000
+        assert abs(a.estimate(60) - 600) < 0.1 * 600
+        assert abs(a.estimate(60, now=3630) - 300) < 0.1 * 300
+        assert a.estimate(60, now=5000) == 0
+        with pytest.raises(ValueError):
+            a.estimate(60, now=100)
+
+    def test_merge(self):
+        a = SlidingHyperLogLog(p=12, window=100)
+        b = a.reproduce()
+        with pytest.raises(ValueError):
+            a + SlidingHyperLogLog(p=12)
+        a.processBatch(np.arange(1000.), np.arange(1000) % 50)
+        b.processBatch(np.arange(500.), np.arange(500))
+        assert abs((a + b).estimate() - 50) < 0.1 * 50
+        assert abs((a + b).estimate(1000) - 500) < 0.1 * 500
+
+from streamlib import KMV
+class Test_KMV(object):
+
+    def test_estimate(self):
+        a = KMV(k=1024)
+        b = a.reproduce()
+        a.processBatch(np.arange(100000))
+        for item in xrange(100000):
+            b.processItem(item)
+        assert (a._values == b._values).all()
+        assert abs(a.estimate() - 100000) < 0.1 * 100000
+        c = KMV(k=1024)
+        c.processBatch([1, 2, 2, 3, 3, 3])
+        assert c.estimate() == 3
+
+    def test_set_operations(self):
+        a = KMV(k=2048)
+        b = a.reproduce()
+        with pytest.raises(ValueError):
+            a + KMV(k=2048)
+        a.processBatch(np.arange(0, 20000))
+        b.processBatch(np.arange(10000, 30000))
+        assert abs(a.union(b) - 30000) < 0.1 * 30000
+        assert abs(a.intersection(b) - 10000) < 0.2 * 10000
+        assert abs(a.jaccard(b) - 1. / 3) < 0.05
+        c = KMV.unionAll([a, b, a.reproduce()])
+        assert (c._values == (a + b)._values).all()
+
+from streamlib import ThetaSketch
+class Test_ThetaSketch(object):
+
+    def test_estimate(self):
+        a = ThetaSketch(k=1024)
+        b = a.reproduce()
+        a.processBatch(np.arange(100000))
+        for item in xrange(100000):
+            b.processItem(item)
+        assert (a._values == b._values).all()
+        assert abs(a.estimate() - 100000) < 0.1 * 100000
+        lower, upper = a.bounds()
+        assert lower < a.estimate() < upper
+
+    def test_set_operations(self):
+        a = ThetaSketch(k=2048)
+        b = a.reproduce()
+        with pytest.raises(ValueError):
+            a + ThetaSketch(k=2048)
+        a.processBatch(np.arange(0, 20000))
+        b.processBatch(np.arange(10000, 30000))
+        assert abs((a + b).estimate() - 30000) < 0.1 * 30000
+        assert abs((a & b).estimate() - 10000) < 0.2 * 10000
+        assert abs((a - b).estimate() - 10000) < 0.2 * 10000
+        c = ThetaSketch(k=2048)
+        c.processBatch([1, 2, 3, 3])
+        assert c.estimate() == 3
+
+    def test_different_k(self):
+        a = ThetaSketch(k=2048)
+        b = ThetaSketch(k=256)
+        b._hashes, b._hash = a._hashes, a._hash
+        a.processBatch(np.arange(0, 20000))
+        b.processBatch(np.arange(0, 200))
+        for c in (a + b, a & b, a - b, b - a):
+            assert c._k == 256 and len(c._values) <= 256
+        assert abs((a - b).estimate() - 19800) < 0.3 * 19800
+        assert abs((a + b).estimate() - 20000) < 0.3 * 20000
+
+    def test_serialize(self):
+        a = ThetaSketch(k=512)
+        a.processBatch(np.arange(10000))
+        b = ThetaSketch.fromBytes(a.toBytes())
+        assert b.estimate() == a.estimate()
+        assert (b + a).estimate() == a.estimate()
+        b.processBatch(np.arange(10000, 20000))
+        assert abs(b.estimate() - 20000) < 0.2 * 20000
+
+from streamlib import GroupedDistinct
+class Test_GroupedDistinct(object):
+
+    def test_estimate(self):
+        a = GroupedDistinct(p=8, capacity=4)
+        b = a.reproduce()
+        groups = np.arange(20000) % 10
+        items = np.arange(20000) * (groups + 1)
+        items[groups == 3] = 0
+        a.processBatch(groups, items)
+        b.processBatch(zip(groups, items))
+        assert len(a) == 10
+        assert a.estimate(3) == b.estimate(3)
+        assert abs(a.estimate(3) - 1) < 0.01
+        assert abs(a.estimate(5) - 2000) < 0.2 * 2000
+        assert a.estimate(10) == 0
+        assert 3 not in [g for g, e in a.top(9)]
+
+    def test_hyperloglog(self):
+        a = GroupedDistinct(p=10)
+        for n in (5, 300, 50000):
+            a.processBatch([n] * n, np.arange(n))
+            b = HyperLogLog(p=10, sparse=False)
+            b._hashes = a._itemHash
+            b.processBatch(np.arange(n))
+            assert a.estimate(n) == b.estimate()
+            assert dict(a.top(10))[n] == b.estimate()
+
+    def test_merge(self):
+        a = GroupedDistinct(p=8)
+        b = a.reproduce()
+        with pytest.raises(ValueError):
+            a + GroupedDistinct(p=8)
+        a.processBatch(['x'] * 1000 + ['y'] * 10, range(1010))
+        b.processItem(('z', 1))
+        b.processBatch(['y'] * 3000, range(3000))
+        c = a + b
+        assert len(c) == 3
+        assert c.top(1)[0][0] == 'y'
+        assert abs(c.estimate('x') - 1000) < 0.2 * 1000
+
+from streamlib import Quantile
+class Test_Quantile(object):
+
+    def test_estimate(self):
+        q = Quantile(0.001, 0, 100.0)
+        q.processBatch([1, 2, 3, 4, 1, 1, 100, 2, 5, 8])
+        assert abs(q.estimate(4) - 2) <= 0.01
+        assert abs(q.estimate(10) - 100) <= 0.2
+        with pytest.raises(ValueError):
+            q.estimate(11)
+        ls = np.arange(1, 10001)
+        q = Quantile(0.01, 0, 10000)
+        q.processBatch(zip(ls, [2] * len(ls)), weighted=True)
+        for phi, value in zip([.5, .9, .99], q.quantiles([.5, .9, .99])):
+            assert abs(value - phi * 10000) <= 0.02 * phi * 10000
+        assert abs(q.ranks([5000])[0] - 10000) <= 0.02 * 10000
+        assert abs(q.cdf([5000])[0] - .5) <= 0.02
+
+    def test_merge(self):
+        a = Quantile(0.01, 0, 1000)
+        b = a.reproduce()
+        with pytest.raises(ValueError):
+            a + Quantile(0.02, 0, 1000)
+        a.processBatch(range(0, 500))
+        b.processBatch(range(500, 1000))
+        c = a + b
+        assert abs(c.quantiles([.5])[0] - 500) <= 0.02 * 500
+        assert c.estimate(1000) >= 999
+
+    def test_batch(self):
+        a = Quantile(0.01, 0, 1000)
+        b = a.reproduce()
+        c = a.reproduce()
+        values = np.random.uniform(0, 1000, 5000)
+        weights = np.random.randint(1, 5, 5000)
+        a.processBatch(values, weights=weights)
+        b.processBatch(zip(values, weights), weighted=True)
+        for item in zip(values, weights):
+            c.processItem(item, weighted=True)
+        assert (a._counts == b._counts).all()
+        assert (a._counts == c._counts).all()
+        assert a.estimate(100) == c.estimate(100)
+
+    def test_weights(self):
+        a = Quantile(0.01, 0, 10)
+        a.processItem((3, 2.), weighted=True)
+        with pytest.raises(TypeError):
+            a.processItem((3, 2.5), weighted=True)
+        assert a._n == a._counts.sum() == 2
+        assert a.quantiles([1])[0] == a.estimate(2)
+        with pytest.raises(TypeError):
+            a.processBatch([(1, .5), (2, .5)], weighted=True)
+        with pytest.raises(TypeError):
+            a.processBatch([1, 2], weights=np.array([.5, .5]))
+        a.processBatch([1, 2], weights=np.array([1., 2.]))
+        assert a._n == a._counts.sum() == 5
+        assert abs(a.estimate(5) - 3) <= .03 and abs(a.estimate(3) - 2) <= .02
+
+from streamlib import DDSketch
+class Test_DDSketch(object):
+
+    def test_estimate(self):
+        a = DDSketch(alpha=0.01)
+        b = a.reproduce()
+        values = np.concatenate((np.random.lognormal(0, 3, 20000),
+                                 -np.random.exponential(5, 100), [0] * 10))
+        a.processBatch(values)
+        for item in values:
+            b.processItem(item)
+        assert (a._positive.counts == b._positive.counts).all()
+        phis = np.array([0, .001, .5, .9, .99, .999, 1])
+        ks = np.maximum(np.ceil(phis * len(values)), 1).astype(int)
+        exact = np.sort(values)[ks - 1]
+        assert (np.abs(a.quantiles(phis) - exact) <= 0.01 * np.abs(exact)).all()
+        assert a.estimate(1) == a.quantiles([0])[0]
+        assert a.cdf([0])[0] == 110. / len(values)
+
+    def test_merge(self):
+        a = DDSketch(alpha=0.02, maxBuckets=64)
+        b = a.reproduce()
+        with pytest.raises(ValueError):
+            a + DDSketch(alpha=0.01)
+        a.processBatch(np.arange(1, 1001))
+        b.processBatch(zip([1e6, 2e6], [2000, 1]), weighted=True)
+        c = a + b
+        assert len(c._positive.counts) <= 64
+        assert abs(c.quantiles([.9])[0] - 1e6) <= 0.02 * 1e6
+        assert abs(c.estimate(3001) - 2e6) <= 0.02 * 2e6
+
+    def test_weights(self):
+        a = DDSketch(alpha=0.01)
+        with pytest.raises(TypeError):
+            a.processBatch([(1, .5), (2, .5)], weighted=True)
+        with pytest.raises(TypeError):
+            a.processItem((0, .5), weighted=True)
+        assert a._n == 0
+        a.processBatch([1, 2], weights=[2., 1.])
+        a.processItem((0, 2.), weighted=True)
+        assert a._n == 5 and a._zero == 2
+        assert a.estimate(2) == 0 and abs(a.estimate(3) - 1) <= 0.01
+        assert abs(a.estimate(5) - 2) <= 0.02
+
+    def test_bytes(self):
+        a = DDSketch(alpha=0.02, maxBuckets=64)
+        a.processBatch(np.concatenate((np.arange(-100, 1001), [1e6])))
+        b = DDSketch.fromBytes(bytearray(a.toBytes()))
+        assert (b.quantiles([0, .5, .99, 1]) == a.quantiles([0, .5, .99, 1])).all()
+        b.processBatch([1e7, -1e7])
+        assert len(b._positive.counts) <= 64
+        assert abs(b.estimate(b._n) - 1e7) <= 0.02 * 1e7
+        assert (DDSketch.fromBytes(b.toBytes()).cdf([0, 1e6]) ==
+                b.cdf([0, 1e6])).all()
+        assert (b + a)._n == 2 * a._n + 2
+
+from streamlib import KLL
+class Test_KLL(object):
+
+    def test_estimate(self):
+        a = KLL(k=200)
+        b = a.reproduce()
+        values = np.random.permutation(100000)
+        a.processBatch(values)
+        for item in values[:20000]:
+            b.processItem(item)
+        phis = np.linspace(0, 1, 21)
+        assert (np.abs(a.quantiles(phis) - phis * 100000) < 0.02 * 100000).all()
+        assert (np.abs(b.quantiles(phis) - np.percentile(values[:20000], phis * 100))
+                < 0.02 * 100000).all()
+        assert (np.abs(a.cdf([10000, 50000]) - [.1, .5]) < 0.02).all()
+        assert abs(a.estimate(90000) - 90000) < 0.02 * 100000
+        assert len(a) < 1000
+
+    def test_merge(self):
+        a = KLL(k=100)
+        b = a.reproduce()
+        with pytest.raises(ValueError):
+            a + KLL(k=50)
+        a.processBatch(['b', 'a'] * 500)
+        b.processBatch(['d', 'c'] * 500)
+        c = a + b
+        assert list(c.quantiles([0, 1])) == ['a', 'd']
+        assert abs(c.cdf(['b'])[0] - .5) < 0.05
+
+    def test_bytes(self):
+        a = KLL(k=100)
+        a.processBatch(np.random.permutation(10000))
+        a.processItem(10000)
+        b = KLL.fromBytes(a.toBytes())
+        assert len(b) == len(a)
+        assert (b.quantiles([0, .5, 1]) == a.quantiles([0, .5, 1])).all()
+        c = b + a
+        c.processBatch(np.arange(10000))
+        assert abs(c.estimate(15000) - 5000) < 0.05 * 30000
+        d = KLL()
+        assert KLL.fromBytes(d.toBytes())._levels == [None]
+        d.processBatch(['a', 'b'])
+        with pytest.raises(ValueError):
+            d.toBytes()
+
+from streamlib import TDigest
+class Test_TDigest(object):
+
+    def test_estimate(self):
+        a = TDigest()
+        b = a.reproduce()
+        values = np.random.RandomState(0).lognormal(0, 1, 200000)
+        a.processBatch(values)
+        for item in values[:20000]:
+            b.processItem(item)
+        phis = np.array([0, .01, .5, .99, .999, 1])
+        for d, v in ((a, values), (b, values[:20000])):
+            exact = np.percentile(v, phis * 100)
+            assert (np.abs(d.quantiles(phis) - exact) < 0.05 * exact).all()
+            assert (np.abs(d.cdf(exact) - phis) < 0.01).all()
+        assert a.estimate(1) == values.min()
+        assert len(a) < 200
+
+    def test_merge(self):
+        a = TDigest(delta=100)
+        b = a.reproduce()
+        a.processBatch(np.arange(0, 5000))
+        b.processBatch(zip(np.arange(5000, 10000), [3] * 5000), weighted=True)
+        c = a + b
+        assert abs(c.quantiles([.5])[0] - 6667) < 0.02 * 6667
+        assert abs(c.cdf([2500, 8000])[0] - .125) < 0.01
+        assert abs(c.cdf([2500, 8000])[1] - .7) < 0.01
+        assert c.quantiles([1])[0] == 9999
+
+
+from streamlib import GK
+class Test_GK(object):
+
+    def test_estimate(self):
+        a = GK(eps=0.01)
+        b = a.reproduce()
+        values = np.random.permutation(100000)
+        a.processBatch(values)
+        for item in values[:10000]:
+            b.processItem(item)
+        phis = np.linspace(0, 1, 101)
+        for d, n in ((a, 100000), (b, 10000)):
+            ks = np.clip(np.ceil(phis * n), 1, n)
+            # items are 0, 1, ..., n - 1 in a, so the rank is item + 1
+            ranks = d.quantiles(phis) + 1 if d is a \
+                else np.searchsorted(np.sort(values[:10000]),
+                                     d.quantiles(phis)) + 1
+            assert (np.abs(ranks - ks) <= 0.01 * n).all()
+        assert a.estimate(1) == 0
+        assert len(a) < 1 / 0.01 * math.log(0.01 * 100000)
+
+
+    def test_merge(self):
+        a = GK(eps=0.01)
+        b = a.reproduce()
+        a.processBatch(np.arange(0, 10000))
+        b.processBatch(np.arange(10000, 30000)[::-1])
+        c = a + b
+        ranks = c.quantiles([.1, .5, .9]) + 1
+        assert (np.abs(ranks - [3000, 15000, 27000]) <= 0.01 * 30000).all()
+        assert abs(c.cdf([15000])[0] - .5) <= 0.01
+        with pytest.raises(ValueError):
+            a + GK(eps=0.1)
+
+
+from streamlib import Reservoir
+class Test_Reservoir(object):
+
+    def test_sample(self):
+        a = Reservoir(k=100)
+        b = a.reproduce()
+        a.processBatch(np.arange(1000000))
+        for item in xrange(50):
+            b.processItem(item)
+        sample = a.estimate()
+        assert len(sample) == 100 and len(set(sample)) == 100
+        assert abs(np.mean(sample) - 500000) < 150000
+        assert sorted(b.estimate()) == range(50)
+
+
+    def test_merge(self):
+        a = Reservoir(k=1000)
+        b = a.reproduce()
+        a.processBatch(np.arange(0, 10000))
+        b.processBatch(np.arange(10000, 40000))
+        c = a + b
+        sample = np.array(c.estimate())
+        assert len(sample) == 1000 and len(set(sample)) == 1000
+        assert abs((sample < 10000).mean() - .25) < .07
+        with pytest.raises(ValueError):
+            a + Reservoir(k=10)
+
+
+    def test_seed(self):
+        samples = []
+        for i in xrange(2):
+            a = Reservoir(k=100, seed=1)
+            b = a.reproduce()
+            a.processBatch(np.arange(0, 10000))
+            b.processBatch(np.arange(10000, 40000))
+            samples.append((a + b).estimate())
+        assert samples[0] == samples[1]
+        a, b = Reservoir(k=100, seed=1), Reservoir(k=100, seed=1)
+        c, d = a.reproduce(2)
+        a.processBatch(np.arange(10000))
+        b.processBatch(np.arange(10000))
+        assert a.estimate() == b.estimate()
+        c.processBatch(np.arange(10000))
+        d.processBatch(np.arange(10000))
+        assert c.estimate() != d.estimate()
+
+
+from streamlib import WeightedReservoir
+class Test_WeightedReservoir(object):
+
+    def test_sample(self):
+        a = WeightedReservoir(k=100)
+        b = a.reproduce()
+        weights = np.ones(1000000)
+        weights[::100000] = 1e9
+        a.processBatch(np.arange(1000000), weights=weights)
+        sample = [key for key, weight in a.estimate()]
+        assert len(set(sample)) == 100
+        assert set(range(0, 1000000, 100000)) <= set(sample)
+        for item in zip(range(50), [2] * 50):
+            b.processItem(item, weighted=True)
+        assert sorted(b.estimate()) == zip(range(50), [2] * 50)
+
+
+    def test_merge(self):
+        counts = np.zeros(4)
+        for i in xrange(2000):
+            a = WeightedReservoir(k=1)
+            b = a.reproduce()
+            a.processBatch([(0, 1), (1, 3)], weighted=True)
+            b.processBatch([(2, 2), (3, 4)], weighted=True)
+            counts[(a + b).estimate()[0][0]] += 1
+        assert (np.abs(counts / 2000 - [.1, .3, .2, .4]) < .05).all()
+        with pytest.raises(ValueError):
+            a + WeightedReservoir(k=10)
+
+
+    def test_seed(self):
+        samples = []
+        for i in xrange(2):
+            a = WeightedReservoir(k=100, seed=1)
+            b = a.reproduce()
+            a.processBatch(np.arange(10000), weights=np.arange(1, 10001))
+            b.processBatch(zip(np.arange(10000, 20000), [5] * 10000),
+                           weighted=True)
+            samples.append((a + b).estimate())
+        assert samples[0] == samples[1]
+        a = WeightedReservoir(k=100, seed=1)
+        b = WeightedReservoir(k=100, seed=1)
+        a.reproduce()
+        a.processBatch(np.arange(10000), weights=np.arange(1, 10001))
+        b.processBatch(np.arange(10000), weights=np.arange(1, 10001))
+        assert a.estimate() == b.estimate()
+
+
+from streamlib import PrioritySample
+class Test_PrioritySample(object):
+
+    def test_estimate(self):
+        a = PrioritySample(k=1000, seed=0)
+        b = a.reproduce()
+        random = np.random.RandomState(0)
+        keys = random.randint(0, 1000, 200000)
+        weights = random.pareto(1.5, 200000) + 1
+        a.processBatch(keys, weights=weights)
+        exact = weights[keys < 100].sum()
+        estimate, variance = a.subsetSum(lambda key: key < 100)
+        assert abs(estimate - exact) < 5 * math.sqrt(variance)
+        assert a.subsetSum(set(range(100))) == (estimate, variance)
+        assert len(a) == 1000
+        for item in [('a', 2), ('b', 1), ('a', 3)]:
+            b.processItem(item, weighted=True)
+        assert b.estimate('a') == 5
+        assert b.subsetSum(set(['b', 'c'])) == (1, 0)
+
+
+    def test_merge(self):
+        a = PrioritySample(k=1000, seed=1)
+        b = a.reproduce()
+        random = np.random.RandomState(1)
+        keys = random.randint(0, 1000, 200000)
+        weights = random.pareto(1.5, 200000) + 1
+        a.processBatch(zip(keys[:100000], weights[:100000]), weighted=True)
+        b.processBatch(keys[100000:], weights=weights[100000:])
+        c = a + b
+        exact = weights[keys < 500].sum()
+        estimate, variance = c.subsetSum(lambda key: key < 500)
+        assert abs(estimate - exact) < 5 * math.sqrt(variance)
+        with pytest.raises(ValueError):
+            a + PrioritySample(k=10)
+
+
+    def test_seed(self):
+        a, b = PrioritySample(k=100, seed=2), PrioritySample(k=100, seed=2)
+        c = a.reproduce()
+        for s in (a, b, c):
+            s.processBatch(np.arange(10000), weights=np.arange(1, 10001))
+            s.processItem((10000, 5.), weighted=True)
+        assert a.estimate(5000) == b.estimate(5000)
+        assert sorted(a._keys) == sorted(b._keys) != sorted(c._keys)
+        d = PrioritySample.fromBytes(bytearray(a.toBytes()))
+        for s in (a, d):
+            s.processBatch(np.arange(10000, 20000))
+        assert (d._priorities == a._priorities).all()
+
+
+from streamlib import BloomFilter
+class Test_BloomFilter(object):
+
+    def test_contains(self):
+        a = BloomFilter(capacity=100000, fpr=0.01)
+        keys = np.random.randint(0, 1 << 62, 100000)
+        a.processBatch(keys)
+        assert a.containsMany(keys).all()
+        others = np.random.randint(0, 1 << 62, 100000)
+        assert a.containsMany(others).mean() < 0.015
+        assert abs(a.estimate() - 100000) < 2000
+        a.processItem('a')
+        assert 'a' in a
+        assert BloomFilter(capacity=10).containsMany(['a', (1, 2)]).sum() == 0
+
+
+    def test_merge(self):
+        a = BloomFilter(capacity=1000, fpr=0.01)
+        b = a.reproduce()
+        a.processBatch(range(0, 500))
+        b.processBatch(['b'] + range(500, 1000))
+        c = a + b
+        assert c.containsMany(range(1000)).all() and 'b' in c
+        assert not b.containsMany(range(500)).all()
+        with pytest.raises(ValueError):
+            a + BloomFilter(capacity=1000, fpr=0.01)
+
+
+from streamlib import CountingBloomFilter
+class Test_CountingBloomFilter(object):
+
+    def test_delete(self):
+        a = CountingBloomFilter(capacity=100000, fpr=0.01)
+        keys = np.random.randint(0, 1 << 62, 100000)
+        a.processBatch(keys)
+        assert a.containsMany(keys).all()
+        a.deleteBatch(keys[:50000])
+        assert a.containsMany(keys[50000:]).all()
+        assert a.containsMany(keys[:50000]).mean() < 0.01
+        a.processItem('a')
+        a.processItem('a')
+        a.deleteItem('a')
+        assert 'a' in a
+        a.deleteItem('a')
+        assert 'a' not in a
+
+
+    def test_merge(self):
+        a = CountingBloomFilter(capacity=1000, fpr=0.01)
+        b = a.reproduce()
+        a.processBatch(range(0, 500))
+        b.processBatch(['b'] * 20 + range(500, 1000))
+        c = a + b
+        assert c.containsMany(range(1000)).all()
+        c.deleteBatch(range(500))
+        assert c.containsMany(range(500, 1000)).all() and 'b' in c
+        with pytest.raises(ValueError):
+            a + CountingBloomFilter(capacity=1000, fpr=0.01)
+
+
+from streamlib import CuckooFilter
+class Test_CuckooFilter(object):
+
+    def test_delete(self):
+        a = CuckooFilter(capacity=100000, fpr=0.001)
+        keys = np.random.randint(0, 1 << 62, 100000)
+        a.processBatch(keys)
+        assert a.estimate() == 100000
+        assert a.containsMany(keys).all()
+        others = np.random.randint(0, 1 << 62, 100000)
+        assert a.containsMany(others).mean() < 0.002
+        a.deleteBatch(keys[:50000])
+        assert a.estimate() == 50000
+        assert a.containsMany(keys[50000:]).all()
+        a.processItem('a')
+        assert 'a' in a
+        a.deleteItem('a')
+        assert 'a' not in a
+
+
+    def test_merge(self):
+        a = CuckooFilter(capacity=1000, fpr=0.01)
+        b = a.reproduce()
+        a.processBatch(range(0, 500))
+        b.processBatch(range(500, 900))
+        c = a + b
+        assert c.estimate() == 900
+        assert c.containsMany(range(900)).all()
+        with pytest.raises(ValueError):
+            a + CuckooFilter(capacity=1000, fpr=0.01)
+
+
+    def test_full(self):
+        a = CuckooFilter(capacity=1000, fpr=0.01)
+        a.processBatch(range(5000))
+        assert a.estimate() == 5000 and len(a._stash) > 0
+        assert a.containsMany(range(5000)).all()
+        b = CuckooFilter.fromBytes(a.toBytes())
+        assert b.containsMany(range(5000)).all()
+        table = a._table.copy()
+        with pytest.raises(ValueError):
+            a.processBatch(range(5000, 6000))
+        with pytest.raises(ValueError):
+            a.processItem(5000)
+        assert (a._table == table).all() and a.estimate() == 5000
+        a.deleteBatch(range(4000))
+        assert a.estimate() == 1000 and len(a._stash) == 0
+        assert a.containsMany(range(4000, 5000)).all()
+        a.processItem(5000)
+        assert 5000 in a
+
+
+from streamlib import ScalableBloomFilter
+class Test_ScalableBloomFilter(object):
+
+    def test_contains(self):
+        a = ScalableBloomFilter(capacity=1000, fpr=0.01)
+        keys = np.random.randint(0, 1 << 62, 100000)
+        a.processBatch(keys)
+        assert len(a) == 7
+        assert abs(a.estimate() - 100000) < 1000
+        assert a.containsMany(keys).all()
+        others = np.random.randint(0, 1 << 62, 100000)
+        assert a.containsMany(others).mean() < 0.01
+        a.processItem('a')
+        assert 'a' in a
+
+
+    def test_repeated(self):
+        a = ScalableBloomFilter(capacity=1000, fpr=0.01)
+        b = a.reproduce()
+        a.processBatch([1] * 1000)
+        assert a.estimate() == 1 and len(a) == 1
+        a.processBatch(np.arange(1500) % 500)
+        assert a.estimate() == 500 and len(a) == 1
+        for key in [1] * 1000 + range(500) * 3:
+            b.processItem(key)
+        assert b.estimate() == a.estimate()
+
+
+    def test_merge(self):
+        a = ScalableBloomFilter(capacity=100)
+        b = a.reproduce()
+        a.processBatch(range(0, 1000))
+        b.processBatch(range(1000, 5000))
+        c = a + b
+        assert len(c) == len(b)
+        assert c.containsMany(range(5000)).all()
+        with pytest.raises(ValueError):
+            a + ScalableBloomFilter(capacity=100)
+
+
+    def test_bytes(self):
+        a = ScalableBloomFilter(capacity=1000, fpr=0.01)
+        a.processBatch(range(10000))
+        data = a.toBytes()
+        assert len(data) < sum(f._bits.nbytes for f in a._filters) + 512
+        b = ScalableBloomFilter.fromBytes(data)
+        assert b.estimate() == a.estimate() and len(b) == len(a)
+        assert b.containsMany(range(10000)).all()
+        b.processBatch(range(10000, 20000))
+        assert b.containsMany(range(20000)).all()
+        assert (b + a).containsMany(range(20000)).all()
+        with pytest.raises(ValueError):
+            BloomFilter.fromBytes(data)
+        with pytest.raises(ValueError):
+            ScalableBloomFilter.fromBytes(b'SLIM' + data[4:])
+
+    def test_open(self, tmpdir):
+        path = str(tmpdir.join('chain'))
+        a = ScalableBloomFilter(capacity=1000, fpr=0.01)
+        a.processBatch(range(5000))
+        a.save(path)
+        b = ScalableBloomFilter.open(path, 'c')
+        b.processBatch(range(5000, 6000))
+        assert b.containsMany(range(6000)).all()
+        assert 950 < b.estimate() - a.estimate() <= 1000
+        assert ScalableBloomFilter.open(path, 'r').estimate() == a.estimate()
+        with pytest.raises(NotImplementedError):
+            ScalableBloomFilter.open(path)
+
+
+
+from streamlib import SharedCountMin
+class Test_SharedCountMin(object):
+
+    def test_process(self):
+        a = SharedCountMin(w=1 << 10, mu=5, shards=3)
+        workers = [multiprocessing.Process(target=a.shard(i).processBatch,
+                                           args=([1, 1, 2] * 100,))
+                   for i in xrange(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        a.processItem(2)
+        assert a.estimate(1) == 600 and a.estimate(2) == 301
+        b = CountMin.fromBytes(a.toBytes())
+        assert b.estimate(1) == 600 and b.estimate(2) == 301
+
+
+    def test_merge(self):
+        a = SharedCountMin(w=1 << 10, mu=5)
+        b = a.reproduce()
+        a.shard(1).processBatch([1, 1, 1, 2])
+        b.processBatch([2, 3])
+        c = a + b
+        assert isinstance(c, CountMin)
+        assert c.estimate(1) == 3 and c.estimate(2) == 2
+        assert (a + a.snapshot()).estimate(1) == 6
+        with pytest.raises(ValueError):
+            a + SharedCountMin(w=1 << 10, mu=5)
+        with pytest.raises(TypeError):
+            pickle.dumps(a)
+
+
+    def test_overflow(self):
+        a = SharedCountMin(w=10, mu=3, typecode='b', shards=2)
+        a.shard(0).processBatch([1] * 100)
+        assert a.snapshot()._sketch.dtype == np.int8
+        assert CountMin.fromBytes(a.toBytes())._sketch.dtype == np.int8
+        a.shard(1).processBatch([1] * 100)
+        with pytest.raises(OverflowError):
+            a.snapshot()
+        with pytest.raises(OverflowError):
+            a + a.reproduce()
+
+
+
+from streamlib import SharedCountSketch
+class Test_SharedCountSketch(object):
+
+    def test_process(self):
+        a = SharedCountSketch(w=1 << 10, mu=5, shards=2)
+        a.shard(0).processBatch([1, 1, 2])
+        a.shard(1).processBatch([(1, 5), (2, -1)], weighted=True)
+        assert a.estimate(1) == 7 and a.estimate(2) == 0
+        assert a.snapshot().estimate(1) == 7
+
+
+
+from streamlib import SharedHyperLogLog
+class Test_SharedHyperLogLog(object):
+
+    def test_estimate(self):
+        a = SharedHyperLogLog(p=12, shards=4)
+        keys = np.arange(100000)
+        workers = [multiprocessing.Process(target=a.shard(i).processBatch,
+                                           args=(keys[i::4],))
+                   for i in xrange(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        b = HyperLogLog(p=12, sparse=False)
+        b._hashes = a._base._hashes
+        b.processBatch(keys)
+        assert a.estimate() == b.estimate()
+        assert abs(a.estimate() - 100000) < 0.1 * 100000